@@ -0,0 +1,245 @@
+import os
+import json
+import bisect
+
+import numpy
+
+class ArchiveClass:
+    def __init__(self, directory, dtype=None, chunk_size=65536):
+        """
+        Open (or create) an append-only columnar archive of fixed-dtype rows
+
+        Each column is stored in its own raw binary file per chunk of `chunk_size` rows
+        (`<chunk>.<column>` in the directory), the chunks are memory-mapped for reads so that
+        a range of rows can be read without loading the whole archive. The dtype and the chunk size
+        are saved in `archive.json`, so an existing archive can be reopened without them.
+
+        # Arguments
+
+        - directory (str): directory of the archive, created if needed
+        - dtype (numpy.dtype or None): structured dtype of a row, None to reopen an existing archive
+        - chunk_size (int): number of rows per chunk (ignored when reopening an existing archive)
+
+        # Returns
+
+        - ArchiveClass: the archive
+        """
+
+        self.directory = directory
+
+        metadata_path = os.path.join(directory, "archive.json")
+
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as file:
+                metadata = json.load(file)
+
+            archive_dtype = numpy.dtype([tuple(field) for field in metadata["dtype"]])
+
+            if dtype is not None and numpy.dtype(dtype) != archive_dtype:
+                raise ValueError(f"Archive {directory} has dtype {archive_dtype}, got {dtype}")
+
+            self.dtype = archive_dtype
+            self.chunk_size = metadata["chunk_size"]
+        else:
+            if dtype is None:
+                raise ValueError(f"No archive in {directory}")
+
+            self.dtype = numpy.dtype(dtype)
+            self.chunk_size = chunk_size
+
+            os.makedirs(directory, exist_ok=True)
+
+            with open(metadata_path, "w") as file:
+                json.dump({"dtype": self.dtype.descr, "chunk_size": self.chunk_size}, file)
+
+        if "time" not in self.dtype.names:
+            raise ValueError("The archive dtype must have a time column")
+
+        # - Existing chunks (the length of the last chunk is the one of its shortest column, in case of interrupted write)
+        self.length = 0
+        self.first_times = []   # Time of the first row of each chunk, for the binary search of a timestamp
+
+        chunk = 0
+
+        while os.path.exists(self.get_path(chunk, "time")):
+            rows = min(os.path.getsize(self.get_path(chunk, column)) // self.dtype[column].itemsize if os.path.exists(self.get_path(chunk, column)) else 0 for column in self.dtype.names)
+
+            # Drop the rows partially written
+            for column in self.dtype.names:
+                if os.path.exists(self.get_path(chunk, column)):
+                    os.truncate(self.get_path(chunk, column), rows * self.dtype[column].itemsize)
+
+            if rows == 0:
+                break
+
+            self.first_times.append(numpy.fromfile(self.get_path(chunk, "time"), dtype=self.dtype["time"], count=1)[0])
+            self.length += rows
+
+            if rows < self.chunk_size:
+                break
+
+            chunk += 1
+
+        self.maps = {}      # Memory maps of the complete chunks
+        self.files = None   # Files of the chunk being written
+
+    def __len__(self):
+        return self.length
+
+    def get_path(self, chunk, column):
+        return os.path.join(self.directory, f"{chunk:06d}.{column}")
+
+    def append(self, rows):
+        """
+        Append rows at the end of the archive
+
+        # Arguments
+
+        - rows (numpy.ndarray of shape (n,)): rows with the archive dtype, with increasing times
+        """
+
+        n = rows.shape[0]
+        offset = 0
+
+        while offset < n:
+            chunk, position = divmod(self.length, self.chunk_size)
+            count = min(n - offset, self.chunk_size - position)
+
+            if position == 0:
+                self.close()
+                self.first_times.append(rows["time"][offset])
+
+            if self.files is None:
+                self.files = {column: open(self.get_path(chunk, column), "ab") for column in self.dtype.names}
+
+            for column, file in self.files.items():
+                file.write(numpy.ascontiguousarray(rows[column][offset:offset + count]).tobytes())
+
+            self.length += count
+            offset += count
+
+    def flush(self):
+        if self.files is not None:
+            for file in self.files.values():
+                file.flush()
+
+    def close(self):
+        """
+        Close the files of the chunk being written (the archive can still be read and appended)
+        """
+
+        if self.files is not None:
+            for file in self.files.values():
+                file.close()
+
+            self.files = None
+
+    def get_chunk(self, chunk):
+        """
+        Get the memory-mapped columns of a chunk
+
+        # Arguments
+
+        - chunk (int): chunk index
+
+        # Returns
+
+        - dict: numpy.memmap by column
+        """
+
+        if chunk in self.maps:
+            return self.maps[chunk]
+
+        rows = min(self.length - chunk * self.chunk_size, self.chunk_size)
+
+        # The chunk being written is mapped again on each read since it grows
+        self.flush()
+
+        columns = {column: numpy.memmap(self.get_path(chunk, column), dtype=self.dtype[column], mode="r", shape=(rows,)) for column in self.dtype.names}
+
+        if rows == self.chunk_size:
+            self.maps[chunk] = columns
+
+        return columns
+
+    def get_rows(self, start, end, columns=None):
+        """
+        Read a range of rows
+
+        # Arguments
+
+        - start (int): index of the first row
+        - end (int): index after the last row
+        - columns (list or None): columns to read, None for all
+
+        # Returns
+
+        - numpy.ndarray: copy of the rows (only the requested columns)
+        """
+
+        start = max(0, start)
+        end = min(end, self.length)
+
+        if columns is None:
+            dtype = self.dtype
+        else:
+            dtype = numpy.dtype([(column, self.dtype[column]) for column in columns])
+
+        result = numpy.empty(max(0, end - start), dtype=dtype)
+
+        position = start
+
+        while position < end:
+            chunk, offset = divmod(position, self.chunk_size)
+            count = min(end - position, self.chunk_size - offset)
+
+            mapped = self.get_chunk(chunk)
+
+            for column in dtype.names:
+                result[column][position - start:position - start + count] = mapped[column][offset:offset + count]
+
+            position += count
+
+        return result
+
+    def get_index(self, timestamp):
+        """
+        Get the index of the first row at or after a timestamp (binary search on the chunks, then on the time column)
+
+        # Arguments
+
+        - timestamp (float): timestamp
+
+        # Returns
+
+        - int: row index
+        """
+
+        chunk = bisect.bisect_right(self.first_times, timestamp) - 1
+
+        if chunk < 0:
+            return 0
+
+        times = self.get_chunk(chunk)["time"]
+
+        return chunk * self.chunk_size + int(numpy.searchsorted(times, timestamp, side="left"))
+
+    def get_values(self, start=None, end=None, columns=None):
+        """
+        Read the rows of a time range
+
+        # Arguments
+
+        - start (float or None): first timestamp (included), None from the beginning
+        - end (float or None): last timestamp (excluded), None up to the end
+        - columns (list or None): columns to read, None for all
+
+        # Returns
+
+        - numpy.ndarray: copy of the rows
+        """
+
+        first = 0 if start is None else self.get_index(start)
+        last = self.length if end is None else self.get_index(end)
+
+        return self.get_rows(first, last, columns)
@@ -0,0 +1,458 @@
+# - Libraries
+
+# - - Asynchronous
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+# - - Processes
+import multiprocessing
+import queue
+# - - Threading
+import threading
+# - - MQTT
+import paho.mqtt.client as mqtt
+# - - Logging
+import logging
+import traceback
+
+import metrics
+
+from payloads import decode_payloads, merge_samples, tag_payload
+
+class AsyncMQTTClientClass:
+    def __init__(self, loop, host, port, topics, message_callback):
+        """
+        MQTT client driven by an asyncio event loop instead of its own network thread, so that one thread
+        can hold the connections to several brokers
+
+        The client reconnects (with an exponential backoff) when the connection is lost.
+
+        # Arguments
+
+        - loop (asyncio.AbstractEventLoop): event loop running the client
+        - host (str): broker host
+        - port (int): broker port
+        - topics (list of str): topic filters subscribed once connected
+        - message_callback (function): called with the raw payload of each message (see `payloads.tag_payload`), from the event loop
+
+        # Returns
+
+        - AsyncMQTTClientClass: the client (not connected)
+        """
+
+        self.loop = loop
+        self.host = host
+        self.port = port
+        self.topics = topics
+        self.message_callback = message_callback
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_message = self.on_message
+
+        self.misc = None
+        self.reconnection = None
+
+        self.connected = False
+        self.stopping = False
+
+        self.messages = 0
+
+    def __str__(self):
+        return f"{self.host}:{self.port}"
+
+    def connect(self):
+        """
+        Connect to the broker, retrying in the background if the broker can not be reached
+        """
+
+        try:
+            self.client.connect(self.host, self.port)
+        except OSError as e:
+            logging.warning(f"Failed to connect to the MQTT broker {self} : {e}")
+            self.reconnection = self.loop.create_task(self.reconnect())
+
+    def stop(self):
+        self.stopping = True
+
+        if self.reconnection is not None:
+            self.reconnection.cancel()
+
+        self.client.disconnect()
+
+    # - - Socket callbacks, the reads and writes of the client are scheduled on the event loop
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, self.read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+
+        if self.misc is not None:
+            self.misc.cancel()
+            self.misc = None
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    def read(self, max_packets=64):
+        # paho reads one packet per call, keep reading while messages are received to save event loop iterations
+        for _ in range(max_packets):
+            messages = self.messages
+
+            if self.client.loop_read() != mqtt.MQTT_ERR_SUCCESS or self.messages == messages:
+                break
+
+    async def misc_loop(self):
+        # Keep alive and timeouts
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    # - - MQTT callbacks
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code != 0:
+            logging.error(f"Failed to connect to the MQTT broker {self} : {reason_code}")
+            return
+
+        self.connected = True
+
+        client.subscribe([(topic, 0) for topic in self.topics])
+        logging.info(f"Connected to the MQTT broker {self}, subscribed to {self.topics}")
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self.connected = False
+
+        if not self.stopping:
+            logging.warning(f"Disconnected from the MQTT broker {self} : {reason_code}")
+            self.reconnection = self.loop.create_task(self.reconnect())
+
+    def on_message(self, client, userdata, message):
+        self.messages += 1
+        self.message_callback(tag_payload(message.payload, message.topic))
+
+    async def reconnect(self):
+        delay = 1
+
+        while not self.stopping:
+            await asyncio.sleep(delay)
+
+            try:
+                self.client.reconnect()
+                return
+            except OSError as e:
+                logging.warning(f"Failed to reconnect to the MQTT broker {self} : {e}")
+                delay = min(2 * delay, 60)
+
+def run_ingestion_process(brokers, shared_group, samples_queue, stop_event, queue_size, batch_size):
+    """
+    Ingestion process of a shared subscription: it receives a share of the messages and forwards the decoded samples
+
+    # Arguments
+
+    - brokers (list of dict): brokers ({"host": str, "port": int, "topics": list of str})
+    - shared_group (str): shared subscription group
+    - samples_queue (multiprocessing.Queue): queue receiving the decoded samples of each batch
+    - stop_event (multiprocessing.Event): set to stop the process
+    - queue_size (int): maximum number of payloads waiting to be decoded
+    - batch_size (int): maximum number of payloads decoded at once
+    """
+
+    ingestion = AsyncIngestionClass(samples_queue.put, brokers, queue_size, batch_size, shared_group)
+    ingestion.start()
+
+    stop_event.wait()
+
+    ingestion.stop()
+
+class AsyncIngestionClass:
+    def __init__(self, update_sensors_callback, brokers, queue_size=4096, batch_size=512, shared_group=None, processes=1, payload_callback=None):
+        """
+        Asynchronous ingestion: one event loop holds the connections to several brokers and topic filters, the received
+        payloads go through a bounded asyncio queue (dropped when the queue is full) and are decoded in batches
+
+        The update callback runs in a dedicated thread, so the event loop keeps receiving while a batch updates
+        the sensors. With several processes, each process subscribes with the MQTT shared subscription
+        `$share/<shared_group>/<topic>` (the broker delivers each message to one of them), decodes its share of the
+        messages and forwards the samples to the queue of this process. The messages of a sensor may then be
+        received out of order by different processes: the samples of a batch are sorted by timestamp, and the
+        processing reorders the samples arriving after a newer batch within its lateness (see `reordering.py`).
+
+        # Arguments
+
+        - update_sensors_callback (function): called with the decoded samples of a batch (see `decode_payloads`)
+        - brokers (list of dict): brokers ({"host": str, "port": int, "topics": list of str})
+        - queue_size (int): maximum number of payloads (or forwarded batches) waiting in the queue
+        - batch_size (int): maximum number of payloads processed at once
+        - shared_group (str or None): group of the shared subscriptions, None to subscribe to the topics directly
+        - processes (int): number of receiving processes (a shared group is required for more than one)
+        - payload_callback (function or None): called with each raw payload (e.g. `RecorderClass.put`), in the event loop,
+          only with one process (the other processes forward the decoded samples, not the payloads)
+
+        # Returns
+
+        - AsyncIngestionClass: the ingestion (not started)
+        """
+
+        if processes < 1:
+            raise ValueError(f"Number of processes must be positive, got {processes}")
+
+        if processes > 1 and shared_group is None:
+            raise ValueError("Several ingestion processes need a shared subscription group")
+
+        if processes > 1 and payload_callback is not None:
+            raise ValueError("The raw payloads are only available with one ingestion process")
+
+        self.update_sensors_callback = update_sensors_callback
+        self.brokers = brokers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.shared_group = shared_group
+        self.processes = processes
+        self.payload_callback = payload_callback
+
+        self.loop = None
+        self.queue = None
+        self.stopped = None
+        self.clients = []
+
+        self.thread = None
+
+        # - Metrics
+        self.received = 0
+        self.dropped = 0
+        self.decode_errors = 0
+        self.batches = 0
+        self.processed = 0
+        self.maximum_batch_size = 0
+        self.maximum_depth = 0
+
+        self.decode_latency = metrics.REGISTRY.histogram("gaz_stage_latency_seconds", "Latency of the processing stages", stage="decode")
+
+    def get_topics(self, broker):
+        if self.shared_group is None:
+            return list(broker["topics"])
+
+        return [f"$share/{self.shared_group}/{topic}" for topic in broker["topics"]]
+
+    def start(self):
+        """
+        Start the event loop thread, returns once the connections are initiated
+        """
+
+        started = threading.Event()
+
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.run(started)), name="Async ingestion", daemon=True)
+        self.thread.start()
+
+        started.wait()
+
+    def stop(self):
+        """
+        Disconnect from the brokers and stop the event loop thread, the payloads still in the queue are processed before
+        """
+
+        if self.thread is None:
+            return
+
+        self.loop.call_soon_threadsafe(self.stopped.set)
+
+        self.thread.join()
+        self.thread = None
+
+    def put(self, item):
+        """
+        Enqueue a raw payload (or the forwarded samples of a batch), called from the event loop
+
+        # Arguments
+
+        - item (bytes or dict): raw payload or decoded samples
+
+        # Returns
+
+        - bool: True if the item was enqueued, False if it was dropped because the queue is full
+        """
+
+        self.received += 1
+
+        if self.payload_callback is not None:
+            self.payload_callback(item)
+
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+        return True
+
+    async def run(self, started):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.stopped = asyncio.Event()
+
+        # The sensors are updated in one thread, in the order of the batches
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Sensors update")
+
+        processes = []
+        relay = None
+
+        if self.processes == 1:
+            for broker in self.brokers:
+                client = AsyncMQTTClientClass(self.loop, broker["host"], broker["port"], self.get_topics(broker), self.put)
+                client.connect()
+
+                self.clients.append(client)
+        else:
+            samples_queue = multiprocessing.Queue(maxsize=max(1, self.queue_size // self.batch_size))
+            stop_event = multiprocessing.Event()
+
+            for i in range(self.processes):
+                process = multiprocessing.Process(target=run_ingestion_process, name=f"Ingestion {i}", daemon=True,
+                    args=(self.brokers, self.shared_group, samples_queue, stop_event, self.queue_size, self.batch_size))
+                process.start()
+
+                processes.append(process)
+
+            relay = self.loop.create_task(self.relay(samples_queue))
+
+        consumer = self.loop.create_task(self.consume(executor))
+
+        started.set()
+
+        await self.stopped.wait()
+
+        for client in self.clients:
+            client.stop()
+
+        if processes:
+            stop_event.set()
+
+            for process in processes:
+                await self.loop.run_in_executor(None, process.join)
+
+            relay.cancel()
+
+        # Let the consumer process the remaining payloads
+        await self.queue.put(None)
+        await consumer
+
+        executor.shutdown()
+
+    async def relay(self, samples_queue):
+        """
+        Forward the samples decoded by the ingestion processes to the queue
+        """
+
+        def get():
+            try:
+                return samples_queue.get(timeout=0.1)
+            except queue.Empty:
+                return None
+
+        while True:
+            samples = await self.loop.run_in_executor(None, get)
+
+            if samples is not None:
+                # Wait for room in the queue, the ingestion processes drop the payloads they can not forward
+                await self.queue.put(samples)
+                self.received += 1
+
+    async def consume(self, executor):
+        while True:
+            item = await self.queue.get()
+
+            if item is None:
+                return
+
+            self.maximum_depth = max(self.maximum_depth, self.queue.qsize() + 1)
+
+            # Drain the queue up to the batch size
+            batch = [item]
+            stopping = False
+
+            while len(batch) < self.batch_size and not self.queue.empty():
+                item = self.queue.get_nowait()
+
+                if item is None:
+                    stopping = True
+                    break
+
+                batch.append(item)
+
+            samples = self.decode(batch)
+
+            await self.loop.run_in_executor(executor, self.update, samples, len(batch))
+
+            if stopping:
+                return
+
+    def decode(self, batch):
+        """
+        Decode a batch of raw payloads and merge it with the forwarded samples
+
+        # Arguments
+
+        - batch (list of bytes or dict): raw payloads and decoded samples
+
+        # Returns
+
+        - dict: samples per (sensor identifier, gaz sensor type)
+        """
+
+        payloads = [item for item in batch if isinstance(item, bytes)]
+        decoded = [item for item in batch if isinstance(item, dict)]
+
+        if payloads:
+            with self.decode_latency.time():
+                samples, errors = decode_payloads(payloads)
+
+            self.decode_errors += errors
+            decoded.append(samples)
+
+        return merge_samples(decoded)
+
+    def update(self, samples, size):
+        self.batches += 1
+        self.processed += size
+        self.maximum_batch_size = max(self.maximum_batch_size, size)
+
+        try:
+            self.update_sensors_callback(samples)
+        except Exception as e:
+            logging.error(f"An error occured while processing a batch of {size} payloads : {e}")
+            traceback.print_exc()
+
+    def get_metrics(self):
+        """
+        Get the backpressure metrics of the ingestion
+
+        # Returns
+
+        - dict: queue depth and capacity, received/dropped/processed items, decode errors, batch sizes and connected brokers
+        """
+
+        return {
+            "depth": self.queue.qsize() if self.queue is not None else 0,
+            "maximum_depth": self.maximum_depth,
+            "capacity": self.queue_size,
+            "received": self.received,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "decode_errors": self.decode_errors,
+            "batches": self.batches,
+            "mean_batch_size": self.processed / self.batches if self.batches > 0 else 0,
+            "maximum_batch_size": self.maximum_batch_size,
+            "connected": sum(client.connected for client in self.clients),
+            "processes": self.processes,
+        }
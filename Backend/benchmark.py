@@ -0,0 +1,1086 @@
+# - Libraries
+
+# - - Time
+import time
+# - - Mathematical
+import numpy
+# - - Serialization
+import json
+# - - Command line
+import argparse
+import subprocess
+import sys
+import os
+
+from sensor import GazSensorClass, SensorClass, SAMPLE_DTYPE, SlidingShiftClass, get_shift, get_shift_matrix, get_shifts, get_sliding_shift
+
+from configuration import SensorConfigurationClass
+
+from ingestion import IngestionClass
+
+from payloads import decode_payloads, encode_binary_payload, MSGPACK_MAGIC
+
+import localization
+
+from buffer import RingBufferClass
+
+# - Helpers
+
+def get_gaz_sensor_configuration():
+    """
+    Get a gas sensor configuration matching the MQ3 sensors of `configuration.json`
+
+    # Returns
+
+    - dict: gas sensor configuration
+    """
+
+    return {
+        "R_2": 15000,
+        "V_in": 1.51515,
+        "a": -0.372222,
+        "b": 0.152611111,
+        "R_0": 49320.79
+    }
+
+def get_synthetic_signal(samples, period=100, seed=0):
+    """
+    Get a synthetic sensor signal (noisy voltage with a gas puff in the middle)
+
+    # Arguments
+
+    - samples (int): number of samples
+    - period (float): time between two samples in milliseconds
+    - seed (int): random seed
+
+    # Returns
+
+    - (numpy.ndarray of shape (samples,), numpy.ndarray of shape (samples,)): values (V) and timestamps (ms)
+    """
+
+    generator = numpy.random.default_rng(seed)
+
+    timestamps = numpy.arange(samples) * period
+    values = 0.3 + 0.01 * generator.standard_normal(samples)
+    values += 0.5 * numpy.exp(-((numpy.arange(samples) - samples / 2) / (samples / 20)) ** 2)
+
+    return values, timestamps
+
+def get_sensors(count, maximum_values=10000):
+    """
+    Get sensor boards with MQ3 gas sensors laid out on a grid
+
+    # Arguments
+
+    - count (int): number of sensor boards
+    - maximum_values (int): maximum number of values kept in memory by each gas sensor
+
+    # Returns
+
+    - dict: sensors by identifier
+    """
+
+    side = int(numpy.ceil(numpy.sqrt(count)))
+
+    return {f"Sensor_{i + 1}": SensorClass(SensorConfigurationClass({
+        "x": float(i % side),
+        "y": float(i // side),
+        "sensors": {"MQ3": get_gaz_sensor_configuration()},
+        "maximum_values": maximum_values
+    })) for i in range(count)}
+
+def get_payloads(count, samples, period=100, format="json"):
+    """
+    Get the payloads published by sensor boards, interleaved in publication order
+
+    # Arguments
+
+    - count (int): number of sensor boards
+    - samples (int): number of samples per sensor board
+    - period (float): time between two samples in milliseconds
+    - format (str): payload format, "json", "binary" or "msgpack" (see `payloads`)
+
+    # Returns
+
+    - list of bytes: payloads
+    """
+
+    values, timestamps = get_synthetic_signal(samples, period)
+
+    if format == "binary":
+        return [encode_binary_payload(f"Sensor_{i + 1}", [("MQ3", float(values[j]), int(timestamps[j]) + 1700000000000)]) for j in range(samples) for i in range(count)]
+
+    if format == "msgpack":
+        import msgpack
+
+        dumps = lambda document: bytes([MSGPACK_MAGIC]) + msgpack.packb(document)
+    else:
+        dumps = lambda document: json.dumps(document).encode()
+
+    return [dumps({
+        "sensor": f"Sensor_{i + 1}",
+        "data": {"MQ3": {"value": float(values[j]), "timestamp": int(timestamps[j]) + 1700000000000}}
+    }) for j in range(samples) for i in range(count)]
+
+def get_synthetic_layout(count, generator, size=20, noise=0.01):
+    """
+    Get a synthetic localization problem following the TDOA model
+
+    # Arguments
+
+    - count (int): number of sensors
+    - generator (numpy.random.Generator): random generator
+    - size (float): side of the square area in meters
+    - noise (float): standard deviation of the noise added to the arrival terms
+
+    # Returns
+
+    - (numpy.ndarray of shape (count, 2), numpy.ndarray of shape (count,), numpy.ndarray of shape (2,)): sensors positions, shifts and source position
+    """
+
+    positions = generator.uniform(0, size, (count, 2))
+    source = generator.uniform(size * 0.2, size * 0.8, 2)
+    k = generator.uniform(0.5, 2)
+
+    distances = numpy.linalg.norm(positions - source, axis=1)
+
+    arrival_times = (distances - distances[0]) / k + noise * generator.standard_normal(count)
+    arrival_times[0] = 0
+
+    # Invert the signed square root of the model
+    shifts = numpy.sign(arrival_times) * arrival_times**2
+
+    return positions, shifts, source
+
+def print_latencies(name, latencies, buckets=10, unit="sample"):
+    """
+    Print the mean latency of each bucket of consecutive operations
+
+    # Arguments
+
+    - name (str): benchmark name
+    - latencies (numpy.ndarray of shape (n,)): latency of each operation in seconds
+    - buckets (int): number of buckets
+    - unit (str): name of an operation
+    """
+
+    print(f"{name} : {latencies.shape[0]} {unit}s, total {latencies.sum():.3f} s")
+
+    for i, bucket in enumerate(numpy.array_split(latencies, buckets)):
+        print(f" - {unit}s {i * 100 // buckets:3d}-{(i + 1) * 100 // buckets:3d}% : {bucket.mean() * 1e6:10.1f} µs/{unit}")
+
+# - Benchmarks
+
+def benchmark_filtering(arguments):
+    """
+    Per-sample latency of `GazSensorClass.update` along the history for each filtering mode
+    """
+
+    values, timestamps = get_synthetic_signal(arguments.samples)
+
+    for filtering_mode, refinement_window in [("streaming", None), ("streaming", 256), ("full", None)]:
+        if filtering_mode == "full" and not arguments.full:
+            continue
+
+        sensor = GazSensorClass(get_gaz_sensor_configuration(), arguments.samples, filtering_mode, refinement_window)
+
+        latencies = numpy.zeros(arguments.samples)
+
+        for i in range(arguments.samples):
+            start = time.perf_counter()
+            sensor.update(values[i], timestamps[i])
+            latencies[i] = time.perf_counter() - start
+
+        print_latencies(f"Filtering {filtering_mode} (refinement window {refinement_window})", latencies)
+
+def benchmark_conversion(arguments):
+    """
+    Ingestion rate of `GazSensorClass.update_many` by block size (vectorized conversion, masking and filtering)
+    """
+
+    values, timestamps = get_synthetic_signal(arguments.samples)
+
+    # Invalid samples, masked instead of raising
+    values[::1000] = numpy.nan
+    values[1::1000] = 0
+
+    for block in [1, 10, 100, 1000, 10000, 100000]:
+        if block > arguments.samples:
+            break
+
+        sensor = GazSensorClass(get_gaz_sensor_configuration(), 10000, "streaming", 256)
+
+        start = time.perf_counter()
+        for i in range(0, arguments.samples, block):
+            sensor.update_many(values[i:i + block], timestamps[i:i + block])
+        duration = time.perf_counter() - start
+
+        print(f"Blocks of {block:6d} samples : {arguments.samples / duration:12.0f} samples/s ({sensor.rejected} rejected)")
+
+def benchmark_buffer(arguments):
+    """
+    Append throughput of the ring buffer against the previous `DataFrame.iloc` storage
+    """
+
+    import pandas
+
+    samples = arguments.samples
+    row = (0, 0.3, 0, 0, 35000, 1.2, 0, 0)
+
+    # - DataFrame written row by row with iloc (previous storage)
+    data = pandas.DataFrame(numpy.zeros((samples, len(SAMPLE_DTYPE.names))), columns=SAMPLE_DTYPE.names)
+
+    start = time.perf_counter()
+    for i in range(samples):
+        data.iloc[i] = row
+    dataframe_duration = time.perf_counter() - start
+
+    # - Ring buffer, filled several times to include the compactions and the dropped rows
+    buffer = RingBufferClass(SAMPLE_DTYPE, samples)
+
+    start = time.perf_counter()
+    for i in range(4 * samples):
+        buffer.append(row)
+    buffer_duration = (time.perf_counter() - start) / 4
+
+    print(f"DataFrame.iloc : {samples / dataframe_duration:12.0f} appends/s")
+    print(f"RingBufferClass : {samples / buffer_duration:12.0f} appends/s ({dataframe_duration / buffer_duration:.0f}x)")
+
+def benchmark_ingestion(arguments):
+    """
+    Throughput and backpressure metrics of the ingestion pipeline fed as fast as possible by many sensor boards
+    """
+
+    sensors = get_sensors(arguments.boards)
+    payloads = get_payloads(arguments.boards, arguments.samples // arguments.boards)
+
+    def update_sensors(samples):
+        for (sensor_identifier, gaz_sensor_type), (values, timestamps) in samples.items():
+            sensors[sensor_identifier].update_many(gaz_sensor_type, values, timestamps - 1700000000000)
+
+    ingestion = IngestionClass(update_sensors, arguments.queue_size, arguments.batch_size)
+    ingestion.start()
+
+    start = time.perf_counter()
+    for payload in payloads:
+        ingestion.put(payload)
+    ingestion.stop()
+    duration = time.perf_counter() - start
+
+    metrics = ingestion.get_metrics()
+
+    print(f"Ingestion : {arguments.boards} boards, {len(payloads)} payloads in {duration:.3f} s ({metrics['processed'] / duration:.0f} payloads/s processed)")
+
+    for name, value in metrics.items():
+        print(f" - {name} : {value}")
+
+def benchmark_decoding(arguments):
+    """
+    Decoding throughput of each payload format on recorded payloads (synthetic payloads recorded with `RecorderClass`)
+    """
+
+    import tempfile
+    import importlib.util
+    from replay import RecorderClass, read_log
+
+    formats = ["json", "binary"]
+
+    if importlib.util.find_spec("msgpack") is not None:
+        formats.append("msgpack")
+
+    reference = None
+
+    for format in formats + ["mixed"]:
+        if format == "mixed":
+            # Every other sensor board publishes binary payloads
+            payloads = [payload if i % 2 == 0 else binary for i, (payload, binary) in enumerate(zip(get_payloads(arguments.boards, arguments.samples // arguments.boards), get_payloads(arguments.boards, arguments.samples // arguments.boards, format="binary")))]
+        else:
+            payloads = get_payloads(arguments.boards, arguments.samples // arguments.boards, format=format)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "session.log")
+
+            recorder = RecorderClass(path)
+
+            for payload in payloads:
+                recorder.put(payload, 0)
+
+            recorder.stop()
+
+            recorded = [payload for _, payload in read_log(path)]
+
+        batches = [recorded[i:i + arguments.batch_size] for i in range(0, len(recorded), arguments.batch_size)]
+
+        durations = []
+        for _ in range(arguments.repeat):
+            start = time.perf_counter()
+            decoded = [decode_payloads(batch) for batch in batches]
+            durations.append(time.perf_counter() - start)
+
+        duration = min(durations)
+
+        samples = sum(values.shape[0] for batch, _ in decoded for values, _ in batch.values())
+        errors = sum(errors for _, errors in decoded)
+
+        # The values are sent as float32 in the binary format
+        values = numpy.concatenate([batch[("Sensor_1", "MQ3")][0] for batch, _ in decoded])
+
+        if reference is None:
+            reference = values
+
+        print(f"{format:>8} : {len(recorded) / duration:9.0f} payloads/s, {1e6 * duration / len(recorded):6.2f} µs/payload, {sum(map(len, recorded)) / len(recorded):5.1f} bytes/payload, {samples} samples, {errors} errors, maximum difference {numpy.max(numpy.abs(values - reference)):.1e}")
+
+def benchmark_async_ingestion(arguments):
+    """
+    Throughput of the MQTT ingestion from loopback brokers: the paho network thread against the asynchronous
+    ingestion with one or several brokers and with shared subscriptions across processes
+    """
+
+    import socket
+    import threading
+    from loopback_broker import LoopbackBrokerClass, encode_connect, encode_publish
+    from async_ingestion import AsyncIngestionClass
+    from mqtt import MQTTClientClass
+    from configuration import MQTTConfigurationClass
+
+    payloads = get_payloads(arguments.boards, arguments.samples // arguments.boards)
+
+    def publish(broker, payloads):
+        with socket.create_connection(("127.0.0.1", broker.port)) as connection:
+            connection.sendall(encode_connect(f"Publisher_{broker.port}"))
+            connection.recv(4)
+            connection.sendall(b"".join(encode_publish("sensors", payload) for payload in payloads))
+
+    def run(brokers_count, mode, processes=1):
+        brokers = [LoopbackBrokerClass() for _ in range(brokers_count)]
+
+        for broker in brokers:
+            broker.start()
+
+        processed = [0]
+        done = threading.Event()
+
+        def update_sensors(samples):
+            processed[0] += sum(values.shape[0] for values, _ in samples.values())
+
+            if processed[0] >= len(payloads):
+                done.set()
+
+        if mode == "paho":
+            ingestion = IngestionClass(update_sensors, arguments.queue_size, arguments.batch_size)
+            ingestion.start()
+
+            client = MQTTClientClass(MQTTConfigurationClass({"host": "127.0.0.1", "port": brokers[0].port, "topic": "sensors"}), ingestion.put)
+        else:
+            ingestion = AsyncIngestionClass(update_sensors, [{"host": "127.0.0.1", "port": broker.port, "topics": ["sensors"]} for broker in brokers],
+                arguments.queue_size, arguments.batch_size, "benchmark" if processes > 1 else None, processes)
+            ingestion.start()
+
+        # Wait for the subscriptions
+        time.sleep(1 + processes)
+
+        # Each broker receives the payloads of a share of the sites
+        start = time.perf_counter()
+        publishers = [threading.Thread(target=publish, args=(broker, payloads[i::brokers_count])) for i, broker in enumerate(brokers)]
+
+        for publisher in publishers:
+            publisher.start()
+
+        done.wait(timeout=60)
+        duration = time.perf_counter() - start
+
+        for publisher in publishers:
+            publisher.join()
+
+        if mode == "paho":
+            client.stop()
+
+        ingestion.stop()
+
+        for broker in brokers:
+            broker.stop()
+
+        name = f"{mode}, {brokers_count} broker{'s' if brokers_count > 1 else ''}, {processes} process{'es' if processes > 1 else ''}"
+        print(f"{name:36s} : {processed[0]:7d}/{len(payloads)} payloads, {processed[0] / duration:9.0f} payloads/s, dropped {ingestion.get_metrics()['dropped']}")
+
+    run(1, "paho")
+    run(1, "async")
+    run(2, "async")
+    run(1, "async", 2)
+
+def benchmark_trilateration(arguments):
+    """
+    Solve time and accuracy of the least squares TDOA solver against the previous Nelder-Mead solver
+    """
+
+    solvers = {
+        "least_squares": localization.solve_tdoa,
+        "nelder_mead": localization.solve_tdoa_nelder_mead,
+    }
+
+    for count in [4, 8, 16, 32, 64]:
+        generator = numpy.random.default_rng(count)
+        problems = [get_synthetic_layout(count, generator) for _ in range(arguments.problems)]
+
+        for name, solver in solvers.items():
+            durations = numpy.zeros(len(problems))
+            errors = numpy.zeros(len(problems))
+
+            for i, (positions, shifts, source) in enumerate(problems):
+                start = time.perf_counter()
+                result = solver(positions, shifts)
+                durations[i] = time.perf_counter() - start
+
+                errors[i] = numpy.linalg.norm(result.position - source)
+
+            print(f"{count:3d} sensors, {name:14s} : median {numpy.median(durations) * 1000:7.2f} ms, "
+                f"maximum {durations.max() * 1000:7.2f} ms, median error {numpy.median(errors):6.3f} m, "
+                f"errors > 1 m {numpy.mean(errors > 1) * 100:5.1f}%")
+
+def get_simulated_environments(count, sensors_coordinates, arrival_threshold=1e-6):
+    """
+    Simulate the environments of the simulation notebook (sources on a grid of the 20 m area, diffusion coefficients from 0.1 to 1)
+
+    # Arguments
+
+    - count (int): number of environments, evenly picked among the notebook ones
+    - sensors_coordinates (numpy.ndarray of shape (n, 2)): sensors positions
+    - arrival_threshold (float): concentration defining the arrival time of the gas at a sensor
+
+    # Returns
+
+    - list of (numpy.ndarray of shape (2,), numpy.ndarray of shape (n,), numpy.ndarray of shape (n,)): source position,
+      arrival times relative to the first sensor (NaN if the gas never reaches a sensor) and concentrations at the end of the release
+    """
+
+    import itertools
+    from simulation import FickDiffusionClass
+
+    parameters = [(numpy.array(source), D) for source in itertools.combinations_with_replacement(numpy.linspace(3, 17, 8), 2) for D in numpy.linspace(0.1, 1, 5)]
+
+    environments = []
+
+    for index in numpy.linspace(0, len(parameters) - 1, count).astype(int):
+        source, D = parameters[index]
+
+        times, values = FickDiffusionClass(source_position=source, D=D).simulate(400, sensors_coordinates, source_end=350)
+
+        reached = values > arrival_threshold
+        arrival_times = numpy.where(reached.any(axis=1), times[reached.argmax(axis=1)], numpy.nan)
+
+        environments.append((source, arrival_times - arrival_times[0], values[:, numpy.searchsorted(times, 350)]))
+
+    return environments
+
+def benchmark_localization(arguments):
+    """
+    Accuracy, solve time and failure rate of every localization strategy on the environments of the simulation notebook
+    """
+
+    layouts = {
+        "notebook": numpy.array([[2.0, 2.0], [2.0, 18.0], [17.0, 2.0], [15.0, 15.0]]),
+        "grid 3x3": numpy.array([[x, y] for x in (2.0, 10.0, 18.0) for y in (2.0, 10.0, 18.0)]),
+    }
+
+    for layout, sensors_coordinates in layouts.items():
+        environments = get_simulated_environments(arguments.environments, sensors_coordinates)
+
+        print(f"{layout} layout ({sensors_coordinates.shape[0]} sensors), {len(environments)} environments")
+
+        candidates = []
+
+        for name, (function, data) in localization.STRATEGIES.items():
+            errors = []
+            durations = []
+            failures = 0
+
+            region = localization.get_search_region(sensors_coordinates)
+
+            for source, shifts, values in environments:
+                # The sensors never reached by the gas have no arrival time
+                if data == "shifts" and numpy.isnan(shifts).any():
+                    failures += 1
+                    continue
+
+                start = time.perf_counter()
+
+                try:
+                    result = localization.locate(name, sensors_coordinates, shifts, values)
+                except (ValueError, numpy.linalg.LinAlgError, RuntimeError):
+                    failures += 1
+                    continue
+                finally:
+                    durations.append(time.perf_counter() - start)
+
+                # The estimates outside the search region are diverging solves
+                if not result.success or not localization.is_inside(result.position, region):
+                    failures += 1
+                    continue
+
+                errors.append(numpy.linalg.norm(result.position - source))
+
+            errors = numpy.array(errors)
+            median_error = numpy.median(errors) if errors.shape[0] > 0 else numpy.nan
+
+            print(f" - {name:16s} : median error {median_error:6.2f} m, p90 error {numpy.percentile(errors, 90) if errors.shape[0] > 0 else numpy.nan:6.2f} m, "
+                f"median {numpy.median(durations) * 1000 if durations else numpy.nan:8.3f} ms, failures {failures / len(environments) * 100:5.1f}%")
+
+            if median_error <= arguments.accuracy and failures / len(environments) <= 0.1:
+                candidates.append((numpy.median(durations), name))
+
+        if candidates:
+            print(f"Fastest strategy with a median error below {arguments.accuracy} m : {min(candidates)[1]}")
+        else:
+            print(f"No strategy with a median error below {arguments.accuracy} m")
+
+def benchmark_solver(arguments):
+    """
+    Solve time, accuracy and cache hit rate of the localization solver modes on a stream of repeated problems
+    """
+
+    count = 8
+    generator = numpy.random.default_rng(0)
+    problems = [get_synthetic_layout(count, generator) for _ in range(arguments.problems)]
+
+    # Every problem is submitted several times in a row, as in the main loop while the shifts do not change
+    stream = [problem for problem in problems for _ in range(5)]
+
+    modes = {
+        "cold": None,
+        "cache + warm start": localization.LocalizationSolverClass(quantization=1e-6),
+        "cache + multi-start": localization.LocalizationSolverClass(quantization=1e-6, multi_start=True),
+    }
+
+    for name, solver in modes.items():
+        errors = numpy.zeros(len(stream))
+
+        start = time.perf_counter()
+        for i, (positions, shifts, source) in enumerate(stream):
+            if solver is None:
+                result = localization.solve_tdoa(positions, shifts)
+            else:
+                result = solver.solve(positions, shifts)
+
+            errors[i] = numpy.linalg.norm(result.position - source)
+        duration = time.perf_counter() - start
+
+        print(f"{name:20s} : {duration / len(stream) * 1000:6.2f} ms/problem, median error {numpy.median(errors):6.3f} m, errors > 1 m {numpy.mean(errors > 1) * 100:5.1f}%")
+
+        if solver is not None:
+            print(f" - {solver.get_counters()}")
+
+    # Multi-start seeds solved one after the other against the vectorized search
+    seeds_solver = localization.LocalizationSolverClass(multi_start=True)
+
+    def sequential(positions, shifts, seeds):
+        return min((localization.solve_tdoa(positions, shifts, seed) for seed in seeds), key=lambda result: (not result.success, result.cost))
+
+    def vectorized(positions, shifts, seeds):
+        parameters, costs, on_border = localization.search_tdoa(positions, shifts, numpy.array(seeds))
+
+        return localization.solve_tdoa(positions, shifts, parameters[numpy.lexsort((costs, on_border))[0]])
+
+    for name, function in [("multi-start sequential", sequential), ("multi-start vectorized", vectorized)]:
+        errors = numpy.zeros(len(problems))
+
+        start = time.perf_counter()
+        for i, (positions, shifts, source) in enumerate(problems):
+            errors[i] = numpy.linalg.norm(function(positions, shifts, seeds_solver.get_seeds(positions)).position - source)
+        duration = time.perf_counter() - start
+
+        print(f"{name:22s} : {duration / len(problems) * 1000:6.2f} ms/problem, median error {numpy.median(errors):6.3f} m, errors > 1 m {numpy.mean(errors > 1) * 100:5.1f}%")
+
+def benchmark_shifts(arguments):
+    """
+    Time of the all-pairs shifts estimation with a single batched FFT against a loop of `get_shift` over the pairs
+    """
+
+    values, timestamps = get_synthetic_signal(arguments.samples)
+
+    for count in [4, 8, 16, 32, 64]:
+        generator = numpy.random.default_rng(count)
+        delays = generator.uniform(-5000, 5000, count)
+
+        data = {f"Sensor_{i}": {"time": timestamps + generator.uniform(0, 50), "value": numpy.interp(timestamps - delay, timestamps, values)} for i, delay in enumerate(delays)}
+        names = list(data)
+
+        start = time.perf_counter()
+        for first in names:
+            for second in names:
+                if first < second:
+                    get_shift(data[first]["value"], data[first]["time"], data[second]["value"], data[second]["time"])
+        loop_duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, shifts = get_shift_matrix(data)
+        matrix_duration = time.perf_counter() - start
+
+        error = numpy.abs(shifts[0] - (delays - delays[0])).max()
+
+        print(f"{count:3d} sensors : get_shift loop {loop_duration * 1000:8.2f} ms, get_shift_matrix {matrix_duration * 1000:7.2f} ms ({loop_duration / matrix_duration:5.1f}x), maximum error {error:.1f} ms")
+
+def benchmark_sliding_shift(arguments):
+    """
+    Time of the sliding shift against the previous loop of `get_shift` over every window, and of its incremental update
+    """
+
+    window_size = 50
+
+    values, timestamps = get_synthetic_signal(arguments.samples)
+    delayed = numpy.interp(timestamps - 400, timestamps, values)
+
+    # - Previous implementation, one `get_shift` per window
+    start = time.perf_counter()
+    for i in range(arguments.samples - window_size + 1):
+        get_shift(values[i:i + window_size], timestamps[i:i + window_size], delayed[i:i + window_size], timestamps[i:i + window_size])
+    loop_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    get_sliding_shift(values, timestamps, delayed, timestamps, window_size=window_size)
+    batch_duration = time.perf_counter() - start
+
+    print(f"{arguments.samples} samples, window {window_size} : get_shift loop {loop_duration * 1000:.1f} ms, get_sliding_shift {batch_duration * 1000:.1f} ms ({loop_duration / batch_duration:.0f}x)")
+
+    # - Incremental update, one chunk of new samples at a time
+    sliding_shift = SlidingShiftClass(window_size)
+    chunk = 10
+
+    latencies = []
+    for end in range(window_size, arguments.samples + 1, chunk):
+        start = time.perf_counter()
+        sliding_shift.update(values[:end], timestamps[:end], delayed[:end], timestamps[:end])
+        latencies.append(time.perf_counter() - start)
+
+    print_latencies(f"Incremental update every {chunk} samples", numpy.array(latencies), unit="update")
+
+def benchmark_excitement(arguments):
+    """
+    Latency of an excitement detection loop depending on the history length of the sensors
+    """
+
+    from excitement import ExcitementClass
+
+    chunk = 10
+
+    for history in [1000, 10000, 100000]:
+        sensors = get_sensors(arguments.boards, history)
+        values, timestamps = get_synthetic_signal(history + chunk * 100)
+
+        for sensor in sensors.values():
+            sensor.update_many("MQ3", values[:history], timestamps[:history])
+
+        excitement = ExcitementClass("MQ3")
+        excitement.attach(sensors)
+
+        latencies = []
+        for start in range(history, history + chunk * 100, chunk):
+            for sensor in sensors.values():
+                sensor.update_many("MQ3", values[start:start + chunk], timestamps[start:start + chunk])
+
+            start = time.perf_counter()
+            excitement.loop()
+            latencies.append(time.perf_counter() - start)
+
+        print(f"{arguments.boards} sensors, history {history:6d} : {numpy.mean(latencies) * 1e6:8.1f} µs/loop")
+
+def benchmark_reordering(arguments):
+    """
+    Samples kept by the processing when the payloads arrive with a network jitter, for several lateness watermarks
+    """
+
+    from processing import ProcessingClass
+    from configuration import CalibrationConfigurationClass
+
+    period = 100
+    jitter = 400    # Maximum delay of a payload (ms)
+
+    sensors_configuration = {name: sensor.configuration for name, sensor in get_sensors(arguments.boards).items()}
+
+    samples = arguments.samples // arguments.boards
+
+    values, timestamps = get_synthetic_signal(samples, period)
+    timestamps = timestamps + 1700000000000
+
+    # Reception time of each payload of each board
+    generator = numpy.random.default_rng(0)
+    receptions = [(timestamps[j] + generator.uniform(0, jitter), i, j) for i in range(arguments.boards) for j in range(samples)]
+    receptions.sort()
+
+    for lateness in [0, 100, 250, 500]:
+        processing = ProcessingClass(sensors_configuration, CalibrationConfigurationClass({"enable": False, "duration": 0}), [], lateness=lateness)
+
+        start = time.perf_counter()
+
+        # One batch per 100 ms of reception time
+        for k in range(0, len(receptions), arguments.boards):
+            batch = {}
+
+            for _, i, j in receptions[k:k + arguments.boards]:
+                block = batch.setdefault((f"Sensor_{i + 1}", "MQ3"), ([], []))
+                block[0].append(values[j])
+                block[1].append(timestamps[j])
+
+            processing.update_sensors({key: (numpy.array(block[0]), numpy.array(block[1])) for key, block in batch.items()})
+
+        duration = time.perf_counter() - start
+
+        processing.stop()
+
+        counters = processing.get_reordering_counters()
+        kept = sum(sensor.get_current_index("MQ3") for sensor in processing.sensors.values())
+
+        print(f"Lateness {lateness:4d} ms : {kept / len(receptions):7.2%} samples kept, {counters['reordered']} reordered, {counters['too_late']} too late, {1e6 * duration / len(receptions):.2f} µs/sample")
+
+def benchmark_resampling(arguments):
+    """
+    Cost of the incremental resampling, of the cached filter designs and of the shifts of signals on a common
+    fixed-rate grid compared to irregular signals
+    """
+
+    from scipy.signal import butter
+    from resampling import ResamplerClass
+    from filtering import get_sos
+
+    period = 100
+    generator = numpy.random.default_rng(0)
+
+    # Irregular sampling around 10 Hz
+    timestamps = numpy.cumsum(generator.uniform(0.8 * period, 1.2 * period, arguments.samples))
+    values = numpy.sin(timestamps / 5000)
+
+    for block in [1, 16, 256]:
+        resampler = ResamplerClass(1000 / period)
+
+        start = time.perf_counter()
+        for i in range(0, arguments.samples, block):
+            resampler.update(values[i:i + block], timestamps[i:i + block])
+        duration = time.perf_counter() - start
+
+        print(f"Resampling, blocks of {block:4d} samples : {1e6 * duration / arguments.samples:6.2f} µs/sample")
+
+    calls = 1000
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        butter(4, 0.05, output="sos")
+    design_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        get_sos(4, 0.05)
+    cached_duration = time.perf_counter() - start
+
+    print(f"Filter design : {1e6 * design_duration / calls:.1f} µs, cached {1e6 * cached_duration / calls:.1f} µs")
+
+    # Excited signals of several sensors, irregular or resampled on the common grid
+    count = 8
+    shifts = numpy.linspace(0, 3000, count)
+
+    irregular = {}
+    resampled = {}
+
+    for i, shift in enumerate(shifts):
+        sensor_timestamps = numpy.cumsum(generator.uniform(0.8 * period, 1.2 * period, arguments.samples // 10))
+        sensor_values = numpy.exp(-((sensor_timestamps - arguments.samples * period / 20 - shift) / 3000) ** 2)
+
+        irregular[f"Sensor_{i + 1}"] = {"time": sensor_timestamps, "value": sensor_values}
+
+        grid_values, grid_timestamps = ResamplerClass(1000 / period).update(sensor_values, sensor_timestamps)
+        resampled[f"Sensor_{i + 1}"] = {"time": grid_timestamps, "value": grid_values}
+
+    for name, data in [("irregular", irregular), ("resampled", resampled)]:
+        start = time.perf_counter()
+        for _ in range(100):
+            result = get_shifts(data)
+        duration = (time.perf_counter() - start) / 100
+
+        error = numpy.abs(numpy.array(list(result.values())) - shifts).max()
+
+        print(f"Shifts of {count} {name:9s} signals : {1e3 * duration:.2f} ms, maximum error {error:.1f} ms")
+
+def benchmark_replay(arguments):
+    """
+    End-to-end throughput and per-stage latency of the processing pipeline replaying a recorded session
+    (synthetic payloads recorded with `RecorderClass`)
+    """
+
+    import tempfile
+    from replay import RecorderClass, ReplayClass, read_log, print_metrics
+    from processing import ProcessingClass
+    from configuration import CalibrationConfigurationClass
+
+    period = 100
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "session.log")
+
+        recorder = RecorderClass(path)
+
+        payloads = get_payloads(arguments.boards, arguments.samples, period)
+
+        for i, payload in enumerate(payloads):
+            recorder.put(payload, (i // arguments.boards) * period / 1000)
+
+        recorder.stop()
+
+        print(f"Recorded {len(payloads)} payloads : {os.path.getsize(path) / len(payloads):.1f} bytes/payload")
+
+        sensors_configuration = {name: sensor.configuration for name, sensor in get_sensors(arguments.boards).items()}
+
+        processing = ProcessingClass(sensors_configuration, CalibrationConfigurationClass({"enable": False, "duration": 0}), [])
+
+        replay = ReplayClass(processing, batch_size=arguments.batch_size)
+        replay.run(read_log(path))
+
+        processing.stop()
+
+    print_metrics(replay.get_metrics())
+
+def benchmark_metrics(arguments):
+    """
+    Overhead of the metrics instrumentation, disabled and enabled, and replay throughput with the metrics enabled
+    """
+
+    import metrics
+
+    calls = 100000
+
+    for name, registry in [("disabled", metrics.RegistryClass()), ("enabled", metrics.RegistryClass())]:
+        if name == "enabled":
+            registry.enable()
+
+        counter = registry.counter("benchmark_total", "Benchmark counter")
+        histogram = registry.histogram("benchmark_seconds", "Benchmark histogram")
+
+        start = time.perf_counter()
+        for _ in range(calls):
+            counter.inc()
+        counter_duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(calls):
+            with histogram.time():
+                pass
+        timer_duration = time.perf_counter() - start
+
+        print(f"{name:>8} : counter {1e9 * counter_duration / calls:6.0f} ns/call, timer {1e9 * timer_duration / calls:6.0f} ns/call")
+
+    # The instrumented services look the metrics up in the default registry at construction
+    metrics.REGISTRY.enable()
+
+    benchmark_replay(arguments)
+
+    exposition = metrics.REGISTRY.render()
+
+    print(f"Exposition : {len(exposition.splitlines())} lines, {len(exposition)} bytes")
+
+    for line in exposition.splitlines():
+        if line.startswith("gaz_stage_latency_seconds_count") or line.startswith("gaz_samples_total"):
+            print(f" - {line}")
+
+def benchmark_sharding(arguments):
+    """
+    Throughput of the sensors update in the calling thread against the sensors sharded across worker processes
+    """
+
+    from processing import ProcessingClass
+    from configuration import CalibrationConfigurationClass
+
+    values, timestamps = get_synthetic_signal(arguments.samples)
+    chunk = 10
+
+    workers_counts = [None] + sorted({1, 2, os.cpu_count() or 1})
+
+    for boards in (4, 16, 64):
+        sensors_configuration = {name: sensor.configuration for name, sensor in get_sensors(boards).items()}
+
+        for workers in workers_counts:
+            processing = ProcessingClass(sensors_configuration, CalibrationConfigurationClass({"enable": False, "duration": 0}), [], workers=workers)
+
+            start = time.perf_counter()
+            for i in range(0, arguments.samples, chunk):
+                processing.update_sensors({(name, "MQ3"): (values[i:i + chunk], timestamps[i:i + chunk]) for name in sensors_configuration.keys()})
+            duration = time.perf_counter() - start
+
+            # Release the samples held by the reorder buffers
+            processing.flush()
+
+            # The main process reads the values updated by the workers
+            assert all(sensor.get_current_index("MQ3") == arguments.samples for sensor in processing.sensors.values())
+
+            processing.stop()
+
+            mode = "in-process" if workers is None else f"{workers} workers"
+
+            print(f"{boards:3d} boards, {mode:11s} : {boards * arguments.samples / duration:10.0f} samples/s")
+
+def benchmark_rendering(arguments):
+    """
+    Frame time of the signals tab: full redraw with `plot_sensors` against the incremental blitting renderer
+    """
+
+    # The user interface modules are only imported by this benchmark
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from plot import plot_sensors, SensorsPlotClass, BlitRendererClass
+
+    columns = ["raw_value", "resistance", "concentration"]
+    chunk = 10
+    frames = 20
+
+    sensors = get_sensors(arguments.boards)
+    values, timestamps = get_synthetic_signal(arguments.samples + chunk * frames)
+
+    for sensor in sensors.values():
+        sensor.update_many("MQ3", values[:arguments.samples], timestamps[:arguments.samples])
+
+    def get_canvas():
+        figure = Figure(figsize=(15, 5), dpi=100)
+        return FigureCanvasAgg(figure), figure.subplots(1, 3)
+
+    # - Full redraw of every sensor history on each frame
+    canvas, axes = get_canvas()
+
+    latencies = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        for subplot, column in zip(axes, columns):
+            plot_sensors(sensors, subplot, "MQ3", column)
+        canvas.figure.tight_layout()
+        canvas.draw()
+        latencies.append(time.perf_counter() - start)
+
+    print_latencies(f"plot_sensors, {arguments.boards} sensors of {arguments.samples} samples", numpy.array(latencies), unit="frame")
+
+    # - Incremental renderer, with and without new samples
+    canvas, axes = get_canvas()
+    renderer = BlitRendererClass(canvas, [SensorsPlotClass(subplot, "MQ3", column) for subplot, column in zip(axes, columns)])
+    renderer.draw(sensors)
+
+    new_latencies = []
+    idle_latencies = []
+    for frame in range(frames):
+        start = arguments.samples + frame * chunk
+        for sensor in sensors.values():
+            sensor.update_many("MQ3", values[start:start + chunk], timestamps[start:start + chunk])
+
+        start = time.perf_counter()
+        renderer.draw(sensors)
+        new_latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        renderer.draw(sensors)
+        idle_latencies.append(time.perf_counter() - start)
+
+    print_latencies(f"BlitRendererClass, {chunk} new samples per sensor", numpy.array(new_latencies), unit="frame")
+    print_latencies(f"BlitRendererClass, no new samples", numpy.array(idle_latencies), unit="frame")
+
+# Modules which must not be loaded by the processing core (user interface, dataframes and machine learning)
+HEAVY_MODULES = ["pandas", "sklearn", "matplotlib", "tkinter"]
+
+def get_import_time(module):
+    """
+    Import a module in a fresh interpreter with `-X importtime`
+
+    # Arguments
+
+    - module (str): module to import
+
+    # Returns
+
+    - (float, dict): total import time in seconds and cumulative import time in seconds of every imported module
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+    )
+
+    total = 0
+    times = {}
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line[len("import time:"):].split("|")
+
+        times[name.strip()] = int(cumulative) / 1e6
+
+        # Nested imports are indented and already counted by their parent
+        if not name.startswith("  "):
+            total += int(cumulative) / 1e6
+
+    return total, times
+
+def benchmark_import_time(arguments):
+    """
+    Startup import time of the processing core and of the entry point, fails if above the budget or if a heavy module is loaded
+    """
+
+    failed = False
+
+    for module in ["processing", "main"]:
+        # Keep the fastest of a few runs to reduce the noise of the disk cache
+        total, times = min((get_import_time(module) for _ in range(arguments.repeat)), key=lambda result: result[0])
+
+        heavy = [name for name in times if name.split(".")[0] in HEAVY_MODULES]
+
+        print(f"{module} : {total * 1000:.0f} ms (budget {arguments.budget * 1000:.0f} ms)")
+
+        for name, duration in sorted(times.items(), key=lambda item: item[1], reverse=True)[1:6]:
+            print(f"  {name:30s} {duration * 1000:8.1f} ms")
+
+        if heavy:
+            print(f"  Heavy modules loaded : {heavy}")
+            failed = True
+
+        if total > arguments.budget:
+            print(f"  Import time above the budget")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+BENCHMARKS = {
+    "filtering": benchmark_filtering,
+    "conversion": benchmark_conversion,
+    "buffer": benchmark_buffer,
+    "ingestion": benchmark_ingestion,
+    "decoding": benchmark_decoding,
+    "async_ingestion": benchmark_async_ingestion,
+    "trilateration": benchmark_trilateration,
+    "localization": benchmark_localization,
+    "solver": benchmark_solver,
+    "shifts": benchmark_shifts,
+    "sliding_shift": benchmark_sliding_shift,
+    "excitement": benchmark_excitement,
+    "reordering": benchmark_reordering,
+    "resampling": benchmark_resampling,
+    "replay": benchmark_replay,
+    "metrics": benchmark_metrics,
+    "sharding": benchmark_sharding,
+    "rendering": benchmark_rendering,
+    "import_time": benchmark_import_time,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend benchmarks")
+    parser.add_argument("benchmark", choices=BENCHMARKS.keys(), help="Benchmark to run")
+    parser.add_argument("--samples", type=int, default=10000, help="Number of samples (defaults to the sensors maximum values)")
+    parser.add_argument("--full", action="store_true", help="Also run the full-history filtering (slow)")
+    parser.add_argument("--boards", type=int, default=50, help="Number of sensor boards")
+    parser.add_argument("--queue-size", type=int, default=4096, help="Ingestion queue size")
+    parser.add_argument("--batch-size", type=int, default=512, help="Ingestion batch size")
+    parser.add_argument("--problems", type=int, default=50, help="Number of localization problems per layout")
+    parser.add_argument("--environments", type=int, default=20, help="Number of simulated environments of the localization benchmark")
+    parser.add_argument("--accuracy", type=float, default=2.0, help="Median localization error target in meters")
+    parser.add_argument("--budget", type=float, default=2.0, help="Maximum import time in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of the import time measure")
+
+    arguments = parser.parse_args()
+
+    BENCHMARKS[arguments.benchmark](arguments)
+
+if __name__ == "__main__":
+    main()
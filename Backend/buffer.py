@@ -0,0 +1,130 @@
+import numpy
+
+class RingBufferClass:
+    def __init__(self, dtype, capacity, evict=None):
+        """
+        Create a new ring buffer of fixed-dtype rows
+
+        The rows are stored in a preallocated structured array twice as large as the capacity. New rows
+        are written after the newest one and the retained rows are moved back to the beginning of the array
+        once its end is reached, so that appending is O(1) (amortized) and the retained rows are always
+        contiguous and can be returned as a zero-copy view. When the buffer is full, the oldest rows are dropped.
+
+        # Arguments
+
+        - dtype (numpy.dtype): structured dtype of a row
+        - capacity (int): maximum number of retained rows
+        - evict (function or None): called with the rows about to be dropped (e.g. to spill them to an archive)
+
+        # Returns
+
+        - RingBufferClass: new ring buffer
+        """
+
+        if capacity < 1:
+            raise ValueError(f"Capacity must be positive, got {capacity}")
+
+        self.capacity = capacity
+        self.data = numpy.zeros(2 * capacity, dtype=dtype)
+
+        self.evict = evict
+
+        self.start = 0  # Position of the oldest retained row
+        self.end = 0    # Position after the newest row
+
+        self.total = 0  # Number of rows appended since the creation
+
+    def __len__(self):
+        return self.end - self.start
+
+    def append(self, row):
+        """
+        Append a row, dropping the oldest one if the buffer is full
+
+        # Arguments
+
+        - row (tuple): values of the row, in the dtype fields order
+        """
+
+        if self.end == self.data.shape[0]:
+            self.compact()
+
+        self.data[self.end] = row
+        self.end += 1
+
+        if self.end - self.start > self.capacity:
+            if self.evict is not None:
+                self.evict(self.data[self.start:self.start + 1])
+
+            self.start += 1
+
+        self.total += 1
+
+    def extend(self, rows):
+        """
+        Append a block of rows, dropping the oldest ones if the buffer is full
+
+        # Arguments
+
+        - rows (numpy.ndarray of shape (n,)): rows with the buffer dtype
+        """
+
+        n = rows.shape[0]
+
+        if n >= self.capacity:
+            if self.evict is not None:
+                self.evict(self.data[self.start:self.end])
+                self.evict(rows[:n - self.capacity])
+
+            self.data[:self.capacity] = rows[n - self.capacity:]
+            self.start = 0
+            self.end = self.capacity
+        else:
+            if self.end + n > self.data.shape[0]:
+                self.compact()
+
+            self.data[self.end:self.end + n] = rows
+            self.end += n
+
+            start = max(self.start, self.end - self.capacity)
+
+            if self.evict is not None and start > self.start:
+                self.evict(self.data[self.start:start])
+
+            self.start = start
+
+        self.total += n
+
+    def compact(self):
+        """
+        Move the retained rows to the beginning of the array
+        """
+
+        size = self.end - self.start
+
+        self.data[:size] = self.data[self.start:self.end]
+
+        self.start = 0
+        self.end = size
+
+    def view(self):
+        """
+        Get the retained rows, from the oldest to the newest
+
+        # Returns
+
+        - numpy.ndarray: zero-copy view on the retained rows (valid until the next append)
+        """
+
+        return self.data[self.start:self.end]
+
+    def get_dropped(self):
+        """
+        Get the number of rows dropped since the creation
+
+        # Returns
+
+        - int: number of dropped rows
+        """
+
+        return self.total - (self.end - self.start)
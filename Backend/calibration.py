@@ -1,46 +1,335 @@
-
 # - - Time
 import time
 import datetime
+# - - Threading
+import threading
+import functools
+# - - Mathematical
+import numpy
+
+class WelfordClass:
+    def __init__(self):
+        """
+        Running mean and variance (Welford algorithm, merged per block of samples with the parallel algorithm)
+
+        # Returns
+
+        - WelfordClass: empty accumulator
+        """
+
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0   # Sum of the squared differences to the mean
+
+    def update(self, value):
+        self.count += 1
+
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def update_many(self, values):
+        """
+        Add a block of values
+
+        # Arguments
+
+        - values (numpy.ndarray of shape (n,)): values
+        """
+
+        n = values.shape[0]
+
+        if n == 0:
+            return
+
+        if n == 1:
+            self.update(float(values[0]))
+            return
+
+        mean = values.mean()
+
+        self.merge(n, mean, ((values - mean) ** 2).sum())
+
+    def merge(self, n, mean, m2):
+        """
+        Add the statistics of a block of values (parallel algorithm)
+
+        # Arguments
+
+        - n (int): number of values
+        - mean (float): mean of the values
+        - m2 (float): sum of the squared differences to the mean
+        """
+
+        if n == 0:
+            return
+
+        count = self.count + n
+        delta = mean - self.mean
+
+        self.mean += delta * n / count
+        self.m2 += m2 + delta ** 2 * self.count * n / count
+        self.count = count
+
+    def get_std(self):
+        """
+        Get the unbiased standard deviation
+
+        # Returns
+
+        - float: standard deviation, NaN with less than 2 values
+        """
+
+        if self.count < 2:
+            return numpy.nan
+
+        return (self.m2 / (self.count - 1)) ** 0.5
+
+    def get_relative_std(self):
+        return self.get_std() / self.mean if self.count > 0 else numpy.nan
+
+    def get_relative_error(self):
+        """
+        Get the relative standard error of the mean (how well the mean has converged)
+
+        # Returns
+
+        - float: standard error divided by the mean, NaN with less than 2 values
+        """
+
+        return self.get_relative_std() / self.count ** 0.5 if self.count > 0 else numpy.nan
+
+class CalibrationWindowClass:
+    def __init__(self, duration, tolerance=None, minimum_samples=30):
+        """
+        Calibration window, accumulating the resistance of each gas sensor while it is running
+
+        # Arguments
+
+        - duration (float): maximum duration of the window in seconds
+        - tolerance (float or None): the window ends early once the relative standard error of R_0 of every
+          gas sensor is below the tolerance, None to always wait for the duration
+        - minimum_samples (int): minimum number of samples of each gas sensor before ending early
+
+        # Returns
+
+        - CalibrationWindowClass: the window, started now
+        """
+
+        self.start = datetime.datetime.now()
+        self.end = self.start + datetime.timedelta(seconds=duration)
+
+        self.tolerance = tolerance
+        self.minimum_samples = minimum_samples
+
+        self.accumulators = {}  # WelfordClass by (sensor identifier, gaz sensor type)
+
+    def get_accumulator(self, key):
+        if key not in self.accumulators:
+            self.accumulators[key] = WelfordClass()
+
+        return self.accumulators[key]
+
+    def update(self, key, values):
+        self.get_accumulator(key).update_many(values)
+
+    def is_stable(self):
+        if self.tolerance is None or not self.accumulators:
+            return False
+
+        return all(accumulator.count >= self.minimum_samples and accumulator.get_relative_error() < self.tolerance for accumulator in self.accumulators.values())
+
+    def is_finished(self):
+        return datetime.datetime.now() >= self.end or self.is_stable()
+
+    def get_estimates(self):
+        """
+        Get the live R_0 estimates
+
+        # Returns
+
+        - dict: R_0 (mean resistance), relative std, relative standard error and number of samples by (sensor identifier, gaz sensor type)
+        """
+
+        return {key: {
+            "R_0": accumulator.mean,
+            "relative_std": accumulator.get_relative_std(),
+            "relative_error": accumulator.get_relative_error(),
+            "count": accumulator.count,
+        } for key, accumulator in self.accumulators.items()}
+
+    def get_results(self):
+        results = ""
+
+        if datetime.datetime.now() < self.end:
+            results += f"Stable after {(datetime.datetime.now() - self.start).total_seconds():.0f} s\n"
+
+        sensor_identifier = None
+
+        for (name, sensor_type), accumulator in sorted(self.accumulators.items()):
+            if name != sensor_identifier:
+                results += f"- Sensor {name} :\n"
+                sensor_identifier = name
+
+            results += f" - {sensor_type} R_0 : {accumulator.mean:.2f} ± {accumulator.get_relative_std()*100:.2f}%\n ({accumulator.count} samples)\n"
+
+        return results
 
 class CalibrationClass:
     def __init__(self, configuration):
+        """
+        Calibration of the sensors R_0 from streaming statistics
+
+        The sensors notify the calibration of their new samples (see `attach`), the resistance of the new samples is
+        accumulated by every running calibration window, so a window result is available as soon as it ends.
+
+        # Arguments
+
+        - configuration (CalibrationConfigurationClass): calibration configuration, a window is started if enabled
+
+        # Returns
+
+        - CalibrationClass: the calibration
+        """
+
         self.configuration = configuration
 
+        self.windows = []
+        self.indexes = {}   # Index of the newest accumulated sample by (sensor identifier, gaz sensor type)
+
+        self.lock = threading.Lock()
+
         if self.configuration.enable:
-            self.end = datetime.datetime.now() + datetime.timedelta(seconds=self.configuration.duration)
-        else:
-            self.end = None
+            self.start_window(self.configuration.duration, self.configuration.tolerance)
+
+    def attach(self, sensors):
+        """
+        Listen to the new samples of all the gas sensors
+
+        # Arguments
+
+        - sensors (dict): sensors by identifier
+        """
+
+        for name, sensor in sensors.items():
+            for sensor_type in sensor.get_gaz_sensors_types():
+                sensor.add_listener(sensor_type, functools.partial(self.notify, (name, sensor_type)))
+
+    def notify(self, key, gaz_sensor):
+        """
+        Sample-append notification, called from the thread updating the sensors
+
+        # Arguments
+
+        - key (tuple): (sensor identifier, gaz sensor type)
+        - gaz_sensor (GazSensorClass): gas sensor which received new samples
+        """
+
+        index = gaz_sensor.get_current_index()
+        new = index - self.indexes.get(key, 0)
+        self.indexes[key] = index
+
+        if not self.windows or new <= 0:
+            return
+
+        resistance = gaz_sensor.get_all_values()["resistance"][-new:]
+
+        with self.lock:
+            for window in self.windows:
+                window.update(key, resistance)
+
+    def start_window(self, duration, tolerance=None, sensors=None, history=0):
+        """
+        Start a calibration window, several windows can run at the same time
+
+        # Arguments
+
+        - duration (float): maximum duration of the window in seconds
+        - tolerance (float or None): relative standard error of R_0 ending the window early, None to disable
+        - sensors (dict or None): sensors by identifier, to seed the window with their history
+        - history (float): duration of the samples received before the window accounted in it, in seconds (read from
+          the rollups, see `get_statistics`), so a window started while the sensors are stable can end early
+
+        # Returns
+
+        - CalibrationWindowClass: the window
+        """
+
+        window = CalibrationWindowClass(duration, tolerance)
+
+        if sensors is not None and history > 0:
+            for key, statistics in self.get_statistics(sensors, history).items():
+                # The standard deviation is undefined for less than 2 samples
+                m2 = statistics["std"] ** 2 * (statistics["count"] - 1) if statistics["count"] > 1 else 0.0
+
+                window.get_accumulator(key).merge(statistics["count"], statistics["mean"], m2)
+
+        with self.lock:
+            self.windows.append(window)
+
+        return window
+
+    def get_statistics(self, sensors, history):
+        """
+        Get the resistance statistics of the last samples of each gas sensor from the rollups (constant time, the
+        oldest edge of the range is rounded to a rollup bucket)
+
+        # Arguments
+
+        - sensors (dict): sensors by identifier
+        - history (float): duration before the newest sample of each gas sensor, in seconds
+
+        # Returns
+
+        - dict: count, mean (R_0), std, min and max by (sensor identifier, gaz sensor type), for the gas sensors with samples
+        """
+
+        statistics = {}
+
+        for name, sensor in sensors.items():
+            for sensor_type in sensor.get_gaz_sensors_types():
+                latest_time = sensor.get_latest_time(sensor_type)
+
+                if latest_time is None:
+                    continue
+
+                values = sensor.get_statistics(sensor_type, "resistance", latest_time - history * 1000, None)
+
+                if values["count"] > 0:
+                    statistics[(name, sensor_type)] = values
+
+        return statistics
 
     def state(self):
-        if self.end is None:
+        if not self.windows:
             return None
 
-        return self.end - datetime.datetime.now()
+        return min(window.end for window in self.windows) - datetime.datetime.now()
 
-    def loop(self, sensors):
-        # If the calibration is not enabled, return None
-        if self.end is None:
-            return None
+    def get_estimates(self):
+        """
+        Get the live R_0 estimates of the running windows
 
-        # If the calibration is not finished, return None
-        if datetime.datetime.now() < self.end:
-            return None
-            
-        # Disable the calibration
-        self.end = None
+        # Returns
 
-        results = ""
+        - list of dict: estimates of each window (see `CalibrationWindowClass.get_estimates`)
+        """
 
-        # Iterate over all sensors
-        for name, sensor in sensors.items():
-            results += f"- Sensor {name} :\n"
+        with self.lock:
+            return [window.get_estimates() for window in self.windows]
+
+    def loop(self, sensors):
+        # If no calibration is running, return None
+        if not self.windows:
+            return None
 
-            # Iterate over all sensors type for the sensor
-            for sensor_type, data in sensor.get_all_values().items():
-                # Compute the mean and the standard deviation of the collected data
-                results += f" - {sensor_type} R_0 : {data['resistance'].mean():.2f} ± {data['resistance'].std()/data['resistance'].mean()*100:.2f}%\n ({data['resistance'].shape[0]} samples)\n"
+        with self.lock:
+            finished = [window for window in self.windows if window.is_finished()]
 
-        return results
+            # If no calibration is finished, return None
+            if not finished:
+                return None
 
+            self.windows = [window for window in self.windows if window not in finished]
 
+            return "".join(window.get_results() for window in finished)
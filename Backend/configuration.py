@@ -9,6 +9,7 @@ class CalibrationConfigurationClass:
 
         - calibration_enable (bool): If the calibration is enabled
         - calibration_time (int): The time in seconds to calibrate
+        - tolerance (float, optional): End the calibration early once the relative standard error of every R_0 is below it
 
         # Returns
 
@@ -17,6 +18,7 @@ class CalibrationConfigurationClass:
 
         self.enable: bool = data["enable"]
         self.duration: int = data["duration"]
+        self.tolerance: float = data.get("tolerance", None)
 
 class MQTTConfigurationClass:
     def __init__(self, data):
@@ -36,10 +38,39 @@ class MQTTConfigurationClass:
         self.host:str = data["host"]
         self.port:int = data["port"]
         self.topic:str = data["topic"]
+        self.queue_size:int = data.get("queue_size", 4096)
+        self.batch_size:int = data.get("batch_size", 512)
+        self.lateness:float = data.get("lateness", 500)  # Maximum lateness of a sample in milliseconds (see `reordering.py`)
+        self.resampling_rate:float = data.get("resampling_rate", None)  # Fixed sample rate in Hz (see `resampling.py`), None to keep the timestamps
+
+        # - Asynchronous ingestion (see `async_ingestion.py`): brokers ({"host", "port", "topics"}), the broker above by default
+        self.brokers:list = data.get("brokers", [{"host": self.host, "port": self.port, "topics": [self.topic]}])
+        self.shared_group:str = data.get("shared_group", None)  # Shared subscription group, None to subscribe directly
+        self.processes:int = data.get("processes", 1)   # Receiving processes (shared subscriptions)
+
+class OutputConfigurationClass:
+    def __init__(self, data):
+        """
+        Results output configuration
+
+        # Arguments
+
+        - data (dict): The data with the configuration
+
+        # Returns
+
+        - OutputConfigurationClass: The output configuration
+        """
+
+        self.log:bool = data.get("log", True)
+        self.file:str = data.get("file", None)
+        self.topic:str = data.get("topic", None)
 
 class SensorConfigurationClass:
     def __init__(self, data):
         self.maximum_values = 10000
+        self.filtering_mode = "streaming"
+        self.refinement_window = 256
 
         self.from_dictionary(data)
 
@@ -58,18 +89,21 @@ def load(file):
 
     # Returns
 
-    - (MQTTConfigurationClass, CalibrationConfigurationClass, dict): The MQTT configuration, the calibration configuration and the sensors
+    - (MQTTConfigurationClass, CalibrationConfigurationClass, dict, OutputConfigurationClass): The MQTT configuration, the calibration configuration, the sensors and the results output configuration
     """
 
     with open(file) as f:
         data = json.load(f)
     
     sensors = {}
+    output_configuration = OutputConfigurationClass({})
     for name, configuration in data.items():
         if name == "mqtt":
             mqtt_configuration = MQTTConfigurationClass(configuration)
         elif name == "calibration":
             calibration_configuration = CalibrationConfigurationClass(configuration)
+        elif name == "output":
+            output_configuration = OutputConfigurationClass(configuration)
         elif name == "sensors":
             for sensor_identifier, sensor_configuration in configuration.items():
                 sensors[sensor_identifier] = SensorConfigurationClass(sensor_configuration)
@@ -77,6 +111,6 @@ def load(file):
             raise ValueError(f"Unexpected configuration: {name}")
 
 
-    return mqtt_configuration, calibration_configuration, sensors
+    return mqtt_configuration, calibration_configuration, sensors, output_configuration
 
 
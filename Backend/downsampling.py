@@ -0,0 +1,92 @@
+import numpy
+
+def get_minmax_indexes(y, buckets):
+    """
+    Get the indexes of the minimum and the maximum of each bucket of samples, so that the peaks stay visible
+
+    # Arguments
+
+    - y (numpy.ndarray of shape (n,)): values
+    - buckets (int): number of buckets
+
+    # Returns
+
+    - numpy.ndarray: increasing indexes (at most 2 * buckets), all the indexes if there are less than 2 * buckets samples
+    """
+
+    n = y.shape[0]
+
+    if n <= 2 * buckets:
+        return numpy.arange(n)
+
+    # At most `buckets` buckets, the last one may be partial
+    size = -(-n // buckets)
+    count = n // size
+    end = count * size
+
+    blocks = y[:end].reshape(count, size)
+    minimum = blocks.argmin(axis=1)
+    maximum = blocks.argmax(axis=1)
+
+    # Keep the minimum and the maximum of each bucket in time order
+    offsets = numpy.arange(count) * size
+
+    indexes = numpy.empty(2 * count, dtype=int)
+    indexes[0::2] = numpy.minimum(minimum, maximum) + offsets
+    indexes[1::2] = numpy.maximum(minimum, maximum) + offsets
+
+    if end < n:
+        tail = y[end:]
+        indexes = numpy.concatenate((indexes, numpy.unique([tail.argmin(), tail.argmax()]) + end))
+
+    return indexes
+
+def get_lttb_indexes(x, y, points):
+    """
+    Get the indexes of the samples selected by the Largest-Triangle-Three-Buckets algorithm
+
+    The first and the last samples are kept, the other samples are split in `points - 2` buckets and
+    the sample of each bucket forming the largest triangle with the previous selected sample and the mean
+    of the next bucket is selected.
+
+    # Arguments
+
+    - x (numpy.ndarray of shape (n,)): abscissa
+    - y (numpy.ndarray of shape (n,)): values
+    - points (int): number of selected samples
+
+    # Returns
+
+    - numpy.ndarray: increasing indexes, all the indexes if there are less than `points` samples
+    """
+
+    n = x.shape[0]
+
+    if points >= n or points < 3:
+        return numpy.arange(n)
+
+    edges = numpy.linspace(1, n - 1, points - 1).astype(int)
+
+    indexes = numpy.empty(points, dtype=int)
+    indexes[0] = 0
+    indexes[-1] = n - 1
+
+    selected = 0
+
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # Mean of the next bucket (the last sample for the last bucket)
+        if i + 2 < edges.shape[0]:
+            next_x = x[end:edges[i + 2]].mean()
+            next_y = y[end:edges[i + 2]].mean()
+        else:
+            next_x = x[n - 1]
+            next_y = y[n - 1]
+
+        areas = numpy.abs((x[selected] - next_x) * (y[start:end] - y[selected]) - (x[selected] - x[start:end]) * (next_y - y[selected]))
+
+        selected = start + int(areas.argmax())
+        indexes[i + 1] = selected
+
+    return indexes
@@ -1,32 +1,96 @@
 import logging
+import threading
+import functools
 import numpy
 
 def get_current_timestamp(sensors, gaz_sensor_type):
     current_timestamp = 0
     # Iterate over the sensors
     for sensor in sensors.values():
-        sensor_values = sensor.get_all_values(gaz_sensor_type)
+        if gaz_sensor_type not in sensor.get_gaz_sensors_types():
+            continue
 
-        if sensor_values.shape[0] > 0:
-            # Check if the last timestamp is greater than the latest timestamp
-            if sensor.get_all_values("MQ3")["time"].values[-1] > current_timestamp:
-                # Update the latest timestamp
-                current_timestamp = sensor.get_all_values("MQ3")["time"].values[-1]
+        latest_timestamp = sensor.get_latest_time(gaz_sensor_type)
+
+        # Check if the last timestamp is greater than the latest timestamp
+        if latest_timestamp is not None and latest_timestamp > current_timestamp:
+            # Update the latest timestamp
+            current_timestamp = latest_timestamp
 
     return current_timestamp
 
 class ExcitementClass:
 
-    def __init__(self, gaz_sensor_type):
-        
-        self.excited_indexes = {}
+    def __init__(self, gaz_sensor_type, timeout=40000):
+        """
+        Event-driven excitement detector
+
+        The sensors notify the detector when they receive new samples (see `attach`), each loop only
+        checks the sensors notified since the previous loop, so its cost does not depend on the history length.
+
+        # Arguments
+
+        - gaz_sensor_type (str): gaz sensor type
+        - timeout (float): time without new excitement after which the excitement is reset (ms)
+
+        # Returns
+
+        - ExcitementClass: the excitement detector
+        """
+
+        self.excited_timestamps = {}    # Excitement timestamp by excited sensor identifier
 
         self.last_excitement_timestamp = None
         self.first_excitement_timestamp = None
 
+        self.current_timestamp = None   # Latest timestamp of all the sensors
+
         self.gaz_sensor_type = gaz_sensor_type
 
-        self.timeout = 40000
+        self.timeout = timeout
+
+        # - Gas sensors notified since the previous loop, by sensor identifier
+        self.notified = {}
+        self.lock = threading.Lock()
+
+        # - Excited signals of the current excitement episode, materialized again only after new samples
+        self.excited_signals = {}
+        self.stale = False
+
+        self.sensors_count = 0
+
+    def attach(self, sensors):
+        """
+        Listen to the new samples of the sensors having the gas sensor type
+
+        # Arguments
+
+        - sensors (dict): sensors by identifier
+        """
+
+        for name, sensor in sensors.items():
+            if self.gaz_sensor_type not in sensor.get_gaz_sensors_types():
+                logging.debug(f"Sensor {name} does not have {self.gaz_sensor_type}, ignored by the excitement detection")
+                continue
+
+            sensor.add_listener(self.gaz_sensor_type, functools.partial(self.notify, name))
+            self.sensors_count += 1
+
+    def notify(self, name, gaz_sensor):
+        """
+        Sample-append notification, called from the thread updating the sensors
+
+        # Arguments
+
+        - name (str): sensor identifier
+        - gaz_sensor (GazSensorClass): gas sensor which received new samples
+        """
+
+        with self.lock:
+            self.notified[name] = gaz_sensor
+
+            if name in self.excited_timestamps:
+                self.stale = True
 
     def get_last_excitement_timestamp(self):
         return self.last_excitement_timestamp
@@ -35,63 +99,94 @@ class ExcitementClass:
         return self.first_excitement_timestamp
 
     def get_excited_signals(self, sensors):
+        """
+        Get the signals of the excited sensors since the first excitement
+
+        The signals are copies of the sensors values (the buffers are appended and compacted by the thread updating
+        the sensors), memoized until an excited sensor receives new samples or the excitement changes: the same
+        dictionary is returned while nothing changed.
+
+        # Arguments
+
+        - sensors (dict): sensors by identifier
+
+        # Returns
+
+        - dict: {"time": numpy.ndarray, "value": numpy.ndarray} (filtered raw value) by excited sensor identifier
+        """
+
+        with self.lock:
+            stale = self.stale
+            self.stale = False
+
+        if not stale:
+            return self.excited_signals
 
         excited_signals = {}
-        
-        for name, index in self.excited_indexes.items():
 
-            
-            #print(f"All values: {sensors[name].get_all_values(self.gaz_sensor_type)}")
+        for name in self.excited_timestamps:
+            values = sensors[name].get_all_values(self.gaz_sensor_type)
+
+            # The values may have been dropped from the buffer since the excitement, so the start index is searched on each call
+            index = int(numpy.searchsorted(values["time"], self.first_excitement_timestamp, side="left"))
+
+            # Copied at once, the view is only valid until the next append
+            values = values[index:].copy()
+
+            excited_signals[name] = {"time": values["time"], "value": values["raw_value_filtered"]}
 
-            excited_signals[name] = sensors[name].get_all_values(self.gaz_sensor_type)[["time", "raw_value_filtered"]].iloc[index:]
-            
-            excited_signals[name].rename(columns={"raw_value_filtered": "value"}, inplace=True)
+        self.excited_signals = excited_signals
 
         return excited_signals
 
-    def is_all_excited(self, sensors):
-        return len(self.excited_indexes) == len(sensors)
+    def is_all_excited(self):
+        return self.sensors_count > 0 and len(self.excited_timestamps) == self.sensors_count
 
-    def loop(self, sensors):
+    def loop(self):
 
-        # Get the latest timestamp
-        current_timestamp = get_current_timestamp(sensors, self.gaz_sensor_type)
+        with self.lock:
+            notified = self.notified
+            self.notified = {}
+
+        # Update the latest timestamp
+        for gaz_sensor in notified.values():
+            latest_timestamp = gaz_sensor.get_latest_time()
+
+            if self.current_timestamp is None or latest_timestamp > self.current_timestamp:
+                self.current_timestamp = latest_timestamp
 
         # Check for timeout
         if self.last_excitement_timestamp is not None:
-            if current_timestamp - self.last_excitement_timestamp > self.timeout:
+            if self.current_timestamp - self.last_excitement_timestamp > self.timeout:
                 self.last_excitement_timestamp = None
                 self.first_excitement_timestamp = None
-                self.excited_indexes = {}
+                self.excited_timestamps = {}
+                self.stale = True
 
                 logging.info("Exc timeout")
 
-        # Check for the first excitement timestamp
-        for name, sensor in sensors.items():
+        # Check the excitement of the notified sensors
+        for name, gaz_sensor in notified.items():
             # Ignore the sensor if it is already excited
-            excitement_index = sensor.get_excitement_index(self.gaz_sensor_type)
+            if name in self.excited_timestamps:
+                continue
+
+            excitement_index = gaz_sensor.get_excitement_index()
 
-            if excitement_index is not None:
+            if excitement_index is None:
+                continue
 
-                if name not in self.excited_indexes:
+            logging.info(f"Excited: {name}")
 
-                    logging.info(f"Excited: {name}")
-                    
-                    excitement_time = sensor.get_all_values(self.gaz_sensor_type)["time"][excitement_index]
-                
-                    # - Set the first excitement timestamp
-                    if self.first_excitement_timestamp is None:
-                        self.first_excitement_timestamp = excitement_time
-                        logging.info(f"First excitement timestamp: {self.first_excitement_timestamp}")
-                    
-                    # Set the last excitement timestamp (for timeout)
-                    self.last_excitement_timestamp = excitement_time
-                    
-                    # - Extract the start index of the excitement
-                    i = numpy.where(sensor.get_all_values(self.gaz_sensor_type)["time"] >= self.first_excitement_timestamp)[0][0]
-                    self.excited_indexes[name] = i
+            excitement_time = gaz_sensor.get_all_values()["time"][excitement_index]
 
-                 
+            # - Set the first excitement timestamp
+            if self.first_excitement_timestamp is None:
+                self.first_excitement_timestamp = excitement_time
+                logging.info(f"First excitement timestamp: {self.first_excitement_timestamp}")
 
+            # Set the last excitement timestamp (for timeout)
+            self.last_excitement_timestamp = excitement_time
 
-    
\ No newline at end of file
+            self.excited_timestamps[name] = excitement_time
+            self.stale = True
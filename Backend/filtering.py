@@ -0,0 +1,177 @@
+import numpy
+import functools
+
+from scipy.signal import butter, sosfilt, sosfilt_zi, sosfiltfilt
+
+@functools.lru_cache(maxsize=128)
+def design_sos(order, cutoff, fs, btype):
+    return butter(order, Wn=cutoff, fs=fs, output="sos", btype=btype)
+
+def get_sos(order, cutoff, fs=None, btype="lowpass"):
+    """
+    Get a Butterworth filter design, cached by (order, cutoff, sample frequency) and shared by all the sensors
+
+    The sample frequency is rounded to 3 significant digits, so that the sensors sampled at nearly the same
+    rate share their design.
+
+    # Arguments
+
+    - order (int): order of the filter
+    - cutoff (float): cutoff frequency (Hz, or normalized to the Nyquist frequency if `fs` is None)
+    - fs (float or None): sample frequency (Hz)
+    - btype (str): filter type ("lowpass", "highpass", ...)
+
+    # Returns
+
+    - numpy.ndarray of shape (n, 6): second-order sections of the filter (shared, not to be modified)
+    """
+
+    if fs is not None:
+        fs = float(f"{fs:.3g}")
+
+    return design_sos(order, cutoff, fs, btype)
+
+class StreamingFilterClass:
+    def __init__(self, sos):
+        """
+        Create a new causal streaming filter for one channel
+
+        The filter keeps the `sosfilt` state (zi) and the last filtered sample between calls,
+        so that filtering a new sample (and its gradient) costs O(1) whatever the history length.
+
+        # Arguments
+
+        - sos (numpy.ndarray of shape (n, 6)): second-order sections of the filter
+
+        # Returns
+
+        - StreamingFilterClass: new streaming filter
+        """
+
+        self.sos = sos
+        self.sections = numpy.asarray(sos, dtype=float).tolist()
+
+        self.zi = None
+
+        self.previous_value = None
+        self.previous_time = None
+
+    def set_sos(self, sos):
+        """
+        Replace the filter design (e.g. when the sample rate drifted), the state is re-initialized in steady state
+        with the last filtered value to avoid a transient
+
+        # Arguments
+
+        - sos (numpy.ndarray of shape (n, 6)): second-order sections of the new filter
+        """
+
+        self.sos = sos
+        self.sections = numpy.asarray(sos, dtype=float).tolist()
+
+        if self.previous_value is not None:
+            self.zi = sosfilt_zi(sos) * self.previous_value
+
+    def reset(self):
+        """
+        Forget the filter state, the next sample will re-initialize it
+        """
+
+        self.zi = None
+        self.previous_value = None
+        self.previous_time = None
+
+    def update(self, values, timestamps):
+        """
+        Filter new samples and compute the absolute gradient of the filtered values
+
+        # Arguments
+
+        - values (numpy.ndarray of shape (n,)): new raw values
+        - timestamps (numpy.ndarray of shape (n,)): timestamps of the new values
+
+        # Returns
+
+        - (numpy.ndarray of shape (n,), numpy.ndarray of shape (n,)): filtered values and their absolute gradient
+        """
+
+        values = numpy.asarray(values, dtype=float)
+        timestamps = numpy.asarray(timestamps, dtype=float)
+
+        if values.shape[0] == 0:
+            return values, values
+
+        # Initialize the state in steady state with the first value to avoid the start transient
+        if self.zi is None:
+            self.zi = sosfilt_zi(self.sos) * values[0]
+
+        if values.shape[0] == 1:
+            filtered = numpy.array([self.filter_sample(values[0])])
+        else:
+            filtered, self.zi = sosfilt(self.sos, values, zi=self.zi)
+
+        # Backward difference with the previous filtered sample
+        if self.previous_value is None:
+            previous_values = numpy.concatenate(([filtered[0]], filtered[:-1]))
+            previous_times = numpy.concatenate(([timestamps[0]], timestamps[:-1]))
+        else:
+            previous_values = numpy.concatenate(([self.previous_value], filtered[:-1]))
+            previous_times = numpy.concatenate(([self.previous_time], timestamps[:-1]))
+
+        time_differences = timestamps - previous_times
+
+        gradient = numpy.zeros_like(filtered)
+        numpy.divide(filtered - previous_values, time_differences, out=gradient, where=time_differences > 0)
+
+        self.previous_value = filtered[-1]
+        self.previous_time = timestamps[-1]
+
+        return filtered, numpy.abs(gradient)
+
+    def filter_sample(self, value):
+        """
+        Filter a single sample in pure Python (transposed direct form II, as `sosfilt`), which is much
+        cheaper than a `sosfilt` call for one sample
+
+        # Arguments
+
+        - value (float): raw value
+
+        # Returns
+
+        - float: filtered value
+        """
+
+        zi = self.zi
+
+        for j, (b0, b1, b2, a0, a1, a2) in enumerate(self.sections):
+            z0, z1 = zi[j]
+
+            output = b0 * value + z0
+            zi[j, 0] = b1 * value - a1 * output + z1
+            zi[j, 1] = b2 * value - a2 * output
+
+            value = output
+
+        return value
+
+def refine(sos, values, timestamps):
+    """
+    Zero-phase filtering of a trailing window of samples (bounded-lag refinement of the streaming filter)
+
+    # Arguments
+
+    - sos (numpy.ndarray of shape (n, 6)): second-order sections of the filter
+    - values (numpy.ndarray of shape (n,)): raw values of the window
+    - timestamps (numpy.ndarray of shape (n,)): timestamps of the window
+
+    # Returns
+
+    - (numpy.ndarray of shape (n,), numpy.ndarray of shape (n,)): filtered values and their absolute gradient
+    """
+
+    filtered = sosfiltfilt(sos, values)
+
+    gradient = numpy.abs(numpy.gradient(filtered, timestamps))
+
+    return filtered, gradient
@@ -0,0 +1,412 @@
+# - Libraries
+
+# - - Sensor
+from sensor import SlidingShiftClass
+# - - Mathematical
+import numpy
+from scipy.signal import sosfiltfilt
+import matplotlib
+import matplotlib.pyplot as plt
+# - - Logging
+import logging
+import traceback
+
+import localization
+
+import metrics
+
+from filtering import get_sos
+
+from plot import plot_source_position, SensorsPlotClass, BlitRendererClass
+
+import tkinter as tk
+from tkinter import ttk
+
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+# - Global variables
+sensors = {}    # Sensors dictionary (shared with the processing service)
+sliding_shifts = {}     # Incremental sliding shifts by (sensor identifier, gaz sensor type)
+
+# - Functions
+
+def get_sensors_position(sensors):
+    """
+    Get the sensors position
+
+    # Arguments
+
+    - sensors (Dict): sensors
+
+    # Returns
+
+    - numpy.ndarray: sensors position
+    """
+
+    positions = numpy.zeros((len(sensors), 2))
+
+    for i, (_, sensor) in enumerate(sensors.items()):
+        position = sensor.get_position()
+        positions[i, :] = position
+
+    return positions
+
+def get_sensors_value(gaz_sensor_type):
+    """
+    Get the sensors values
+
+    # Arguments
+
+    - gaz_sensor_type (str): gaz sensor type
+
+    # Returns
+
+    - numpy.ndarray: sensors values for the gaz sensor type for all sensors
+    """
+
+    values = numpy.zeros(len(sensors))
+
+    for i, (_, sensor) in enumerate(sensors.items()):
+        sensor_values = sensor.get_latest_values(gaz_sensor_type)
+        values[i] = sensor_values["concentration_filtered"]
+
+    return values
+
+
+
+def localize_source(axes, strategy="average"):
+    """
+    Localize the source from the latest concentrations of the sensors and plot it
+
+    # Arguments
+
+    - axes (matplotlib.axes.Axes): axes
+    - strategy (str): localization strategy using the concentrations (see `localization.STRATEGIES`)
+
+    # Returns
+
+    - numpy.ndarray: source position
+    """
+
+    try:
+        sensors_value = get_sensors_value("MQ3")
+    except ValueError:
+        logging.debug("No values for MQ3")
+        return
+
+    if sensors_value.shape[0] < 3:
+        print("Not enough sensors")
+        return
+
+    if sensors_value.sum() == 0:
+        print("No gaz detected")
+        return
+
+    source = localization.locate(strategy, get_sensors_position(sensors), values=sensors_value)
+
+    plot_source_position(axes, sensors, source.position)
+
+    return source.position
+
+
+def get_map_size(sensors_position):
+    """
+    Get the map size
+
+    # Arguments
+
+    - sensors_position (numpy.ndarray (N, 2)): sensors position
+
+    # Returns
+
+    - numpy.ndarray (2, 2): map size (min, max)
+    """
+
+    # Get the minimum and maximum values
+    minimum_x = sensors_position[:, 0].min()
+    maximum_x = sensors_position[:, 0].max()
+
+    minimum_y = sensors_position[:, 1].min()
+    maximum_y = sensors_position[:, 1].max()
+
+    # Compute the range
+    range_x = maximum_x - minimum_x
+    range_y = maximum_y - minimum_y
+
+    # Add a 10% margin
+    minimum_x -= range_x * 0.1
+    maximum_x += range_x * 0.1
+
+    minimum_y -= range_y * 0.1
+    maximum_y += range_y * 0.1
+
+    return numpy.array([[minimum_x, minimum_y], [maximum_x, maximum_y]])
+
+
+def plot_gradient(axes, gaz_sensor_type):
+    """
+    Plot the sensor growth
+
+    # Argumentsmq3 alcohol sensor library
+
+    - axes ([matplotlib.axes.Axes]): axes
+    - gaz_sensor_type (str): gaz sensor type    
+    """
+
+    axes[0].clear()
+    axes[0].set_title(f"Sensor gradient for {gaz_sensor_type}")
+    axes[0].set_xlabel("Time (s)")
+    axes[0].set_ylabel("Value")
+
+    if len(axes) > 1:
+        axes[1].clear()
+        axes[1].set_title(f"Sensor double gradient for {gaz_sensor_type}")
+        axes[1].set_xlabel("Time (s)")
+        axes[1].set_ylabel("Value")
+
+    butterworth = get_sos(4, 0.05)
+
+    def plot_function(name, sensor, axes):
+
+        data = sensor.get_all_values(gaz_sensors_type=gaz_sensor_type, scale=False)
+      
+
+        #data = StandardScaler().fit_transform(data["value"].to_numpy().reshape(-1, 1)).flatten()
+
+        # Ignore empty data
+        if data.shape[0] < 16:
+            return
+
+        values = sosfiltfilt(butterworth, data["value"].to_numpy())
+
+        #values = StandardScaler().fit_transform(values.reshape(-1, 1)).flatten()
+
+        #scaled_values = MinMaxScaler().fit_transform(data["value"].to_numpy().reshape(-1, 1)).flatten()
+
+        #scaled_values = data["value"].to_numpy()
+
+        gradient = numpy.gradient(values, data["time"].to_numpy()/1000)
+
+        from sklearn.preprocessing import StandardScaler
+
+        gradient = StandardScaler().fit_transform(gradient.reshape(-1, 1)).flatten()
+
+        #gradient = numpy.convolve(gradient, numpy.ones(10)/10, mode='valid')
+
+        label = f"{name} {sensor.get_position()}"
+        
+        axes[0].plot(data["time"]/1000, gradient, label=label)
+                
+        if len(axes) > 1:
+            double_gradient = numpy.gradient(gradient, data["time"].to_numpy()/1000)
+            
+            axes[1].plot(data["time"]/1000, double_gradient, label=label)
+          
+    iterate_sensors(axes, plot_function)
+
+    if axes[0].get_legend() is not None:
+        axes[0].legend()
+    if len(axes) > 1 and axes[1].get_legend() is not None:
+        axes[1].legend()
+
+def plot_shift(axes, gaz_sensor_type, window_size=50, hop_size=5):
+    """
+    Plot the sensor shift
+
+    # Arguments
+
+    - axes (matplotlib.axes.Axes): axes
+    - gaz_sensor_type (str): gaz sensor type    
+    - window_size (int): size of the sliding window in samples
+    - hop_size (int): number of samples between two windows
+    """
+
+    axes.clear()
+    axes.set_title(f"Sensor shift for {gaz_sensor_type}")
+    axes.set_xlabel("Time (s)")
+    axes.set_ylabel("Value")
+
+    axes.set_ylim(-500, 500)
+
+    reference_sensor_data = None
+
+    for name, sensor in sensors.items():
+        sensor_data = sensor.get_all_values(gaz_sensors_type=gaz_sensor_type)
+
+        if sensor_data.shape[0] < window_size:
+            continue
+
+        if reference_sensor_data is None:
+            reference_sensor_data = sensor_data
+
+        # The sliding shifts are updated incrementally with the new samples since the previous plot
+        key = (name, gaz_sensor_type)
+
+        if key not in sliding_shifts:
+            sliding_shifts[key] = SlidingShiftClass(window_size, hop_size)
+
+        shift_values, shift_time = sliding_shifts[key].update(reference_sensor_data["raw_value_filtered"], reference_sensor_data["time"], sensor_data["raw_value_filtered"], sensor_data["time"])
+
+        label = f"{name} {sensor.get_position()}"
+
+        axes.plot(shift_time/1000, shift_values, label=label)
+
+
+        time_difference = numpy.diff(sensor_data["time"])
+
+        logging.debug(f"Average time difference for {name} : {(time_difference.mean() / 1000):.2f} s")
+
+
+    if axes.get_legend() is not None:
+        axes.legend()
+
+    #plt.plot(block=False)
+
+   
+
+def run_interface(processing):
+    """
+    Run the user interface, displaying the sensors and the results of the processing service until the window is closed
+
+    # Arguments
+
+    - processing (ProcessingClass): the processing service (running in its own thread)
+    """
+
+    global sensors
+
+    sensors = processing.sensors
+
+    run = True
+
+    # - Create the interface
+    window = tk.Tk()    
+    window.title("Gaz analyzer")
+    window.attributes('-zoomed', True)
+    notebook = ttk.Notebook(window)
+    notebook.pack(expand=1, fill='both')
+    
+    # - Create the figure and the canvas        
+    # - - Signals
+    signals_frame = ttk.Frame(notebook)
+    notebook.add(signals_frame, text="Signals")
+    signals_figure = matplotlib.figure.Figure(dpi=100)
+    signals_subplots = signals_figure.subplots(1, 3)
+    signals_canvas = FigureCanvasTkAgg(signals_figure, signals_frame)
+    signals_renderer = BlitRendererClass(signals_canvas, [
+        SensorsPlotClass(signals_subplots[0], "MQ3", "raw_value"),
+        SensorsPlotClass(signals_subplots[1], "MQ3", "resistance"),
+        SensorsPlotClass(signals_subplots[2], "MQ3", "concentration"),
+    ])
+    
+    # - - Filtering
+    filtering_frame = ttk.Frame(notebook)
+    notebook.add(filtering_frame, text="Gradient")
+    filtering_figure = matplotlib.figure.Figure(dpi=100)
+    filtering_canvas = FigureCanvasTkAgg(filtering_figure, filtering_frame)
+    filtering_axes = filtering_figure.subplots(1, 2)
+    filtering_renderer = BlitRendererClass(filtering_canvas, [
+        SensorsPlotClass(filtering_axes[0], "MQ3", "raw_value_filtered"),
+        SensorsPlotClass(filtering_axes[1], "MQ3", "raw_value_filtered_gradient"),
+    ])
+
+    # - - Weight extraction
+    weight_extraction_frame = ttk.Frame(notebook)
+    notebook.add(weight_extraction_frame, text="Weight extraction")
+    weight_extraction_figure = matplotlib.figure.Figure(dpi=100)
+    weight_extraction_canvas = FigureCanvasTkAgg(weight_extraction_figure, weight_extraction_frame)
+    weight_extraction_subplots = [weight_extraction_figure.subplots(1, 1)]
+
+    # - - Localization
+    localization_frame = ttk.Frame(notebook)
+    notebook.add(localization_frame, text="Localization")
+    localization_figure = matplotlib.figure.Figure(dpi=100)
+    localization_canvas = FigureCanvasTkAgg(localization_figure, localization_frame)
+    localization_subplots = localization_figure.subplots(1, 1)
+    plot_source_position(localization_subplots, sensors, None)
+
+    sensors_position = get_sensors_position(sensors)
+    map_size = get_map_size(sensors_position)
+
+    def close():
+        nonlocal run
+        run = False
+
+    window.protocol("WM_DELETE_WINDOW", close)
+
+    plotted_excited_signals = None
+
+    draw_latencies = {tab: metrics.REGISTRY.histogram("gaz_draw_latency_seconds", "Drawing time of the interface tabs", tab=tab) for tab in ["signals", "gradient", "weight_extraction", "localization"]}
+
+    # - Main loop
+    while run:
+        mq3_excited_signals = processing.excited_signals
+        source = processing.source
+
+        try:
+            selected_tab = notebook.select()
+
+            if selected_tab == str(signals_frame):
+                # Only the lines of the sensors with new samples are redrawn
+                with draw_latencies["signals"].time():
+                    signals_renderer.draw(sensors)
+                #plot_sensor_values(mq136_axes, "MQ136")
+                #plot_sensor_spectrum([mq3_spectrum_before_axes, mq3_spectrum_after_axes], "MQ3")
+                #plot_shift(shift_axes, "MQ3")
+                
+                signals_canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+
+            elif selected_tab == str(filtering_frame):
+
+                with draw_latencies["gradient"].time():
+                    filtering_renderer.draw(sensors)
+
+                filtering_canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+
+            elif selected_tab == str(weight_extraction_frame):
+
+             
+                # The excited signals are memoized by the processing, only redraw when they changed
+                if mq3_excited_signals is not plotted_excited_signals:
+                    plotted_excited_signals = mq3_excited_signals
+
+                    weight_extraction_subplots[0].clear()
+                    weight_extraction_subplots[0].set_title("Excited sensors signals")
+
+                    for name, signal in mq3_excited_signals.items():
+                        weight_extraction_subplots[0].plot(signal["time"]/1000, signal["value"], label=name)
+
+                    if bool(mq3_excited_signals):
+                        weight_extraction_subplots[0].legend()
+
+                    weight_extraction_figure.tight_layout()
+
+                    with draw_latencies["weight_extraction"].time():
+                        weight_extraction_canvas.draw()
+                weight_extraction_canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+
+            elif selected_tab == str(localization_frame):
+
+                if bool(mq3_excited_signals) and source is not None:
+                    plot_source_position(localization_subplots, sensors, source.position)
+
+                localization_figure.tight_layout()
+
+                with draw_latencies["localization"].time():
+                    localization_canvas.draw()
+                localization_canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+
+                
+
+        except Exception as e:
+            run = False
+            
+            logging.error(f"An unexpected error occured : {e}")
+            traceback.print_exc()
+            break  
+
+        window.update()
+
+        plt.pause(0.1)
+
+    window.destroy()
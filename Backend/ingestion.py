@@ -0,0 +1,161 @@
+# - Libraries
+
+# - - Threading
+import threading
+import queue
+# - - Logging
+import logging
+import traceback
+
+import metrics
+
+from payloads import decode_payloads
+
+class IngestionClass:
+    def __init__(self, update_sensors_callback, queue_size=4096, batch_size=512):
+        """
+        Ingestion pipeline decoupling the MQTT network thread from the processing
+
+        The MQTT callback only enqueues the raw payloads in a bounded queue (dropping them when the queue is full),
+        a consumer thread drains the queue in batches, decodes them and calls the update callback once per batch.
+
+        # Arguments
+
+        - update_sensors_callback (function): called with the decoded samples of a batch (see `decode_payloads`)
+        - queue_size (int): maximum number of payloads waiting in the queue
+        - batch_size (int): maximum number of payloads processed at once
+
+        # Returns
+
+        - IngestionClass: The ingestion pipeline
+        """
+
+        self.update_sensors_callback = update_sensors_callback
+        self.batch_size = batch_size
+
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        # - Metrics
+        self.received = 0
+        self.dropped = 0
+        self.decode_errors = 0
+        self.batches = 0
+        self.processed = 0
+        self.last_batch_size = 0
+        self.maximum_batch_size = 0
+        self.maximum_depth = 0
+
+        self.decode_latency = metrics.REGISTRY.histogram("gaz_stage_latency_seconds", "Latency of the processing stages", stage="decode")
+
+        self.running = False
+        self.thread = None
+
+    def put(self, payload):
+        """
+        Enqueue a raw payload, called from the MQTT network thread
+
+        # Arguments
+
+        - payload (bytes): raw payload
+
+        # Returns
+
+        - bool: True if the payload was enqueued, False if it was dropped because the queue is full
+        """
+
+        self.received += 1
+
+        try:
+            self.queue.put_nowait(payload)
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        return True
+
+    def start(self):
+        """
+        Start the consumer thread
+        """
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="Ingestion", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the consumer thread, the payloads still in the queue are processed before
+        """
+
+        self.running = False
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        while self.running or not self.queue.empty():
+            try:
+                payload = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            self.maximum_depth = max(self.maximum_depth, self.queue.qsize() + 1)
+
+            # Drain the queue up to the batch size
+            batch = [payload]
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self.process(batch)
+
+    def process(self, batch):
+        """
+        Decode a batch of payloads and forward the samples to the update callback
+
+        # Arguments
+
+        - batch (list of bytes): raw payloads
+        """
+
+        with self.decode_latency.time():
+            samples, errors = decode_payloads(batch)
+
+        self.decode_errors += errors
+        self.batches += 1
+        self.processed += len(batch)
+        self.last_batch_size = len(batch)
+        self.maximum_batch_size = max(self.maximum_batch_size, len(batch))
+
+        try:
+            self.update_sensors_callback(samples)
+        except Exception as e:
+            logging.error(f"An error occured while processing a batch of {len(batch)} payloads : {e}")
+            traceback.print_exc()
+
+    def get_metrics(self):
+        """
+        Get the backpressure metrics of the pipeline
+
+        # Returns
+
+        - dict: queue depth and capacity, received/dropped/processed payloads, decode errors and batch sizes
+        """
+
+        return {
+            "depth": self.queue.qsize(),
+            "maximum_depth": self.maximum_depth,
+            "capacity": self.queue.maxsize,
+            "received": self.received,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "decode_errors": self.decode_errors,
+            "batches": self.batches,
+            "last_batch_size": self.last_batch_size,
+            "mean_batch_size": self.processed / self.batches if self.batches > 0 else 0,
+            "maximum_batch_size": self.maximum_batch_size,
+        }
@@ -1,88 +1,449 @@
 import numpy
+import time
 from scipy.optimize import least_squares, minimize
-from scipy.spatial import Delaunay
 
 def triangulation(points, weights):
     """
-    Triangulation algorithm
+    Triangulation algorithm: the source is located in the triangle of the Delaunay triangulation of the points
+    whose vertices have the largest total weight, at the barycenter of the vertices weighted by their weights
 
     # Arguments
 
-    - points (numpy.ndarray of shape (n, 2)): points
-    - weights (numpy.ndarray of shape (n,)): weights
+    - points (numpy.ndarray of shape (n, 2)): points (n >= 3, not all aligned)
+    - weights (numpy.ndarray of shape (n,)): non-negative weights (e.g. concentrations)
 
     # Returns
 
-    - numpy.ndarray of shape (2,): position    
+    - numpy.ndarray of shape (2,): position
     """
 
+    from scipy.spatial import Delaunay
+
     # Create the Delaunay triangulation
     triangles = Delaunay(points)
 
-    # Find the triangle that contains the point
-    triangle_index = triangles.find_simplex(weights)
-
-    # Get the triangle vertices
-    triangle = triangles.simplices[triangle_index]
+    # Find the triangle with the largest weights
+    triangle = triangles.simplices[numpy.argmax(weights[triangles.simplices].sum(axis=1))]
 
-    # Get the triangle points
-    triangle_points = points[triangle]
+    # The barycentric coordinates are the normalized weights of the vertices
+    triangle_weights = weights[triangle]
 
-    # Calculate the barycentric coordinates
-    barycentric = numpy.linalg.solve(triangle_points.T, weights - triangle_points[0])
+    if triangle_weights.sum() > 0:
+        barycentric = triangle_weights / triangle_weights.sum()
+    else:
+        barycentric = numpy.full(3, 1 / 3)
 
     # Calculate the position
-    position = numpy.dot(barycentric, triangle_points)
+    return barycentric @ points[triangle]
 
-    return position
-    
-
-def trilateration(sensors, shifts):
+def locate_average(positions, weights):
     """
-    Trilateration algorithm based on TDOA (Time Difference of Arrival) and the least squares optimization
+    Weighted centroid of the sensors positions
 
     # Arguments
 
-    - points (numpy.ndarray of shape (n, 2)): points
-    - time_differences (numpy.ndarray of shape (n,)): time differences
-    - function (function): function to optimize
+    - positions (numpy.ndarray of shape (n, 2)): sensors positions
+    - weights (numpy.ndarray of shape (n,)): non-negative weights, the centroid is used if they are all null
 
     # Returns
 
     - numpy.ndarray of shape (2,): position
     """
 
-    positions = numpy.zeros((len(sensors), 2))
-    sshifts = numpy.zeros(len(sensors))
+    if numpy.sum(weights) == 0:
+        return numpy.mean(positions, axis=0)
+
+    return numpy.average(positions, axis=0, weights=weights)
+
+def concentration_residuals(parameters, positions, log_values):
+    """
+    Residuals of the diffusion model log(C_i) = c - r_i^2 / s, where r_i is the distance from the sensor to the source
+    and s = 4 D t (the ratio of two concentrations only depends on the source position and s)
+
+    # Arguments
+
+    - parameters (numpy.ndarray of shape (4,)): source position (x, y), log(s) and c
+    - positions (numpy.ndarray of shape (n, 2)): sensors positions
+    - log_values (numpy.ndarray of shape (n,)): logarithm of the concentrations
+
+    # Returns
+
+    - numpy.ndarray of shape (n,): residuals
+    """
+
+    x, y, log_s, c = parameters
+
+    squared_distances = (positions[:, 0] - x)**2 + (positions[:, 1] - y)**2
+
+    return c - squared_distances * numpy.exp(-log_s) - log_values
+
+def locate_optimization(positions, values):
+    """
+    Localize the source by fitting the concentration ratios of the sensors to the diffusion model (see `concentration_residuals`)
+
+    # Arguments
+
+    - positions (numpy.ndarray of shape (n, 2)): sensors positions
+    - values (numpy.ndarray of shape (n,)): concentrations, at least 4 of them positive
+
+    # Returns
+
+    - LocalizationResultClass: the localization result (the parameters of the covariance are x, y, log(s) and c)
+    """
+
+    positive = values > 0
+
+    if positive.sum() < 4:
+        raise ValueError(f"The concentration model needs at least 4 positive concentrations, got {positive.sum()}")
+
+    positions = positions[positive]
+    log_values = numpy.log(values[positive])
+
+    spread = numpy.ptp(positions, axis=0).sum()
+    initial_guess = numpy.append(locate_average(positions, numpy.sqrt(values[positive])), [numpy.log(max(spread, 1e-9)**2), log_values.max()])
+
+    result = least_squares(concentration_residuals, initial_guess, args=(positions, log_values), method="lm")
+
+    return LocalizationResultClass(result.x[:2], numpy.nan, get_covariance(result), result.cost, result.success)
+
+class LocalizationResultClass:
+    def __init__(self, position, k, covariance, cost, success):
+        """
+        Result of a localization
+
+        # Arguments
+
+        - position (numpy.ndarray of shape (2,)): estimated source position
+        - k (float): estimated propagation coefficient, NaN if the strategy does not estimate it
+        - covariance (numpy.ndarray of shape (m, m)): covariance of the parameters, the position first, NaN when it can not be estimated
+        - cost (float): half of the sum of the squared residuals at the solution
+        - success (bool): True if the solver converged
+
+        # Returns
+
+        - LocalizationResultClass: the localization result
+        """
+
+        self.position = position
+        self.k = k
+        self.covariance = covariance
+        self.cost = cost
+        self.success = success
+
+    def get_uncertainty(self):
+        """
+        Get the standard deviation of the estimated position
+
+        # Returns
+
+        - numpy.ndarray of shape (2,): standard deviation of x and y
+        """
+
+        return numpy.sqrt(numpy.diag(self.covariance)[:2])
+
+    def __str__(self):
+        return f"({self.position[0]:.2f} ± {self.get_uncertainty()[0]:.2f}, {self.position[1]:.2f} ± {self.get_uncertainty()[1]:.2f}), k = {self.k:.3f}"
+
+def get_sensors_positions_and_shifts(sensors, shifts):
+    """
+    Get the positions and the shifts of the sensors in the order of the shifts
+
+    # Arguments
+
+    - sensors (dict): sensors by name
+    - shifts (dict): shifts by sensor name, the first one being the reference
+
+    # Returns
+
+    - (numpy.ndarray of shape (n, 2), numpy.ndarray of shape (n,)): positions and shifts
+    """
+
+    positions = numpy.array([sensors[name].get_position() for name in shifts], dtype=float)
+    shifts = numpy.array([shifts[name] for name in shifts], dtype=float)
+
+    return positions, shifts
+
+def get_arrival_times(shifts):
+    """
+    Get the arrival terms of the TDOA model from the shifts
+
+    The gas diffuses, so the distance grows with the square root of the time. The square root is signed
+    so that sensors reached before the reference (negative shifts) are supported.
+
+    # Arguments
+
+    - shifts (numpy.ndarray of shape (n,)): shifts relative to the reference sensor
+
+    # Returns
+
+    - numpy.ndarray of shape (n,): arrival terms
+    """
+
+    return numpy.sign(shifts) * numpy.sqrt(numpy.abs(shifts))
+
+def tdoa_residuals(parameters, positions, arrival_times):
+    """
+    Residuals of the TDOA model for each sensor relative to the first one
+
+    # Arguments
+
+    - parameters (numpy.ndarray of shape (3,)): source position (x, y) and propagation coefficient k
+    - positions (numpy.ndarray of shape (n, 2)): sensors positions
+    - arrival_times (numpy.ndarray of shape (n,)): arrival terms (see `get_arrival_times`)
+
+    # Returns
+
+    - numpy.ndarray of shape (n - 1,): residuals
+    """
+
+    x, y, k = parameters
+
+    distances = numpy.hypot(positions[:, 0] - x, positions[:, 1] - y)
+
+    return (distances[1:] - distances[0]) / k - (arrival_times[1:] - arrival_times[0])
+
+def tdoa_jacobian(parameters, positions, arrival_times):
+    """
+    Analytic Jacobian of `tdoa_residuals`
+
+    # Arguments
+
+    - parameters (numpy.ndarray of shape (3,)): source position (x, y) and propagation coefficient k
+    - positions (numpy.ndarray of shape (n, 2)): sensors positions
+    - arrival_times (numpy.ndarray of shape (n,)): arrival terms (see `get_arrival_times`)
+
+    # Returns
+
+    - numpy.ndarray of shape (n - 1, 3): derivatives of the residuals with respect to (x, y, k)
+    """
+
+    x, y, k = parameters
+
+    differences = numpy.array([x, y]) - positions
+    distances = numpy.maximum(numpy.hypot(differences[:, 0], differences[:, 1]), 1e-12)
+
+    # Unit vectors from each sensor to the source (derivative of the distance)
+    directions = differences / distances[:, numpy.newaxis]
+
+    jacobian = numpy.empty((positions.shape[0] - 1, 3))
+    jacobian[:, :2] = (directions[1:] - directions[0]) / k
+    jacobian[:, 2] = -(distances[1:] - distances[0]) / k**2
+
+    return jacobian
+
+def get_covariance(result):
+    """
+    Get the covariance of the parameters of a least squares solution, from the Gauss-Newton approximation
+    of the Hessian scaled by the residual variance
+
+    # Arguments
+
+    - result (scipy.optimize.OptimizeResult): result of `least_squares`
+
+    # Returns
+
+    - numpy.ndarray of shape (m, m): covariance, NaN if there are not more residuals than parameters
+    """
+
+    degrees_of_freedom = result.fun.shape[0] - result.x.shape[0]
+
+    if degrees_of_freedom <= 0:
+        return numpy.full((result.x.shape[0], result.x.shape[0]), numpy.nan)
+
+    residual_variance = 2 * result.cost / degrees_of_freedom
+
+    return numpy.linalg.pinv(result.jac.T @ result.jac) * residual_variance
+
+def get_search_region(positions, margin=1.0):
+    """
+    Get the region where the source is searched: the sensors bounding box widened on each side by a fraction of its largest side
+
+    # Arguments
+
+    - positions (numpy.ndarray of shape (n, 2)): sensors positions
+    - margin (float): width added on each side, relative to the largest side of the bounding box
+
+    # Returns
+
+    - (numpy.ndarray of shape (2,), numpy.ndarray of shape (2,)): minimum and maximum corners of the region
+    """
+
+    minimum = positions.min(axis=0)
+    maximum = positions.max(axis=0)
+
+    padding = margin * max(float(numpy.max(maximum - minimum)), 1e-9)
+
+    return minimum - padding, maximum + padding
+
+def is_inside(position, region):
+    """
+    Check if a position is in a region (see `get_search_region`)
+
+    # Returns
+
+    - bool: True if the position is finite and in the region
+    """
+
+    minimum, maximum = region
+
+    return bool(numpy.all(position >= minimum) and numpy.all(position <= maximum))
+
+def solve_tdoa(positions, shifts, initial_guess=None):
+    """
+    Solve the TDOA equations with a bounded least squares (trust region reflective) and the analytic Jacobian
+
+    The position is bounded to the search region (see `get_search_region`), a solution stopped on its border
+    is a diverging solve and is not a success.
+
+    # Arguments
+
+    - positions (numpy.ndarray of shape (n, 2)): sensors positions, the first one being the reference
+    - shifts (numpy.ndarray of shape (n,)): shifts relative to the reference sensor
+    - initial_guess (numpy.ndarray of shape (3,)): initial (x, y, k), defaults to the sensors centroid and k = 1
+
+    # Returns
+
+    - LocalizationResultClass: the localization result
+    """
+
+    arrival_times = get_arrival_times(shifts)
+
+    minimum, maximum = get_search_region(positions)
+
+    if initial_guess is None:
+        initial_guess = numpy.append(numpy.mean(positions, axis=0), 1)
+    else:
+        # The initial guess must be feasible (e.g. a warm start from another sensors layout)
+        initial_guess = numpy.append(numpy.clip(initial_guess[:2], minimum, maximum), max(initial_guess[2], 1e-9))
+
+    result = least_squares(tdoa_residuals, initial_guess, jac=tdoa_jacobian, args=(positions, arrival_times),
+        bounds=([minimum[0], minimum[1], 1e-9], [maximum[0], maximum[1], numpy.inf]), method="trf")
+
+    success = result.success and not result.active_mask[:2].any()
+
+    return LocalizationResultClass(result.x[:2], result.x[2], get_covariance(result), result.cost, success)
+
+def search_tdoa(positions, shifts, seeds, iterations=100, tolerance=1e-10):
+    """
+    Solve the TDOA equations from several initial guesses at once: a Levenberg-Marquardt iteration vectorized over the
+    seeds (one residuals and Jacobian evaluation for all of them per iteration), with the position clipped to the
+    search region (see `get_search_region`)
+
+    The solutions are meant to select the best seed, to be refined with `solve_tdoa`.
+
+    # Arguments
+
+    - positions (numpy.ndarray of shape (n, 2)): sensors positions, the first one being the reference
+    - shifts (numpy.ndarray of shape (n,)): shifts relative to the reference sensor
+    - seeds (numpy.ndarray of shape (s, 3)): initial (x, y, k)
+    - iterations (int): maximum number of iterations
+    - tolerance (float): relative decrease of the cost below which a seed has converged
+
+    # Returns
+
+    - (numpy.ndarray of shape (s, 3), numpy.ndarray of shape (s,), numpy.ndarray of shape (s,)): parameters, costs, and
+      True for the solutions stopped on the border of the search region
+    """
+
+    arrival_times = get_arrival_times(shifts)
+    time_differences = arrival_times[1:] - arrival_times[0]
+
+    minimum, maximum = get_search_region(positions)
+    lower = numpy.array([minimum[0], minimum[1], 1e-9])
+    upper = numpy.array([maximum[0], maximum[1], numpy.inf])
 
-    for i, sensor_name in enumerate(shifts):
-        print(f"Sensor name: {sensor_name}")
+    def evaluate(parameters):
+        differences = parameters[:, numpy.newaxis, :2] - positions
+        distances = numpy.maximum(numpy.hypot(differences[..., 0], differences[..., 1]), 1e-12)
+        k = parameters[:, 2:]
 
-        positions[i] = sensors[sensor_name].get_position()
-        sshifts[i] = shifts[sensor_name]
+        residuals = (distances[:, 1:] - distances[:, :1]) / k - time_differences
 
-    print(f"Positions: {positions}")
+        return residuals, differences, distances
 
-    print(f"Shifts: {sshifts}")
+    parameters = numpy.clip(numpy.array(seeds, dtype=float), lower, upper)
+    residuals, differences, distances = evaluate(parameters)
+    costs = 0.5 * (residuals**2).sum(axis=1)
+
+    damping = numpy.full(parameters.shape[0], 1e-3)
+    active = numpy.ones(parameters.shape[0], dtype=bool)
+
+    for _ in range(iterations):
+        k = parameters[:, 2:]
+
+        # Jacobian of the residuals of every seed (see `tdoa_jacobian`)
+        directions = differences / distances[..., numpy.newaxis]
+
+        jacobian = numpy.empty(residuals.shape + (3,))
+        jacobian[..., :2] = (directions[:, 1:] - directions[:, :1]) / k[..., numpy.newaxis]
+        jacobian[..., 2] = -(distances[:, 1:] - distances[:, :1]) / k**2
+
+        hessian = jacobian.transpose(0, 2, 1) @ jacobian
+        gradient = (jacobian.transpose(0, 2, 1) @ residuals[..., numpy.newaxis])[..., 0]
+
+        # Marquardt scaling of the damping by the diagonal of the Gauss-Newton Hessian
+        diagonal = numpy.diagonal(hessian, axis1=1, axis2=2)
+        damped = hessian + (damping[:, numpy.newaxis] * numpy.maximum(diagonal, 1e-12))[..., numpy.newaxis] * numpy.eye(3)
+
+        steps = -numpy.linalg.solve(damped, gradient[..., numpy.newaxis])[..., 0]
+        candidates = numpy.clip(parameters + steps * active[:, numpy.newaxis], lower, upper)
+
+        candidate_residuals, candidate_differences, candidate_distances = evaluate(candidates)
+        candidate_costs = 0.5 * (candidate_residuals**2).sum(axis=1)
+
+        accepted = active & (candidate_costs < costs)
+        converged = accepted & (costs - candidate_costs <= tolerance * costs)
+
+        parameters[accepted] = candidates[accepted]
+        residuals[accepted] = candidate_residuals[accepted]
+        differences[accepted] = candidate_differences[accepted]
+        distances[accepted] = candidate_distances[accepted]
+        costs[accepted] = candidate_costs[accepted]
+
+        damping = numpy.where(accepted, damping / 3, damping * 2)
+
+        # The seeds whose step is rejected with a large damping can not decrease the cost any more
+        active &= ~converged & (damping < 1e10)
+
+        if not active.any():
+            break
+
+    on_border = ((parameters[:, :2] <= minimum) | (parameters[:, :2] >= maximum)).any(axis=1)
+
+    return parameters, costs, on_border
+
+def solve_tdoa_nelder_mead(positions, shifts):
+    """
+    Solve the TDOA equations by minimizing the scalar sum of the squared residuals with Nelder-Mead (previous solver, kept for comparison)
+
+    # Arguments
+
+    - positions (numpy.ndarray of shape (n, 2)): sensors positions, the first one being the reference
+    - shifts (numpy.ndarray of shape (n,)): shifts relative to the reference sensor
+
+    # Returns
+
+    - LocalizationResultClass: the localization result (without covariance)
+    """
+
+    arrival_times = get_arrival_times(shifts)
 
     # Define the equations function to optimize/solve
-    def error_function(params, positions, shifts):
+    def error_function(params, positions, arrival_times):
         def distance_squared(x, y, x_i, y_i):
             return (x - x_i)**2 + (y - y_i)**2
 
         x_source, y_source, k = params
         error = 0
         x_ref, y_ref = positions[0]
-        t_ref = shifts[0]
+        t_ref = arrival_times[0]
         
-        for (x_i, y_i), t_i in zip(positions[1:], shifts[1:]):
+        for (x_i, y_i), t_i in zip(positions[1:], arrival_times[1:]):
             d_ref = numpy.sqrt(distance_squared(x_source, y_source, x_ref, y_ref))
             d_i = numpy.sqrt(distance_squared(x_source, y_source, x_i, y_i))
             predicted_time_diff = (d_i - d_ref) / k
 
-            #print(f"t_ref: {t_ref}, t_i: {t_i}, predicted_time_diff: {predicted_time_diff}")
-
-            actual_time_diff = numpy.sqrt(t_i) - numpy.sqrt(t_ref)
+            actual_time_diff = t_i - t_ref
             error += (predicted_time_diff - actual_time_diff) ** 2
         
         return error
@@ -92,6 +453,319 @@ def trilateration(sensors, shifts):
     initial_guess = numpy.append(initial_guess, 1)
 
     # Optimize/solve the equations
-    result = minimize(error_function, initial_guess, args=(positions, sshifts), method='Nelder-Mead')
+    result = minimize(error_function, initial_guess, args=(positions, arrival_times), method='Nelder-Mead')
+
+    success = result.success and is_inside(result.x[:2], get_search_region(positions))
+
+    return LocalizationResultClass(result.x[:2], result.x[2], numpy.full((3, 3), numpy.nan), result.fun / 2, success)
+
+def trilateration(sensors, shifts, solver=None):
+    """
+    Trilateration algorithm based on TDOA (Time Difference of Arrival) and the least squares optimization
+
+    # Arguments
+
+    - sensors (dict): sensors by name
+    - shifts (dict): shifts by sensor name, the first one being the reference
+    - solver (LocalizationSolverClass or None): solver caching and warm-starting the results, None to solve from scratch
+
+    # Returns
+
+    - LocalizationResultClass: the localization result
+    """
+
+    positions, shifts = get_sensors_positions_and_shifts(sensors, shifts)
+
+    if solver is not None:
+        return solver.solve(positions, shifts)
+
+    return solve_tdoa(positions, shifts)
+
+# - Localization strategies
+
+STRATEGIES = {}     # (function, input) by name, see `register_strategy`
+
+def register_strategy(name, data):
+    """
+    Register a localization strategy, a function localizing the source from the sensors positions and
+    one measure per sensor
+
+    # Arguments
+
+    - name (str): name of the strategy
+    - data (str): measure used by the strategy, "shifts" (shifts relative to the first sensor, see `get_shifts`)
+      or "values" (concentrations)
+
+    # Returns
+
+    - function: decorator registering a function (positions, data) -> LocalizationResultClass
+    """
+
+    if data not in ("shifts", "values"):
+        raise ValueError(f"Unknown localization data: {data}")
+
+    def decorator(function):
+        STRATEGIES[name] = (function, data)
+        return function
+
+    return decorator
+
+def get_strategy(name):
+    """
+    Get a localization strategy
+
+    # Arguments
+
+    - name (str): name of the strategy
+
+    # Returns
+
+    - (function, str): the strategy function and the measure it uses
+    """
+
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown localization strategy: {name}, available strategies : {list(STRATEGIES.keys())}")
+
+    return STRATEGIES[name]
+
+def get_position_result(position):
+    """
+    Get the result of a strategy which only estimates the position
+
+    # Returns
+
+    - LocalizationResultClass: result without propagation coefficient nor covariance
+    """
+
+    return LocalizationResultClass(numpy.asarray(position, dtype=float), numpy.nan, numpy.full((2, 2), numpy.nan), 0.0, True)
+
+@register_strategy("tdoa", "shifts")
+def locate_tdoa(positions, shifts):
+    return solve_tdoa(positions, shifts)
+
+@register_strategy("tdoa_nelder_mead", "shifts")
+def locate_tdoa_nelder_mead(positions, shifts):
+    return solve_tdoa_nelder_mead(positions, shifts)
+
+@register_strategy("average", "values")
+def locate_average_sqrt(positions, values):
+    # The square root of the concentrations gives the best centroid in the simulations
+    return get_position_result(locate_average(positions, numpy.sqrt(numpy.maximum(values, 0))))
+
+@register_strategy("triangulation", "values")
+def locate_triangulation(positions, values):
+    return get_position_result(triangulation(positions, numpy.maximum(values, 0)))
+
+@register_strategy("optimization", "values")
+def locate_concentrations(positions, values):
+    return locate_optimization(positions, values)
+
+def locate(strategy, positions, shifts=None, values=None):
+    """
+    Localize the source with a registered strategy
+
+    # Arguments
+
+    - strategy (str): name of the strategy (see `STRATEGIES`)
+    - positions (numpy.ndarray of shape (n, 2)): sensors positions
+    - shifts (numpy.ndarray of shape (n,) or None): shifts relative to the first sensor, for the "shifts" strategies
+    - values (numpy.ndarray of shape (n,) or None): concentrations, for the "values" strategies
+
+    # Returns
+
+    - LocalizationResultClass: the localization result
+    """
+
+    function, data = get_strategy(strategy)
+
+    data = shifts if data == "shifts" else values
+
+    if data is None:
+        raise ValueError(f"The {strategy} strategy needs the {STRATEGIES[strategy][1]}")
+
+    return function(positions, data)
+
+def localize(sensors, shifts, values=None, strategy="tdoa", solver=None):
+    """
+    Localize the source from the sensors with a registered strategy
+
+    # Arguments
+
+    - sensors (dict): sensors by name
+    - shifts (dict): shifts by sensor name, the first one being the reference (they also select the sensors)
+    - values (dict or None): concentration by sensor name, for the "values" strategies
+    - strategy (str): name of the strategy (see `STRATEGIES`)
+    - solver (LocalizationSolverClass or None): solver caching and warm-starting the results of the "tdoa" strategy
+
+    # Returns
+
+    - LocalizationResultClass: the localization result
+    """
+
+    positions, shifts_values = get_sensors_positions_and_shifts(sensors, shifts)
+
+    if strategy == "tdoa" and solver is not None:
+        return solver.solve(positions, shifts_values)
+
+    if values is not None:
+        values = numpy.array([values[name] for name in shifts], dtype=float)
+
+    return locate(strategy, positions, shifts_values, values)
+
+class LocalizationSolverClass:
+    def __init__(self, quantization=1.0, cache_size=256, multi_start=False, grid_size=3, restart_cost=1e-2):
+        """
+        TDOA localization solver with result caching, warm starts and an optional multi-start mode
+
+        # Arguments
+
+        - quantization (float): step used to quantize the shifts for the cache key (same unit as the shifts)
+        - cache_size (int): maximum number of cached results
+        - multi_start (bool): also start from a grid of seeds over the sensors bounding box, solved at once by a
+          vectorized search (see `search_tdoa`), and refine the best one
+        - grid_size (int): number of seeds along each axis in multi-start mode
+        - restart_cost (float): cost above which a warm-started solution is solved again from the sensors centroid
+
+        # Returns
+
+        - LocalizationSolverClass: the localization solver
+        """
+
+        self.quantization = quantization
+        self.cache_size = cache_size
+        self.multi_start = multi_start
+        self.grid_size = grid_size
+        self.restart_cost = restart_cost
+
+        self.cache = {}
+        self.previous = None
+
+        # - Counters
+        self.hits = 0
+        self.misses = 0
+        self.solve_time = 0
+        self.last_solve_time = 0
+
+    def get_key(self, positions, shifts):
+        """
+        Get the cache key of a problem
+
+        # Arguments
+
+        - positions (numpy.ndarray of shape (n, 2)): sensors positions
+        - shifts (numpy.ndarray of shape (n,)): shifts relative to the reference sensor
+
+        # Returns
+
+        - tuple: cache key (sensors positions and quantized shifts)
+        """
+
+        quantized = numpy.round(shifts / self.quantization).astype(numpy.int64)
+
+        return (positions.tobytes(), quantized.tobytes())
+
+    def get_seeds(self, positions):
+        """
+        Get the initial guesses of the solver: the previous solution if any, the sensors centroid and,
+        in multi-start mode, a grid over the sensors bounding box
+
+        # Arguments
+
+        - positions (numpy.ndarray of shape (n, 2)): sensors positions
+
+        # Returns
+
+        - list of numpy.ndarray of shape (3,): initial (x, y, k)
+        """
+
+        seeds = []
+
+        if self.previous is not None:
+            seeds.append(numpy.append(self.previous.position, self.previous.k))
+
+        seeds.append(numpy.append(numpy.mean(positions, axis=0), 1))
+
+        if self.multi_start:
+            minimum = positions.min(axis=0)
+            maximum = positions.max(axis=0)
+
+            for x in numpy.linspace(minimum[0], maximum[0], self.grid_size):
+                for y in numpy.linspace(minimum[1], maximum[1], self.grid_size):
+                    seeds.append(numpy.array([x, y, 1]))
+
+        return seeds
+
+    def solve(self, positions, shifts):
+        """
+        Localize the source, returning the cached result if the same problem was already solved
+
+        # Arguments
+
+        - positions (numpy.ndarray of shape (n, 2)): sensors positions, the first one being the reference
+        - shifts (numpy.ndarray of shape (n,)): shifts relative to the reference sensor
+
+        # Returns
+
+        - LocalizationResultClass: the localization result
+        """
+
+        key = self.get_key(positions, shifts)
+
+        if key in self.cache:
+            self.hits += 1
+            return self.cache[key]
+
+        self.misses += 1
+
+        start = time.perf_counter()
+
+        seeds = self.get_seeds(positions)
+
+        if self.multi_start:
+            parameters, costs, on_border = search_tdoa(positions, shifts, numpy.array(seeds))
+
+            # The solutions inside the search region first
+            results = [solve_tdoa(positions, shifts, parameters[numpy.lexsort((costs, on_border))[0]])]
+        elif self.previous is not None:
+            # Warm start, fall back on the centroid if the solver did not converge to a good solution
+            results = [solve_tdoa(positions, shifts, seeds[0])]
+
+            if not results[0].success or results[0].cost > self.restart_cost:
+                results.append(solve_tdoa(positions, shifts, seeds[1]))
+        else:
+            results = [solve_tdoa(positions, shifts, seeds[0])]
+
+        # The solutions inside the search region first
+        result = min(results, key=lambda result: (not result.success, result.cost))
+
+        self.last_solve_time = time.perf_counter() - start
+        self.solve_time += self.last_solve_time
+
+        # Evict the oldest result (dictionaries keep the insertion order)
+        if len(self.cache) >= self.cache_size:
+            del self.cache[next(iter(self.cache))]
+
+        self.cache[key] = result
+        self.previous = result
+
+        return result
+
+    def get_counters(self):
+        """
+        Get the cache and timing counters
+
+        # Returns
+
+        - dict: cache hits and misses, hit rate, total and last solve time (s)
+        """
+
+        requests = self.hits + self.misses
 
-    return result.x
\ No newline at end of file
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests > 0 else 0,
+            "solve_time": self.solve_time,
+            "last_solve_time": self.last_solve_time,
+            "mean_solve_time": self.solve_time / self.misses if self.misses > 0 else 0,
+        }
@@ -0,0 +1,340 @@
+# - Libraries
+
+# - - Networking
+import asyncio
+import struct
+# - - Threading
+import threading
+# - - Logging
+import logging
+
+# - - MQTT packet types (MQTT 3.1.1)
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+def encode_length(length):
+    """
+    Encode the remaining length of a MQTT packet (variable byte integer)
+
+    # Arguments
+
+    - length (int): remaining length
+
+    # Returns
+
+    - bytes: encoded length
+    """
+
+    encoded = bytearray()
+
+    while True:
+        byte = length % 128
+        length //= 128
+
+        encoded.append(byte | 0x80 if length > 0 else byte)
+
+        if length == 0:
+            return bytes(encoded)
+
+def encode_string(string):
+    data = string.encode()
+
+    return struct.pack("!H", len(data)) + data
+
+def encode_packet(packet_type, flags, body):
+    return bytes([packet_type << 4 | flags]) + encode_length(len(body)) + body
+
+def encode_connect(client_identifier, keep_alive=60):
+    """
+    Encode a MQTT 3.1.1 CONNECT packet with a clean session
+
+    # Arguments
+
+    - client_identifier (str): client identifier
+    - keep_alive (int): keep alive interval in seconds
+
+    # Returns
+
+    - bytes: packet
+    """
+
+    return encode_packet(CONNECT, 0, encode_string("MQTT") + bytes([4, 0x02]) + struct.pack("!H", keep_alive) + encode_string(client_identifier))
+
+def encode_publish(topic, payload):
+    """
+    Encode a QoS 0 PUBLISH packet
+
+    # Arguments
+
+    - topic (str): topic
+    - payload (bytes): payload
+
+    # Returns
+
+    - bytes: packet
+    """
+
+    return encode_packet(PUBLISH, 0, encode_string(topic) + payload)
+
+def topic_matches(topic_filter, topic):
+    """
+    Check if a topic matches a topic filter with the "+" (one level) and "#" (remaining levels) wildcards
+
+    # Arguments
+
+    - topic_filter (str): topic filter
+    - topic (str): topic
+
+    # Returns
+
+    - bool: True if the topic matches the filter
+    """
+
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+
+        if i >= len(topic_levels) or (level != "+" and level != topic_levels[i]):
+            return False
+
+    return len(filter_levels) == len(topic_levels)
+
+async def read_packet(reader):
+    """
+    Read a MQTT packet
+
+    # Arguments
+
+    - reader (asyncio.StreamReader): stream
+
+    # Returns
+
+    - (int, int, bytes): packet type, flags and body
+    """
+
+    header = (await reader.readexactly(1))[0]
+
+    length = 0
+    multiplier = 1
+
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length += (byte & 0x7F) * multiplier
+        multiplier *= 128
+
+        if byte & 0x80 == 0:
+            break
+
+    return header >> 4, header & 0x0F, await reader.readexactly(length)
+
+class LoopbackBrokerClass:
+    def __init__(self, host="127.0.0.1", port=0):
+        """
+        Minimal in-process MQTT 3.1.1 broker, a stand-in for a real broker in the benchmarks and the local tests
+
+        It supports the clean sessions, the QoS 0 and 1 publications (delivered with QoS 0), the "+" and "#" wildcards
+        and the shared subscriptions ("$share/<group>/<filter>", each message is delivered to one member of each group
+        in turn). There is no retained message, will, authentication nor persistence.
+
+        # Arguments
+
+        - host (str): listening address
+        - port (int): listening port, 0 for a free port (see `port` once started)
+
+        # Returns
+
+        - LoopbackBrokerClass: the broker (not started)
+        """
+
+        self.host = host
+        self.port = port
+
+        self.subscriptions = {}     # Topic filters by client writer
+        self.shared = {}            # [client writers, next member] by (group, topic filter)
+
+        self.loop = None
+        self.server = None
+        self.thread = None
+
+        # - Metrics
+        self.published = 0
+        self.delivered = 0
+
+    def start(self):
+        """
+        Start the broker in its own thread, returns once it is listening
+        """
+
+        started = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.handle, self.host, self.port))
+            self.port = self.server.sockets[0].getsockname()[1]
+
+            started.set()
+
+            self.loop.run_forever()
+
+            self.server.close()
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, name="Loopback broker", daemon=True)
+        self.thread.start()
+
+        started.wait()
+
+        logging.info(f"Loopback MQTT broker listening on {self.host}:{self.port}")
+
+    def stop(self):
+        if self.thread is None:
+            return
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.thread = None
+
+    def subscribe(self, writer, topic_filter):
+        if topic_filter.startswith("$share/"):
+            _, group, topic_filter = topic_filter.split("/", 2)
+
+            members = self.shared.setdefault((group, topic_filter), [[], 0])
+
+            if writer not in members[0]:
+                members[0].append(writer)
+        else:
+            self.subscriptions.setdefault(writer, set()).add(topic_filter)
+
+    def unsubscribe(self, writer, topic_filter=None):
+        if topic_filter is None:
+            self.subscriptions.pop(writer, None)
+
+            for members in self.shared.values():
+                if writer in members[0]:
+                    members[0].remove(writer)
+
+        elif topic_filter.startswith("$share/"):
+            _, group, topic_filter = topic_filter.split("/", 2)
+
+            members = self.shared.get((group, topic_filter))
+
+            if members is not None and writer in members[0]:
+                members[0].remove(writer)
+        else:
+            self.subscriptions.get(writer, set()).discard(topic_filter)
+
+    def get_receivers(self, topic):
+        """
+        Get the clients receiving a message
+
+        # Arguments
+
+        - topic (str): topic of the message
+
+        # Returns
+
+        - list of asyncio.StreamWriter: receivers (at most once each)
+        """
+
+        receivers = [writer for writer, topic_filters in self.subscriptions.items() if any(topic_matches(topic_filter, topic) for topic_filter in topic_filters)]
+
+        for (group, topic_filter), members in self.shared.items():
+            if members[0] and topic_matches(topic_filter, topic):
+                members[1] = (members[1] + 1) % len(members[0])
+
+                if members[0][members[1]] not in receivers:
+                    receivers.append(members[0][members[1]])
+
+        return receivers
+
+    async def publish(self, topic, payload):
+        packet = encode_publish(topic, payload)
+
+        self.published += 1
+
+        for writer in self.get_receivers(topic):
+            writer.write(packet)
+            self.delivered += 1
+
+            # Slow subscribers slow the publishers down instead of growing the buffers
+            if writer.transport.get_write_buffer_size() > 1 << 20:
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+
+    async def handle(self, reader, writer):
+        try:
+            packet_type, _, _ = await read_packet(reader)
+
+            if packet_type != CONNECT:
+                return
+
+            writer.write(encode_packet(CONNACK, 0, b"\x00\x00"))
+
+            while True:
+                packet_type, flags, body = await read_packet(reader)
+
+                if packet_type == PUBLISH:
+                    qos = (flags >> 1) & 0x03
+
+                    length = struct.unpack("!H", body[:2])[0]
+                    topic = body[2:2 + length].decode()
+                    offset = 2 + length
+
+                    if qos > 0:
+                        writer.write(encode_packet(PUBACK, 0, body[offset:offset + 2]))
+                        offset += 2
+
+                    await self.publish(topic, body[offset:])
+
+                elif packet_type == SUBSCRIBE:
+                    packet_identifier = body[:2]
+                    offset = 2
+                    granted = bytearray()
+
+                    while offset < len(body):
+                        length = struct.unpack("!H", body[offset:offset + 2])[0]
+                        self.subscribe(writer, body[offset + 2:offset + 2 + length].decode())
+
+                        offset += 3 + length    # The requested QoS is ignored
+                        granted.append(0)
+
+                    writer.write(encode_packet(SUBACK, 0, packet_identifier + bytes(granted)))
+
+                elif packet_type == UNSUBSCRIBE:
+                    packet_identifier = body[:2]
+                    offset = 2
+
+                    while offset < len(body):
+                        length = struct.unpack("!H", body[offset:offset + 2])[0]
+                        self.unsubscribe(writer, body[offset + 2:offset + 2 + length].decode())
+
+                        offset += 2 + length
+
+                    writer.write(encode_packet(UNSUBACK, 0, packet_identifier))
+
+                elif packet_type == PINGREQ:
+                    writer.write(encode_packet(PINGRESP, 0, b""))
+
+                elif packet_type == DISCONNECT:
+                    break
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.unsubscribe(writer)
+            writer.close()
@@ -0,0 +1,421 @@
+# - Libraries
+
+# - - Time
+import time
+# - - Files
+import os
+# - - Threading
+import threading
+# - - Search
+import bisect
+# - - Exporter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+# - - Logging
+import logging
+
+# - Latency buckets (s), from 10 µs to 10 s
+DEFAULT_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class CounterClass:
+    def __init__(self):
+        """
+        Monotonic counter (e.g. samples, messages, drops)
+
+        # Returns
+
+        - CounterClass: the counter, starting at 0
+        """
+
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def get(self):
+        return self.value
+
+class GaugeClass:
+    def __init__(self, function=None):
+        """
+        Value that goes up and down (e.g. buffer fill)
+
+        # Arguments
+
+        - function (function or None): called at export to get the value, None to use the value given to `set`
+
+        # Returns
+
+        - GaugeClass: the gauge
+        """
+
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+class TimerClass:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+class HistogramClass:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Distribution of observed values in fixed buckets (e.g. per-stage latencies)
+
+        # Arguments
+
+        - buckets (tuple of float): increasing upper bounds of the buckets (the +Inf bucket is implicit)
+
+        # Returns
+
+        - HistogramClass: the histogram
+        """
+
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """
+        Time a block of code
+
+        # Returns
+
+        - TimerClass: context manager observing the duration of the block (s)
+        """
+
+        return TimerClass(self)
+
+    def get(self):
+        return self.count
+
+class NullMetricClass:
+    """
+    Metric of a disabled registry, every operation does nothing
+    """
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def time(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        pass
+
+    def get(self):
+        return 0
+
+NULL_METRIC = NullMetricClass()
+
+def format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+class RegistryClass:
+    def __init__(self):
+        """
+        Registry of the metrics, disabled by default: the metrics are then shared no-op objects (see `NullMetricClass`),
+        so the instrumented code costs one method call. The registry must be enabled before creating the instrumented
+        objects (the metrics are looked up once, at construction).
+
+        # Returns
+
+        - RegistryClass: the registry
+        """
+
+        self.enabled = False
+
+        self.families = {}      # [type, description, metrics by labels] by name
+        self.collectors = {}    # Functions returning a dictionary of values by name
+
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def get_metric(self, kind, name, description, labels, create):
+        if not self.enabled:
+            return NULL_METRIC
+
+        labels = tuple(sorted(labels.items()))
+
+        with self.lock:
+            family = self.families.setdefault(name, [kind, description, {}])
+
+            if family[0] != kind:
+                raise ValueError(f"Metric {name} is already registered as a {family[0]}")
+
+            if labels not in family[2]:
+                family[2][labels] = create()
+
+            return family[2][labels]
+
+    def counter(self, name, description, **labels):
+        """
+        Get a counter, created on first use
+
+        # Arguments
+
+        - name (str): name of the metric (ending with "_total")
+        - description (str): description of the metric
+        - labels (str): labels of the series (e.g. `status="dropped"`)
+
+        # Returns
+
+        - CounterClass or NullMetricClass: the counter
+        """
+
+        return self.get_metric("counter", name, description, labels, CounterClass)
+
+    def gauge(self, name, description, function=None, **labels):
+        """
+        Get a gauge, created on first use
+
+        # Arguments
+
+        - name (str): name of the metric
+        - description (str): description of the metric
+        - function (function or None): called at export to get the value (see `GaugeClass`)
+        - labels (str): labels of the series
+
+        # Returns
+
+        - GaugeClass or NullMetricClass: the gauge
+        """
+
+        return self.get_metric("gauge", name, description, labels, lambda: GaugeClass(function))
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS, **labels):
+        """
+        Get a histogram, created on first use
+
+        # Arguments
+
+        - name (str): name of the metric (e.g. ending with "_seconds")
+        - description (str): description of the metric
+        - buckets (tuple of float): upper bounds of the buckets
+        - labels (str): labels of the series (e.g. `stage="decode"`)
+
+        # Returns
+
+        - HistogramClass or NullMetricClass: the histogram
+        """
+
+        return self.get_metric("histogram", name, description, labels, lambda: HistogramClass(buckets))
+
+    def add_collector(self, name, function):
+        """
+        Export the numeric values of an existing metrics source as gauges "gaz_<name>_<key>"
+
+        # Arguments
+
+        - name (str): name of the source
+        - function (function): returns the metrics as a dictionary (e.g. `IngestionClass.get_metrics`)
+        """
+
+        if self.enabled:
+            self.collectors[name] = function
+
+    def render(self):
+        """
+        Render the metrics in the Prometheus text exposition format
+
+        # Returns
+
+        - str: metrics
+        """
+
+        lines = []
+
+        with self.lock:
+            families = [(name, family[0], family[1], list(family[2].items())) for name, family in sorted(self.families.items())]
+
+        for name, kind, description, series in families:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+
+            for labels, metric in series:
+                if kind == "histogram":
+                    with metric.lock:
+                        counts = list(metric.counts)
+                        total = metric.sum
+                        count = metric.count
+
+                    cumulated = 0
+
+                    for bound, bucket_count in zip(metric.buckets + (float("inf"),), counts):
+                        cumulated += bucket_count
+                        lines.append(f"{name}_bucket{format_labels(labels, [('le', format_value(bound))])} {cumulated}")
+
+                    lines.append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+                    lines.append(f"{name}_count{format_labels(labels)} {count}")
+                else:
+                    lines.append(f"{name}{format_labels(labels)} {format_value(metric.get())}")
+
+        for source, function in list(self.collectors.items()):
+            try:
+                values = function()
+            except Exception as e:
+                logging.warning(f"Failed to collect the {source} metrics : {e}")
+                continue
+
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE gaz_{source}_{key} gauge")
+                    lines.append(f"gaz_{source}_{key} {format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Write the metrics to a file atomically (e.g. for the textfile collector of the node exporter)
+
+        # Arguments
+
+        - path (str): path of the file
+        """
+
+        temporary_path = f"{path}.tmp"
+
+        with open(temporary_path, "w") as file:
+            file.write(self.render())
+
+        os.replace(temporary_path, path)
+
+# - Default registry, enabled by the entry points (see `main.py --metrics-port`)
+REGISTRY = RegistryClass()
+
+class MetricsExporterClass:
+    def __init__(self, registry=REGISTRY, port=None, host="127.0.0.1", path=None, interval=10):
+        """
+        Export the metrics of a registry over HTTP (GET /metrics) and/or to a file rewritten periodically
+
+        # Arguments
+
+        - registry (RegistryClass): registry
+        - port (int or None): HTTP port, None to disable the HTTP exporter
+        - host (str): HTTP listening address (local by default)
+        - path (str or None): path of the metrics file, None to disable the file exporter
+        - interval (float): time between two writes of the file in seconds
+
+        # Returns
+
+        - MetricsExporterClass: the exporter (not started)
+        """
+
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self.path = path
+        self.interval = interval
+
+        self.server = None
+        self.threads = []
+        self.stopping = threading.Event()
+
+    def start(self):
+        if self.port is not None:
+            registry = self.registry
+
+            class MetricsHandlerClass(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] not in ("/", "/metrics"):
+                        self.send_error(404)
+                        return
+
+                    body = registry.render().encode()
+
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *arguments):
+                    pass
+
+            self.server = ThreadingHTTPServer((self.host, self.port), MetricsHandlerClass)
+            self.port = self.server.server_address[1]
+
+            self.threads.append(threading.Thread(target=self.server.serve_forever, name="Metrics exporter", daemon=True))
+
+            logging.info(f"Metrics exported on http://{self.host}:{self.port}/metrics")
+
+        if self.path is not None:
+            self.threads.append(threading.Thread(target=self.run, name="Metrics file", daemon=True))
+
+            logging.info(f"Metrics written to {self.path} every {self.interval} s")
+
+        for thread in self.threads:
+            thread.start()
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            self.registry.write(self.path)
+        except OSError as e:
+            logging.warning(f"Failed to write the metrics to {self.path} : {e}")
+
+    def stop(self):
+        self.stopping.set()
+
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+        for thread in self.threads:
+            thread.join()
+
+        self.threads = []
+
+        # Last values
+        if self.path is not None:
+            self.write()
@@ -6,19 +6,20 @@ import paho.mqtt.client as mqtt
 
 import configuration
 
-import logging
+from payloads import tag_payload
 
-import json
+import logging
 
 class MQTTClientClass:
 
-    def __init__(self, configuration, update_sensors_callback):
+    def __init__(self, configuration, payload_callback):
         """
         MQTT class
 
         # Arguments
 
         - configuration (MQTTConfigurationClass): The MQTT configuration
+        - payload_callback (function): called with the raw payload of each message (tagged with the format of its topic suffix, see `payloads.tag_payload`), from the MQTT network thread (keep it short)
 
         # Returns
 
@@ -37,9 +38,7 @@ class MQTTClientClass:
             logging.info("Connected to the MQTT broker")
 
         def on_message(client, userdata, message):
-            data = json.loads(message.payload.decode("utf-8"))
-
-            update_sensors_callback(data["sensor"], data["data"])
+            payload_callback(tag_payload(message.payload, message.topic))
 
         self.client.on_connect = on_connect
         self.client.on_message = on_message
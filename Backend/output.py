@@ -0,0 +1,92 @@
+# - Libraries
+
+# - - Time
+import datetime
+# - - Serialization
+import json
+# - - Logging
+import logging
+
+class LoggingOutputClass:
+    def __init__(self):
+        """
+        Output writing the results to the log
+        """
+
+    def emit(self, event, data):
+        logging.info(f"Result {event} : {data}")
+
+    def stop(self):
+        pass
+
+class FileOutputClass:
+    def __init__(self, path):
+        """
+        Output appending the results to a JSON lines file
+
+        # Arguments
+
+        - path (str): path of the file
+        """
+
+        self.file = open(path, "a")
+
+    def emit(self, event, data):
+        self.file.write(json.dumps({"event": event, "time": datetime.datetime.now().isoformat(), "data": data}) + "\n")
+        self.file.flush()
+
+    def stop(self):
+        self.file.close()
+
+class MQTTOutputClass:
+    def __init__(self, mqtt_configuration, topic):
+        """
+        Output publishing the results as JSON on a MQTT topic (one sub-topic per event type)
+
+        # Arguments
+
+        - mqtt_configuration (MQTTConfigurationClass): The MQTT configuration of the broker
+        - topic (str): base topic of the results
+        """
+
+        import paho.mqtt.client as mqtt
+
+        self.topic = topic
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client.connect(mqtt_configuration.host, mqtt_configuration.port)
+        self.client.loop_start()
+
+    def emit(self, event, data):
+        self.client.publish(f"{self.topic}/{event}", json.dumps({"time": datetime.datetime.now().isoformat(), "data": data}))
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+def create_outputs(output_configuration, mqtt_configuration):
+    """
+    Create the results outputs
+
+    # Arguments
+
+    - output_configuration (OutputConfigurationClass): The output configuration
+    - mqtt_configuration (MQTTConfigurationClass): The MQTT configuration, used by the MQTT output
+
+    # Returns
+
+    - list: the outputs
+    """
+
+    outputs = []
+
+    if output_configuration.log:
+        outputs.append(LoggingOutputClass())
+
+    if output_configuration.file is not None:
+        outputs.append(FileOutputClass(output_configuration.file))
+
+    if output_configuration.topic is not None:
+        outputs.append(MQTTOutputClass(mqtt_configuration, output_configuration.topic))
+
+    return outputs
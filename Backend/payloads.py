@@ -0,0 +1,332 @@
+# - Libraries
+
+# - - Binary format
+import struct
+# - - Mathematical
+import numpy
+# - - Serialization
+import json
+# - - Logging
+import logging
+
+# - Payload formats
+
+FORMATS = {}        # Decoder function by format name
+MAGIC_BYTES = {}    # Format name by first byte of the payload
+TOPIC_SUFFIXES = {} # Magic byte by topic suffix
+
+def register_format(name, magic, suffix=None):
+    """
+    Register a payload format, the payloads starting with the magic byte are decoded by the decorated function
+
+    The JSON payloads (starting with "{") are the fallback of the payloads without registered magic byte.
+
+    # Arguments
+
+    - name (str): name of the format
+    - magic (int): first byte of the payloads of the format
+    - suffix (str or None): topic suffix of the payloads of the format, tagged with the magic byte on reception (see `tag_payload`)
+
+    # Returns
+
+    - function: decorator registering a function (list of bytes) -> (dict, int), see `decode_payloads`
+    """
+
+    if magic in MAGIC_BYTES:
+        raise ValueError(f"Magic byte {magic:#04x} already used by the {MAGIC_BYTES[magic]} format")
+
+    def decorator(function):
+        FORMATS[name] = function
+        MAGIC_BYTES[magic] = name
+
+        if suffix is not None:
+            TOPIC_SUFFIXES[suffix] = magic
+
+        return function
+
+    return decorator
+
+def tag_payload(payload, topic):
+    """
+    Prefix a payload with the magic byte of the format selected by its topic suffix, so that the payload
+    (queued, recorded or replayed without its topic) still selects its decoder
+
+    # Arguments
+
+    - payload (bytes): raw payload
+    - topic (str): topic of the message
+
+    # Returns
+
+    - bytes: payload, prefixed with the magic byte if the topic selects a format and it does not start with it
+    """
+
+    for suffix, magic in TOPIC_SUFFIXES.items():
+        if topic.endswith(suffix):
+            if payload[:1] != bytes([magic]):
+                return bytes([magic]) + payload
+
+            break
+
+    return payload
+
+def group_documents(documents):
+    """
+    Group the samples of decoded documents per sensor and gas sensor type
+
+    # Arguments
+
+    - documents (iterable of dict): documents ({"sensor": ..., "data": {gaz_sensor_type: {"value": ..., "timestamp": ...}}}),
+      None for a document which could not be parsed
+
+    # Returns
+
+    - (dict, int): samples per (sensor identifier, gaz sensor type) as (values, timestamps) arrays in arrival order
+      (None values are decoded as NaN), and the number of invalid documents
+    """
+
+    grouped = {}
+    errors = 0
+
+    for data in documents:
+        if data is None:
+            errors += 1
+            continue
+
+        try:
+            sensor_identifier = data["sensor"]
+
+            for gaz_sensor_type, sample in data["data"].items():
+                value = sample["value"]
+
+                values, timestamps = grouped.setdefault((sensor_identifier, gaz_sensor_type), ([], []))
+                values.append(numpy.nan if value is None else value)
+                timestamps.append(sample["timestamp"])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logging.warning(f"Ignoring invalid payload : {e}")
+            errors += 1
+
+    samples = {key: (numpy.array(values, dtype=float), numpy.array(timestamps, dtype=float)) for key, (values, timestamps) in grouped.items()}
+
+    return samples, errors
+
+def parse_documents(payloads, loads):
+    for payload in payloads:
+        try:
+            yield loads(payload)
+        except ValueError as e:
+            logging.warning(f"Ignoring invalid payload : {e}")
+            yield None
+
+def decode_json_payloads(payloads):
+    """
+    Decode JSON payloads ({"sensor": ..., "data": {gaz_sensor_type: {"value": ..., "timestamp": ...}}})
+
+    # Arguments
+
+    - payloads (list of bytes): raw payloads
+
+    # Returns
+
+    - (dict, int): samples and number of invalid payloads (see `group_documents`)
+    """
+
+    return group_documents(parse_documents(payloads, json.loads))
+
+# - - Binary format
+#
+# - magic byte 0xB1
+# - uint8: length of the sensor identifier, followed by the identifier (UTF-8)
+# - uint16 (little endian): number of samples, followed by the samples (BINARY_SAMPLE_DTYPE, packed)
+
+BINARY_MAGIC = 0xB1
+
+BINARY_SAMPLE_DTYPE = numpy.dtype([
+    ("gaz_sensor_type", "S8"),  # ASCII, padded with null bytes
+    ("value", "<f4"),           # Raw value (V), NaN if missing
+    ("timestamp", "<u8")])      # Timestamp (ms)
+
+def encode_binary_payload(sensor_identifier, samples):
+    """
+    Encode samples of a sensor board in the binary format
+
+    # Arguments
+
+    - sensor_identifier (str): sensor identifier (at most 255 bytes)
+    - samples (list of tuple): (gaz sensor type, value, timestamp) of each sample, None values are encoded as NaN
+
+    # Returns
+
+    - bytes: payload
+    """
+
+    identifier = sensor_identifier.encode()
+
+    rows = numpy.array([(gaz_sensor_type.encode(), numpy.nan if value is None else value, timestamp) for gaz_sensor_type, value, timestamp in samples], dtype=BINARY_SAMPLE_DTYPE)
+
+    return bytes([BINARY_MAGIC, len(identifier)]) + identifier + struct.pack("<H", rows.shape[0]) + rows.tobytes()
+
+@register_format("binary", BINARY_MAGIC, "/binary")
+def decode_binary_payloads(payloads):
+    """
+    Decode binary payloads, the samples of all the payloads are read at once into a structured array and
+    grouped per sensor and gas sensor type without Python objects per sample
+
+    # Arguments
+
+    - payloads (list of bytes): raw payloads (starting with the magic byte)
+
+    # Returns
+
+    - (dict, int): samples and number of invalid payloads (see `group_documents`)
+    """
+
+    identifiers = {}    # Code by sensor identifier
+    codes = []          # Sensor code of each valid payload
+    counts = []         # Number of samples of each valid payload
+    blocks = []
+
+    errors = 0
+
+    for payload in payloads:
+        try:
+            length = payload[1]
+            count = struct.unpack_from("<H", payload, 2 + length)[0]
+            start = 4 + length
+
+            if len(payload) != start + count * BINARY_SAMPLE_DTYPE.itemsize:
+                raise ValueError(f"expected {count} samples, got {len(payload) - start} bytes")
+
+            identifier = payload[2:2 + length].decode()
+        except (IndexError, struct.error, ValueError) as e:
+            logging.warning(f"Ignoring invalid binary payload : {e}")
+            errors += 1
+            continue
+
+        codes.append(identifiers.setdefault(identifier, len(identifiers)))
+        counts.append(count)
+        blocks.append(memoryview(payload)[start:])
+
+    rows = numpy.frombuffer(b"".join(blocks), dtype=BINARY_SAMPLE_DTYPE)
+
+    if rows.shape[0] == 0:
+        return {}, errors
+
+    types, type_codes = numpy.unique(rows["gaz_sensor_type"], return_inverse=True)
+
+    keys = numpy.repeat(numpy.array(codes), counts) * types.shape[0] + type_codes
+
+    # Group the samples per key, keeping the arrival order
+    order = numpy.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = numpy.flatnonzero(numpy.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = numpy.append(starts[1:], keys.shape[0])
+
+    values = rows["value"][order].astype(float)
+    timestamps = rows["timestamp"][order].astype(float)
+
+    names = list(identifiers.keys())
+
+    samples = {}
+
+    for start, end in zip(starts, ends):
+        sensor_code, type_code = divmod(int(keys[start]), types.shape[0])
+
+        samples[(names[sensor_code], types[type_code].decode())] = (values[start:end], timestamps[start:end])
+
+    return samples, errors
+
+# - - MessagePack format (optional dependency), the documents have the JSON layout
+
+MSGPACK_MAGIC = 0xC1    # Byte never used by MessagePack
+
+@register_format("msgpack", MSGPACK_MAGIC, "/msgpack")
+def decode_msgpack_payloads(payloads):
+    """
+    Decode MessagePack payloads (tagged with their magic byte, see `tag_payload`) with the JSON layout
+
+    # Arguments
+
+    - payloads (list of bytes): raw payloads
+
+    # Returns
+
+    - (dict, int): samples and number of invalid payloads (see `group_documents`)
+    """
+
+    try:
+        import msgpack
+    except ImportError:
+        logging.error(f"Ignoring {len(payloads)} MessagePack payloads : msgpack is not installed")
+        return {}, len(payloads)
+
+    return group_documents(parse_documents(payloads, lambda payload: msgpack.unpackb(payload[1:])))
+
+def merge_samples(batches):
+    """
+    Merge batches of decoded samples, the samples of each (sensor identifier, gaz sensor type) are sorted by timestamp
+
+    # Arguments
+
+    - batches (list of dict): samples per (sensor identifier, gaz sensor type), see `decode_payloads`
+
+    # Returns
+
+    - dict: merged samples per (sensor identifier, gaz sensor type)
+    """
+
+    if len(batches) == 1:
+        return batches[0]
+
+    grouped = {}
+
+    for samples in batches:
+        for key, block in samples.items():
+            grouped.setdefault(key, []).append(block)
+
+    merged = {}
+
+    for key, blocks in grouped.items():
+        values = numpy.concatenate([block[0] for block in blocks])
+        timestamps = numpy.concatenate([block[1] for block in blocks])
+
+        order = numpy.argsort(timestamps, kind="stable")
+
+        merged[key] = (values[order], timestamps[order])
+
+    return merged
+
+def decode_payloads(payloads):
+    """
+    Decode a batch of raw sensor payloads and group the samples per sensor and gas sensor type, each payload is
+    decoded by the format of its magic byte (see `register_format`), JSON by default
+
+    # Arguments
+
+    - payloads (list of bytes): raw payloads
+
+    # Returns
+
+    - (dict, int): samples per (sensor identifier, gaz sensor type) as (values, timestamps) arrays in arrival order
+      (None values are decoded as NaN), and the number of payloads that could not be decoded
+    """
+
+    groups = {}
+
+    for payload in payloads:
+        groups.setdefault(MAGIC_BYTES.get(payload[0]) if payload else None, []).append(payload)
+
+    batches = []
+    errors = 0
+
+    for name, group in groups.items():
+        samples, group_errors = FORMATS[name](group) if name is not None else decode_json_payloads(group)
+
+        batches.append(samples)
+        errors += group_errors
+
+    if len(batches) == 1:
+        return batches[0], errors
+
+    # The payloads of different formats are merged in timestamp order
+    return merge_samples(batches), errors
@@ -1,5 +1,10 @@
 
-from scipy.signal import savgol_filter, butter, sosfiltfilt
+import numpy
+
+from scipy.signal import savgol_filter, sosfiltfilt
+
+from downsampling import get_minmax_indexes
+from filtering import get_sos
 
 def plot_sensors(sensors, axes, gaz_sensor_type, y, scale=False, filter=False):
     """
@@ -26,7 +31,7 @@ def plot_sensors(sensors, axes, gaz_sensor_type, y, scale=False, filter=False):
     axes.set_ylabel("Value")
 
     if filter:
-        butterworth = butter(4, 0.05, output="sos")
+        butterworth = get_sos(4, 0.05)
 
     def plot_function(name, sensor, axes):
         label = f"{name} {sensor.get_position()}"
@@ -40,12 +45,14 @@ def plot_sensors(sensors, axes, gaz_sensor_type, y, scale=False, filter=False):
         if filter and data.shape[0] < 16:
             return
         
-        values = data[y].to_numpy()
+        values = data[y]
 
         if filter:
             values = sosfiltfilt(butterworth, values)
 
         if scale:
+            from sklearn.preprocessing import StandardScaler
+
             values = StandardScaler().fit_transform(values.reshape(-1, 1)).flatten()
 
         axes.plot(data["time"]/1000, values, label=label)
@@ -57,6 +64,246 @@ def plot_sensors(sensors, axes, gaz_sensor_type, y, scale=False, filter=False):
     if axes.get_legend() is None:
         axes.legend()
 
+def decimate(x, y, buckets):
+    """
+    Decimate a signal to screen resolution, keeping the minimum and the maximum of each bucket of samples
+    so that the peaks stay visible
+
+    # Arguments
+
+    - x (numpy.ndarray of shape (n,)): abscissa
+    - y (numpy.ndarray of shape (n,)): values
+    - buckets (int): number of buckets (the width of the axes in pixels)
+
+    # Returns
+
+    - (numpy.ndarray, numpy.ndarray): decimated abscissa and values (at most 2 * buckets + bucket size samples)
+    """
+
+    indexes = get_minmax_indexes(y, buckets)
+
+    return x[indexes], y[indexes]
+
+class SensorsPlotClass:
+    def __init__(self, axes, gaz_sensor_type, y, scale=False, filter=False, margin=0.1):
+        """
+        Incremental plot of the sensor values, rendered by a `BlitRendererClass`
+
+        Unlike `plot_sensors`, the axes are not cleared on each frame: each sensor keeps its `Line2D`
+        which is only updated (decimated to the axes width) when the sensor received new samples.
+
+        # Arguments
+
+        - axes (matplotlib.axes.Axes): axes
+        - gaz_sensor_type (str): gaz sensor type
+        - y (str): plotted column of the sensor values
+        - scale (bool): center the values
+        - filter (bool): filter the values
+        - margin (float): relative margin added to the limits when they grow, to avoid a full redraw on each frame
+
+        # Returns
+
+        - SensorsPlotClass: the plot
+        """
+
+        self.axes = axes
+        self.gaz_sensor_type = gaz_sensor_type
+        self.y = y
+        self.scale = scale
+        self.filter = filter
+        self.margin = margin
+
+        self.butterworth = get_sos(4, 0.05) if filter else None
+
+        self.lines = {}     # Line by sensor identifier
+        self.indexes = {}   # Current index of each sensor when its line was updated
+        self.width = None   # Width of the axes in pixels when the lines were decimated
+        self.limits = None  # Data limits (x minimum, x maximum, y minimum, y maximum) shown by the axes
+
+        # The axes must be fully redrawn (limits or legend changed)
+        self.stale = True
+
+        title = f"Sensors {y} for {gaz_sensor_type}"
+
+        if scale:
+            title += " scaled"
+
+        if filter:
+            title += " filtered"
+
+        axes.set_title(title)
+        axes.set_xlabel("Time (s)")
+        axes.set_ylabel("Value")
+
+    def get_line(self, name, sensor):
+        if name not in self.lines:
+            # Animated lines are not drawn by `canvas.draw`, only by the renderer
+            self.lines[name], = self.axes.plot([], [], label=f"{name} {sensor.get_position()}", animated=True)
+            self.axes.legend()
+
+            self.stale = True
+
+        return self.lines[name]
+
+    def get_values(self, data):
+        values = data[self.y]
+
+        if self.filter:
+            values = sosfiltfilt(self.butterworth, values)
+
+        if self.scale:
+            values = (values - values.mean()) / values.std()
+
+        return values
+
+    def update(self, sensors):
+        """
+        Update the lines of the sensors which received new samples since the previous update
+
+        # Arguments
+
+        - sensors (dict): sensors by identifier
+
+        # Returns
+
+        - bool: True if a line changed
+        """
+
+        width = max(1, int(self.axes.get_window_extent().width))
+        resized = width != self.width
+        self.width = width
+
+        changed = False
+
+        for name, sensor in sensors.items():
+            try:
+                index = sensor.get_current_index(self.gaz_sensor_type)
+            except ValueError:
+                continue
+
+            if not resized and self.indexes.get(name) == index:
+                continue
+
+            self.indexes[name] = index
+
+            # Screen-sized data, unless the whole history is filtered
+            data = sensor.get_values(self.gaz_sensor_type, columns=[self.y], max_points=None if self.filter else 2 * width, downsampling="minmax")
+
+            # Ignore empty data
+            if data.shape[0] < (16 if self.filter else 2):
+                continue
+
+            x, y = decimate(data["time"] / 1000, self.get_values(data), width)
+
+            self.get_line(name, sensor).set_data(x, y)
+            self.extend_limits(x, y)
+
+            changed = True
+
+        return changed
+
+    def extend_limits(self, x, y):
+        """
+        Extend the axes limits to the data (with a margin), the axes becomes stale if they changed
+        """
+
+        limits = numpy.array([x.min(), x.max(), numpy.nanmin(y), numpy.nanmax(y)])
+
+        if not numpy.isfinite(limits).all():
+            return
+
+        if self.limits is not None:
+            inside = self.limits[0] <= limits[0] and limits[1] <= self.limits[1] and self.limits[2] <= limits[2] and limits[3] <= self.limits[3]
+
+            if inside:
+                return
+
+            limits = numpy.array([
+                min(limits[0], self.limits[0]), max(limits[1], self.limits[1]),
+                min(limits[2], self.limits[2]), max(limits[3], self.limits[3])
+            ])
+
+        x_margin = (limits[1] - limits[0]) * self.margin or 1
+        y_margin = (limits[3] - limits[2]) * self.margin or 1
+
+        self.limits = limits + numpy.array([0, x_margin, -y_margin, y_margin])
+
+        self.axes.set_xlim(self.limits[0], self.limits[1])
+        self.axes.set_ylim(self.limits[2], self.limits[3])
+
+        self.stale = True
+
+class BlitRendererClass:
+    def __init__(self, canvas, plots):
+        """
+        Render incremental plots of a figure with blitting
+
+        The static parts of the figure (axes, ticks, legends) are drawn once and cached, each frame
+        only restores this background and draws the lines. Nothing is drawn when no line changed.
+
+        # Arguments
+
+        - canvas (matplotlib.backend_bases.FigureCanvasBase): canvas of the figure
+        - plots (list of SensorsPlotClass): plots of the figure
+
+        # Returns
+
+        - BlitRendererClass: the renderer
+        """
+
+        self.canvas = canvas
+        self.plots = plots
+
+        self.background = None
+
+        # The background is captured after each full draw (including the ones of the backend, on resize)
+        canvas.mpl_connect("draw_event", self.on_draw)
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_lines()
+
+    def draw_lines(self):
+        for plot in self.plots:
+            for line in plot.lines.values():
+                plot.axes.draw_artist(line)
+
+    def draw(self, sensors):
+        """
+        Update the plots with the new samples and draw the figure if needed
+
+        # Arguments
+
+        - sensors (dict): sensors by identifier
+
+        # Returns
+
+        - bool: True if the figure was drawn
+        """
+
+        changed = False
+
+        for plot in self.plots:
+            changed |= plot.update(sensors)
+
+        if self.background is None or any(plot.stale for plot in self.plots):
+            for plot in self.plots:
+                plot.stale = False
+
+            self.canvas.figure.tight_layout()
+            self.canvas.draw()
+
+            return True
+
+        if not changed:
+            return False
+
+        self.canvas.restore_region(self.background)
+        self.draw_lines()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+        return True
+
 def iterate_sensors(sensors, axes, function):
     for name, sensor in sensors.items():
         function(name, sensor, axes)
@@ -92,7 +339,7 @@ def plot_spectrum(sensors, axes, gaz_sensor_type):
 
         axes[0].plot(fft_freq, numpy.abs(fft_values), label=label)
     
-        butterworth = butter(4, 0.05, output="sos")
+        butterworth = get_sos(4, 0.05)
 
         filtered_values = sosfiltfilt(butterworth, values)
 
@@ -0,0 +1,391 @@
+# - Libraries
+
+# - - Time
+import time
+# - - Files
+import os
+# - - Threading
+import threading
+# - - Mathematical
+import numpy
+# - - Logging
+import logging
+import traceback
+
+from sensor import SensorClass, get_shifts
+
+import localization
+
+import excitement
+
+import metrics
+
+from calibration import CalibrationClass
+
+from reordering import ReorderBufferClass
+
+from resampling import ResamplerClass
+
+class ProcessingClass:
+    def __init__(self, sensors_configuration, calibration_configuration, outputs, gaz_sensor_type="MQ3", interval=0.1, archive=None, workers=None, localization_strategy="tdoa", lateness=500, resampling_rate=None):
+        """
+        Processing service: sensors update, excitement detection, localization and calibration, without any user interface
+
+        # Arguments
+
+        - sensors_configuration (dict): sensors configuration by identifier
+        - calibration_configuration (CalibrationConfigurationClass): calibration configuration
+        - outputs (list): outputs receiving the results (see `output.py`)
+        - gaz_sensor_type (str): gaz sensor type used for the localization
+        - interval (float): time between two processing steps in seconds
+        - archive (str or None): directory of the sensors archives (one sub-directory per sensor), None to drop the values evicted from memory
+        - workers (int or None): number of worker processes updating the sensors (see `sharding.py`), 0 for one per core,
+          None to update them in the calling thread
+        - localization_strategy (str): name of the localization strategy (see `localization.STRATEGIES`)
+        - lateness (float): maximum lateness of a sample in milliseconds, the samples are reordered per gas sensor
+          and delayed by the lateness (see `reordering.ReorderBufferClass`)
+        - resampling_rate (float or None): sample rate (Hz) of the fixed-rate grid the samples are resampled on
+          (see `resampling.ResamplerClass`), None to keep the received timestamps
+
+        # Returns
+
+        - ProcessingClass: the processing service
+        """
+
+        if workers is None:
+            self.shards = None
+            self.sensors = {sensor_identifier: SensorClass(sensor_configuration, os.path.join(archive, sensor_identifier) if archive is not None else None) for sensor_identifier, sensor_configuration in sensors_configuration.items()}
+        else:
+            # The worker processes are only used when needed
+            from sharding import ShardsClass
+
+            self.shards = ShardsClass(sensors_configuration, workers or None, archive)
+            self.sensors = self.shards.sensors
+
+        self.outputs = outputs
+        self.gaz_sensor_type = gaz_sensor_type
+        self.interval = interval
+
+        self.first_timestamp = None # Reference timestamp
+
+        self.lateness = lateness
+        self.reorder_buffers = {}   # Reorder buffer by (sensor identifier, gaz sensor type)
+
+        self.resampling_rate = resampling_rate
+        self.resamplers = {}        # Resampler by (sensor identifier, gaz sensor type)
+
+        self.calibration = CalibrationClass(calibration_configuration)
+        self.calibration.attach(self.sensors)
+
+        calibration_state = self.calibration.state()
+        if calibration_state is not None:
+            logging.info(f"Calibration enabled, wait for {calibration_state} to calibrate the sensors...")
+
+        self.excitement = excitement.ExcitementClass(gaz_sensor_type)
+        self.excitement.attach(self.sensors)
+        self.solver = localization.LocalizationSolverClass()
+
+        localization.get_strategy(localization_strategy)
+        self.localization_strategy = localization_strategy
+
+        # - Latest results (read by the user interface)
+        self.excited_signals = {}
+        self.shifts = None
+        self.source = None
+
+        # - Metrics sources logged periodically
+        self.metrics = {"localization": self.solver.get_counters}
+        self.metrics_interval = 10
+
+        self.metrics["reordering"] = self.get_reordering_counters
+
+        metrics.REGISTRY.add_collector("localization", self.solver.get_counters)
+        metrics.REGISTRY.add_collector("reordering", self.get_reordering_counters)
+
+        # - Exported metrics (no-op if the registry is disabled)
+        self.samples_counters = {status: metrics.REGISTRY.counter("gaz_samples_total", "Samples received by the processing", status=status) for status in ["received", "reordered", "late", "ignored"]}
+        self.stage_latencies = {stage: metrics.REGISTRY.histogram("gaz_stage_latency_seconds", "Latency of the processing stages", stage=stage) for stage in ["update", "excitement", "shifts", "localization", "calibration"]}
+
+        for sensor_identifier, sensor in self.sensors.items():
+            for gaz_sensor_type, gaz_sensor in sensor.sensors.items():
+                metrics.REGISTRY.gauge("gaz_buffer_fill_ratio", "Fill ratio of the values kept in memory", lambda gaz_sensor=gaz_sensor: len(gaz_sensor.data) / gaz_sensor.data.capacity, sensor=sensor_identifier, gaz_sensor_type=gaz_sensor_type)
+                metrics.REGISTRY.gauge("gaz_rejected_samples", "Samples which could not be converted", gaz_sensor.get_rejected, sensor=sensor_identifier, gaz_sensor_type=gaz_sensor_type)
+
+        self.running = False
+        self.thread = None
+
+    def update_sensors(self, samples):
+        """
+        Update the sensors with a batch of new data
+
+        # Arguments
+
+        - samples (dict): (values, timestamps) arrays per (sensor identifier, gaz sensor type), see `payloads.decode_payloads`
+        """
+
+        with self.stage_latencies["update"].time():
+            kept_samples = {}
+
+            for (sensor_identifier, key), (values, timestamps) in samples.items():
+                if sensor_identifier not in self.sensors:
+                    logging.warning(f"Sensor {sensor_identifier} not in `sensors` dictionary.")
+                    continue
+
+                if timestamps.shape[0] == 0:
+                    continue
+
+                # We use the oldest timestamp of the first batch, minus the lateness, as the reference
+                if self.first_timestamp is None:
+                    self.first_timestamp = min(float(timestamps.min()) for (identifier, _), (_, timestamps) in samples.items() if identifier in self.sensors and timestamps.shape[0] > 0) - self.lateness
+                    logging.info(f"First timestamp : {self.first_timestamp}")
+
+                # Ignore the missing values and the null values
+                ignored = numpy.isnan(values) | (values == 0)
+
+                if ignored.any():
+                    logging.debug(f"Ignoring {ignored.sum()} samples of {sensor_identifier} for {key} gaz sensor : value is missing or 0")
+
+                reorder_buffer = self.reorder_buffers.get((sensor_identifier, key))
+
+                # The samples older than the reference are too late
+                if reorder_buffer is None:
+                    reorder_buffer = self.reorder_buffers[(sensor_identifier, key)] = ReorderBufferClass(self.lateness, self.first_timestamp)
+
+                reordered, too_late = reorder_buffer.reordered, reorder_buffer.too_late
+
+                # Release the samples in timestamp order once the watermark passed them
+                released_values, released_timestamps = reorder_buffer.push_many(values[~ignored], timestamps[~ignored])
+
+                if metrics.REGISTRY.enabled:
+                    self.samples_counters["received"].inc(values.shape[0])
+                    self.samples_counters["ignored"].inc(int(ignored.sum()))
+                    self.samples_counters["reordered"].inc(reorder_buffer.reordered - reordered)
+                    self.samples_counters["late"].inc(reorder_buffer.too_late - too_late)
+
+                released_values, released_timestamps = self.resample((sensor_identifier, key), released_values, released_timestamps - self.first_timestamp)
+
+                if released_timestamps.shape[0] > 0:
+                    kept_samples[(sensor_identifier, key)] = (released_values, released_timestamps)
+
+            self.append_samples(kept_samples)
+
+    def resample(self, key, values, timestamps):
+        """
+        Resample the released samples of a gas sensor on the fixed-rate grid, if enabled
+
+        # Arguments
+
+        - key (tuple): (sensor identifier, gaz sensor type)
+        - values (numpy.ndarray of shape (n,)): raw values
+        - timestamps (numpy.ndarray of shape (n,)): timestamps relative to the first timestamp, increasing
+
+        # Returns
+
+        - (numpy.ndarray, numpy.ndarray): values and timestamps
+        """
+
+        if self.resampling_rate is None:
+            return values, timestamps
+
+        resampler = self.resamplers.get(key)
+
+        if resampler is None:
+            resampler = self.resamplers[key] = ResamplerClass(self.resampling_rate)
+
+        return resampler.update(values, timestamps)
+
+    def append_samples(self, samples):
+        """
+        Append samples released by the reorder buffers to the sensors
+
+        # Arguments
+
+        - samples (dict): (values, timestamps) arrays per (sensor identifier, gaz sensor type), timestamps relative to the first timestamp
+        """
+
+        # The worker processes update their shards in parallel
+        if self.shards is not None:
+            self.shards.update_many(samples)
+            return
+
+        for (sensor_identifier, key), (values, timestamps) in samples.items():
+            # Try to update the sensor with the new data
+            try:
+                self.sensors[sensor_identifier].update_many(key, values, timestamps)
+            except Exception as e:
+                logging.error(f"An error occured while updating the sensor {sensor_identifier} : {e}")
+                traceback.print_exc()
+
+    def flush(self):
+        """
+        Append the samples still held by the reorder buffers to the sensors
+        """
+
+        samples = {}
+
+        for key, reorder_buffer in self.reorder_buffers.items():
+            values, timestamps = reorder_buffer.flush()
+            values, timestamps = self.resample(key, values, timestamps - self.first_timestamp)
+
+            if timestamps.shape[0] > 0:
+                samples[key] = (values, timestamps)
+
+        self.append_samples(samples)
+
+    def get_reordering_counters(self):
+        """
+        Get the reordering counters summed over the gas sensors
+
+        # Returns
+
+        - dict: received, released, held, reordered and too late samples (see `ReorderBufferClass.get_counters`)
+        """
+
+        counters = {"received": 0, "released": 0, "held": 0, "reordered": 0, "too_late": 0}
+
+        for reorder_buffer in list(self.reorder_buffers.values()):
+            for name, value in reorder_buffer.get_counters().items():
+                counters[name] += value
+
+        return counters
+
+    def add_metrics(self, name, function):
+        """
+        Add a metrics source logged periodically
+
+        # Arguments
+
+        - name (str): name of the source
+        - function (function): returns the metrics as a dictionary
+        """
+
+        self.metrics[name] = function
+
+        metrics.REGISTRY.add_collector(name, function)
+
+    def emit(self, event, data):
+        """
+        Send a result to all the outputs
+
+        # Arguments
+
+        - event (str): event type ("excitement", "localization", "calibration")
+        - data (dict): event data
+        """
+
+        for output in self.outputs:
+            try:
+                output.emit(event, data)
+            except Exception as e:
+                logging.error(f"An error occured while emitting a {event} event : {e}")
+
+    def step(self):
+        """
+        Run one processing step: excitement detection, localization and calibration
+        """
+
+        excited_before = set(self.excitement.excited_timestamps)
+
+        with self.stage_latencies["excitement"].time():
+            self.excitement.loop()
+
+        for name in self.excitement.excited_timestamps.keys() - excited_before:
+            timestamp = self.excitement.excited_timestamps[name]
+
+            self.emit("excitement", {"sensor": name, "gaz_sensor_type": self.gaz_sensor_type, "timestamp": float(timestamp)})
+
+        excited_signals = self.excitement.get_excited_signals(self.sensors)
+
+        # The excited signals are memoized, nothing to localize again while they do not change
+        changed = excited_signals is not self.excited_signals
+        self.excited_signals = excited_signals
+
+        if changed and self.excitement.is_all_excited():
+            with self.stage_latencies["shifts"].time():
+                self.shifts = get_shifts(self.excited_signals)
+
+            values = None
+
+            # The concentration strategies use the newest filtered concentration of the excited sensors
+            if localization.get_strategy(self.localization_strategy)[1] == "values":
+                values = {name: float(self.sensors[name].get_latest_values(self.gaz_sensor_type)["concentration_filtered"]) for name in self.shifts}
+
+            with self.stage_latencies["localization"].time():
+                source = localization.localize(self.sensors, self.shifts, values, self.localization_strategy, self.solver)
+
+            # The solver returns the same result while the shifts do not change
+            if source is not self.source:
+                logging.info(f"Shifts : {self.shifts}")
+                logging.info(f"Position : {source}")
+
+                self.emit("localization", {
+                    "gaz_sensor_type": self.gaz_sensor_type,
+                    "position": [float(x) for x in source.position],
+                    "uncertainty": [float(x) if numpy.isfinite(x) else None for x in source.get_uncertainty()],
+                    "strategy": self.localization_strategy,
+                    "k": float(source.k) if numpy.isfinite(source.k) else None,
+                    "shifts": {name: float(shift) for name, shift in self.shifts.items()},
+                })
+
+            self.source = source
+
+        with self.stage_latencies["calibration"].time():
+            calibration_result = self.calibration.loop(self.sensors)
+
+        if calibration_result is not None:
+            logging.info(f"Calibration results : \n{calibration_result}")
+            self.emit("calibration", {"results": calibration_result})
+
+    def log_metrics(self):
+        for name, function in self.metrics.items():
+            logging.info(f"{name.capitalize()} : {function()}")
+
+    def start(self):
+        """
+        Start the processing thread
+        """
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="Processing", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the processing thread and the outputs
+        """
+
+        self.running = False
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        self.flush()
+
+        # Spill the values still in memory to the archives
+        for sensor in self.sensors.values():
+            sensor.close()
+
+        if self.shards is not None:
+            self.shards.stop()
+
+        for output in self.outputs:
+            output.stop()
+
+    def run(self):
+        next_metrics_log = time.monotonic()
+
+        while self.running:
+            start = time.monotonic()
+
+            try:
+                self.step()
+            except Exception as e:
+                logging.error(f"An unexpected error occured : {e}")
+                traceback.print_exc()
+
+            if time.monotonic() >= next_metrics_log:
+                self.log_metrics()
+                next_metrics_log = time.monotonic() + self.metrics_interval
+
+            time.sleep(max(0, self.interval - (time.monotonic() - start)))
@@ -0,0 +1,142 @@
+# - Libraries
+
+# - - Ordering
+import heapq
+import itertools
+# - - Mathematical
+import numpy
+
+class ReorderBufferClass:
+    def __init__(self, lateness=500, start=-numpy.inf):
+        """
+        Reorder stage of the samples of a gas sensor: the samples are held in a heap until the watermark (newest
+        timestamp received minus the lateness) passes them, then released in timestamp order
+
+        The samples older than the last released one can not be inserted any more, they are dropped and counted
+        in `too_late`. The samples of in-order blocks are only appended to the heap.
+
+        # Arguments
+
+        - lateness (float): maximum lateness of a sample in milliseconds (0 only sorts each block)
+        - start (float): timestamp before which the samples are too late (ms)
+
+        # Returns
+
+        - ReorderBufferClass: the reorder buffer
+        """
+
+        if lateness < 0:
+            raise ValueError(f"Lateness must be positive, got {lateness}")
+
+        self.lateness = lateness
+
+        self.heap = []                      # Held samples (timestamp, arrival order, value)
+        self.sequence = itertools.count()   # Arrival order, to keep the samples with the same timestamp in order
+
+        self.newest = -numpy.inf            # Newest timestamp received
+        self.released_time = start          # Timestamp of the last released sample
+
+        # - Counters
+        self.received = 0
+        self.released = 0
+        self.reordered = 0  # Samples received after a newer one
+        self.too_late = 0   # Samples received after the watermark passed them
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push_many(self, values, timestamps):
+        """
+        Add a block of samples and release the samples passed by the watermark
+
+        # Arguments
+
+        - values (numpy.ndarray of shape (n,)): values
+        - timestamps (numpy.ndarray of shape (n,)): timestamps of the values (ms), in any order
+
+        # Returns
+
+        - (numpy.ndarray, numpy.ndarray): released values and timestamps, in timestamp order
+        """
+
+        self.received += timestamps.shape[0]
+
+        late = timestamps < self.released_time
+
+        if late.any():
+            self.too_late += int(late.sum())
+
+            values = values[~late]
+            timestamps = timestamps[~late]
+
+        if timestamps.shape[0] == 0:
+            return values, timestamps
+
+        # Samples older than a sample received before them
+        previous = numpy.maximum.accumulate(numpy.concatenate(([self.newest], timestamps[:-1])))
+        reordered = int((timestamps < previous).sum())
+
+        self.reordered += reordered
+        self.newest = max(self.newest, float(timestamps.max()))
+
+        watermark = self.newest - self.lateness
+
+        if reordered == 0:
+            # In-order block, newer than the held samples: release the held samples passed by the watermark, then the
+            # samples of the block if nothing older is still held. The rest of the block is appended to the heap
+            # (appending a sample newer than all the held ones keeps the heap ordered)
+            held_values, held_timestamps = self.pop(watermark)
+
+            released = int(numpy.searchsorted(timestamps, watermark, side="right")) if not self.heap else 0
+
+            self.heap.extend((timestamp, next(self.sequence), value) for timestamp, value in zip(timestamps[released:].tolist(), values[released:].tolist()))
+
+            return self.release(numpy.concatenate((held_values, values[:released])), numpy.concatenate((held_timestamps, timestamps[:released])))
+
+        for timestamp, value in zip(timestamps.tolist(), values.tolist()):
+            heapq.heappush(self.heap, (timestamp, next(self.sequence), value))
+
+        return self.release(*self.pop(watermark))
+
+    def pop(self, watermark):
+        released = []
+
+        while self.heap and self.heap[0][0] <= watermark:
+            released.append(heapq.heappop(self.heap))
+
+        return numpy.array([value for _, _, value in released], dtype=float), numpy.array([timestamp for timestamp, _, _ in released], dtype=float)
+
+    def release(self, values, timestamps):
+        if timestamps.shape[0] > 0:
+            self.released += timestamps.shape[0]
+            self.released_time = float(timestamps[-1])
+
+        return values, timestamps
+
+    def flush(self):
+        """
+        Release all the held samples (e.g. when stopping)
+
+        # Returns
+
+        - (numpy.ndarray, numpy.ndarray): released values and timestamps, in timestamp order
+        """
+
+        return self.release(*self.pop(numpy.inf))
+
+    def get_counters(self):
+        """
+        Get the reordering counters
+
+        # Returns
+
+        - dict: received, released, held, reordered and too late samples
+        """
+
+        return {
+            "received": self.received,
+            "released": self.released,
+            "held": len(self.heap),
+            "reordered": self.reordered,
+            "too_late": self.too_late,
+        }
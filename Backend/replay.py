@@ -0,0 +1,323 @@
+# - Libraries
+
+# - - Time
+import time
+# - - Binary log
+import struct
+import gzip
+import threading
+# - - Mathematical
+import numpy
+# - - Command line
+import argparse
+# - - Logging
+import logging
+from logging_formatter import LoggingFormatterClass
+
+import configuration
+
+from payloads import decode_payloads
+
+import metrics
+
+# - - Log format
+LOG_MAGIC = b"GAZLOG1\n"
+RECORD_HEADER = struct.Struct("<dI")    # Reception time (s since the start of the recording), payload length
+
+def open_log(path, mode):
+    """
+    Open a payloads log, compressed with gzip if the path ends with ".gz"
+
+    # Arguments
+
+    - path (str): path of the log
+    - mode (str): "rb" or "wb"
+
+    # Returns
+
+    - file: binary file
+    """
+
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+
+    return open(path, mode)
+
+def read_log(path):
+    """
+    Read a payloads log written by `RecorderClass`
+
+    # Arguments
+
+    - path (str): path of the log
+
+    # Returns
+
+    - generator of (float, bytes): reception time (s since the start of the recording) and raw payload
+    """
+
+    with open_log(path, "rb") as file:
+        if file.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError(f"{path} is not a payloads log")
+
+        while True:
+            header = file.read(RECORD_HEADER.size)
+
+            if len(header) < RECORD_HEADER.size:
+                break
+
+            reception_time, length = RECORD_HEADER.unpack(header)
+            payload = file.read(length)
+
+            # The last record is truncated if the recording was interrupted
+            if len(payload) < length:
+                logging.warning(f"Truncated record at the end of {path}")
+                break
+
+            yield reception_time, payload
+
+class RecorderClass:
+    def __init__(self, path, payload_callback=None):
+        """
+        Record the raw payloads to a compact binary log (length-prefixed records with their reception time)
+
+        # Arguments
+
+        - path (str): path of the log (compressed with gzip if it ends with ".gz")
+        - payload_callback (function or None): called with each payload after recording it (e.g. `IngestionClass.put`)
+
+        # Returns
+
+        - RecorderClass: the recorder
+        """
+
+        self.payload_callback = payload_callback
+
+        self.file = open_log(path, "wb")
+        self.file.write(LOG_MAGIC)
+
+        self.start = time.monotonic()
+        self.records = 0
+
+        # `put` is called from the MQTT network thread
+        self.lock = threading.Lock()
+
+    def put(self, payload, reception_time=None):
+        """
+        Record a raw payload and forward it to the payload callback
+
+        # Arguments
+
+        - payload (bytes): raw payload
+        - reception_time (float or None): reception time (s since the start of the recording), now if None
+        """
+
+        if reception_time is None:
+            reception_time = time.monotonic() - self.start
+
+        with self.lock:
+            self.file.write(RECORD_HEADER.pack(reception_time, len(payload)))
+            self.file.write(payload)
+            self.records += 1
+
+        if self.payload_callback is not None:
+            self.payload_callback(payload)
+
+    def stop(self):
+        with self.lock:
+            self.file.close()
+
+        logging.info(f"{self.records} payloads recorded")
+
+class ReplayClass:
+    def __init__(self, processing, speed=None, batch_size=512):
+        """
+        Replay a payloads log through the processing pipeline without MQTT broker
+
+        The payloads received during a processing interval are decoded and given to `update_sensors` as one batch
+        (as the ingestion consumer thread would), then a processing step runs. Everything runs in the calling thread
+        so that the replay is reproducible.
+
+        # Arguments
+
+        - processing (ProcessingClass): processing service (not started)
+        - speed (float or None): replay speed relative to the recording (1 for real time), None for as fast as possible
+        - batch_size (int): maximum number of payloads decoded at once
+
+        # Returns
+
+        - ReplayClass: the replay driver
+        """
+
+        self.processing = processing
+        self.speed = speed
+        self.batch_size = batch_size
+
+        # - Metrics
+        self.payloads = 0
+        self.samples = 0
+        self.duration = 0
+        self.latencies = {"decode": [], "update": [], "step": []}
+
+        self.decode_latency = metrics.REGISTRY.histogram("gaz_stage_latency_seconds", "Latency of the processing stages", stage="decode")
+
+    def process(self, batch):
+        start = time.perf_counter()
+        samples, _ = decode_payloads(batch)
+        decoded = time.perf_counter()
+        self.processing.update_sensors(samples)
+        updated = time.perf_counter()
+
+        self.latencies["decode"].append(decoded - start)
+        self.decode_latency.observe(decoded - start)
+        self.latencies["update"].append(updated - decoded)
+
+        self.payloads += len(batch)
+        self.samples += sum(values.shape[0] for values, _ in samples.values())
+
+    def step(self):
+        start = time.perf_counter()
+        self.processing.step()
+        self.latencies["step"].append(time.perf_counter() - start)
+
+    def run(self, records):
+        """
+        Replay the records
+
+        # Arguments
+
+        - records (iterable of (float, bytes)): reception time and raw payload (see `read_log`)
+        """
+
+        interval = self.processing.interval
+
+        replay_start = time.perf_counter()
+
+        batch = []
+        next_step = None
+
+        for reception_time, payload in records:
+            if next_step is None:
+                first_reception_time = reception_time
+                next_step = reception_time + interval
+
+            # Run the processing steps elapsed before this payload
+            while reception_time >= next_step:
+                if batch:
+                    self.process(batch)
+                    batch = []
+
+                self.step()
+
+                next_step += interval
+
+                # Skip the steps of the gaps of the recording
+                if reception_time >= next_step + interval:
+                    next_step = reception_time - (reception_time - next_step) % interval
+
+            # Wait for the reception time of the payload
+            if self.speed is not None:
+                delay = (reception_time - first_reception_time) / self.speed - (time.perf_counter() - replay_start)
+
+                if delay > 0:
+                    time.sleep(delay)
+
+            batch.append(payload)
+
+            if len(batch) >= self.batch_size:
+                self.process(batch)
+                batch = []
+
+        if batch:
+            self.process(batch)
+
+        self.step()
+
+        self.duration = time.perf_counter() - replay_start
+
+    def get_metrics(self):
+        """
+        Get the throughput and the latency of each stage
+
+        # Returns
+
+        - dict: payloads, samples, duration (s), throughput (samples/s) and the latency statistics (s) of each stage
+        """
+
+        metrics = {
+            "payloads": self.payloads,
+            "samples": self.samples,
+            "duration": self.duration,
+            "throughput": self.samples / self.duration if self.duration > 0 else 0,
+        }
+
+        for stage, latencies in self.latencies.items():
+            latencies = numpy.array(latencies)
+
+            if latencies.shape[0] == 0:
+                continue
+
+            metrics[stage] = {
+                "count": latencies.shape[0],
+                "mean": latencies.mean(),
+                "p50": numpy.percentile(latencies, 50),
+                "p99": numpy.percentile(latencies, 99),
+                "maximum": latencies.max(),
+                "total": latencies.sum(),
+            }
+
+        return metrics
+
+def print_metrics(metrics):
+    print(f"{metrics['payloads']} payloads, {metrics['samples']} samples in {metrics['duration']:.3f} s : {metrics['throughput']:.0f} samples/s")
+
+    for stage in ["decode", "update", "step"]:
+        if stage in metrics:
+            latencies = metrics[stage]
+            print(f" - {stage:6s} : {latencies['count']:6d} calls, mean {latencies['mean'] * 1e6:9.1f} µs, p50 {latencies['p50'] * 1e6:9.1f} µs, p99 {latencies['p99'] * 1e6:9.1f} µs, maximum {latencies['maximum'] * 1e6:9.1f} µs, total {latencies['total']:.3f} s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session through the processing pipeline")
+    parser.add_argument("log", help="Path of the payloads log (recorded with `main.py --record`)")
+    parser.add_argument("--configuration", default="configuration.json", help="Path to the configuration file")
+    parser.add_argument("--speed", type=float, default=None, help="Replay speed relative to the recording (1 for real time), as fast as possible if not set")
+    parser.add_argument("--workers", type=int, default=None, help="Update the sensors in worker processes (0 for one per core), in the calling thread if not set")
+    parser.add_argument("--metrics-file", default=None, help="Write the metrics in the Prometheus format to this file at the end of the replay")
+
+    arguments = parser.parse_args()
+
+    if arguments.metrics_file is not None:
+        metrics.REGISTRY.enable()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger().handlers[0].setFormatter(LoggingFormatterClass())
+
+    # The processing core is imported after the logging configuration
+    from processing import ProcessingClass
+    from output import create_outputs
+
+    mqtt_configuration, calibration_configuration, sensors_configuration, output_configuration = configuration.load(arguments.configuration)
+
+    # No broker while replaying
+    output_configuration.topic = None
+
+    processing = ProcessingClass(sensors_configuration, calibration_configuration, create_outputs(output_configuration, mqtt_configuration), workers=arguments.workers, lateness=mqtt_configuration.lateness, resampling_rate=mqtt_configuration.resampling_rate)
+
+    replay = ReplayClass(processing, arguments.speed, mqtt_configuration.batch_size)
+
+    metrics.REGISTRY.add_collector("replay", replay.get_metrics)
+
+    try:
+        replay.run(read_log(arguments.log))
+    except KeyboardInterrupt:
+        print("Keyboard interrupt")
+
+    processing.stop()
+
+    print_metrics(replay.get_metrics())
+
+    if arguments.metrics_file is not None:
+        metrics.REGISTRY.write(arguments.metrics_file)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import numpy
+
+class ResamplerClass:
+    def __init__(self, rate, maximum_gap=None):
+        """
+        Incremental resampling of a stream onto a fixed-rate grid (multiples of the period, so that the streams
+        resampled at the same rate share their timestamps), by linear interpolation between the received samples
+
+        The grid points are produced once a sample at or after them is received. No point is produced inside
+        the gaps longer than the maximum gap (e.g. a disconnected sensor board).
+
+        # Arguments
+
+        - rate (float): sample rate of the grid (Hz)
+        - maximum_gap (float or None): longest time between two samples interpolated (ms), 10 periods if None
+
+        # Returns
+
+        - ResamplerClass: the resampler
+        """
+
+        if rate <= 0:
+            raise ValueError(f"Sample rate must be positive, got {rate}")
+
+        self.period = 1000 / rate
+        self.maximum_gap = maximum_gap if maximum_gap is not None else 10 * self.period
+
+        self.previous_value = None
+        self.previous_time = None
+
+        self.next_index = None  # Index of the next grid point (time = index * period)
+
+    def update(self, values, timestamps):
+        """
+        Resample new samples
+
+        # Arguments
+
+        - values (numpy.ndarray of shape (n,)): values
+        - timestamps (numpy.ndarray of shape (n,)): timestamps of the values (ms), increasing
+
+        # Returns
+
+        - (numpy.ndarray, numpy.ndarray): values and timestamps of the grid points reached by the new samples
+        """
+
+        if timestamps.shape[0] == 0:
+            return values, timestamps
+
+        # The previous sample bounds the interpolation of the first grid points
+        if self.previous_time is not None:
+            values = numpy.concatenate(([self.previous_value], values))
+            timestamps = numpy.concatenate(([self.previous_time], timestamps))
+        else:
+            self.next_index = int(numpy.ceil(timestamps[0] / self.period))
+
+        self.previous_value = values[-1]
+        self.previous_time = timestamps[-1]
+
+        last_index = int(numpy.floor(timestamps[-1] / self.period))
+
+        if last_index < self.next_index:
+            return values[:0], timestamps[:0]
+
+        grid = numpy.arange(self.next_index, last_index + 1) * self.period
+
+        self.next_index = last_index + 1
+
+        # Samples around each grid point
+        before = numpy.searchsorted(timestamps, grid, side="right") - 1
+        after = numpy.minimum(before + 1, timestamps.shape[0] - 1)
+
+        kept = (timestamps[before] == grid) | (timestamps[after] - timestamps[before] <= self.maximum_gap)
+
+        grid = grid[kept]
+
+        return numpy.interp(grid, timestamps, values), grid
@@ -0,0 +1,373 @@
+import functools
+import numpy
+
+from buffer import RingBufferClass
+
+STATISTICS = ["mean", "min", "max", "m2"]
+
+class RollupClass:
+    def __init__(self, columns, resolutions=(1000, 10000, 60000, 600000), capacity=3600):
+        """
+        Multi-resolution rollups (count, mean, minimum, maximum and variance per time bucket) of sensor columns
+
+        The new samples are kept pending until the bucket of the finest resolution is complete, then the
+        complete samples are aggregated (vectorized) into the finest level. Each level keeps its completed buckets
+        in a ring buffer and its newest bucket open, and the buckets completed by a level are merged into the next
+        one, so a coarse level is only updated when one of its buckets may have changed.
+
+        # Arguments
+
+        - columns (list of str): aggregated columns
+        - resolutions (list of float): bucket duration of each level (ms), from the finest to the coarsest
+        - capacity (int): maximum number of buckets kept by each level (the oldest buckets of the finer levels are dropped
+          first, the coarser levels keep the older samples)
+
+        # Returns
+
+        - RollupClass: the rollups
+        """
+
+        self.columns = list(columns)
+        self.resolutions = list(resolutions)
+
+        self.dtype = numpy.dtype([("time", numpy.float64), ("count", numpy.float64)] + [(f"{column}_{statistic}", numpy.float64) for column in self.columns for statistic in STATISTICS])
+
+        self.levels = [RingBufferClass(self.dtype, capacity, functools.partial(self.evict, level)) for level in range(len(self.resolutions))]
+        self.dropped_until = [-numpy.inf] * len(self.resolutions)   # End of the newest bucket dropped by each level
+        self.current = [None] * len(self.resolutions)   # Open bucket of each level
+
+        self.pending = []       # Samples of the open bucket of the finest level
+        self.boundary = None    # End of the open bucket of the finest level
+
+    def evict(self, level, rows):
+        if rows.shape[0] > 0:
+            self.dropped_until[level] = float(rows["time"][-1]) + self.resolutions[level]
+
+    def aggregate(self, rows, resolution):
+        """
+        Aggregate samples per time bucket
+
+        # Arguments
+
+        - rows (numpy.ndarray or dict): samples with a time column and the aggregated columns, with increasing times
+        - resolution (float): bucket duration (ms)
+
+        # Returns
+
+        - numpy.ndarray: one row per non-empty bucket
+        """
+
+        n = rows["time"].shape[0]
+
+        if n == 0:
+            return numpy.zeros(0, dtype=self.dtype)
+
+        buckets = numpy.floor(rows["time"] / resolution)
+        starts = numpy.flatnonzero(numpy.concatenate(([True], buckets[1:] != buckets[:-1])))
+        counts = numpy.diff(numpy.append(starts, n))
+
+        aggregated = numpy.zeros(starts.shape[0], dtype=self.dtype)
+        aggregated["time"] = buckets[starts] * resolution
+        aggregated["count"] = counts
+
+        for column in self.columns:
+            values = rows[column]
+            mean = numpy.add.reduceat(values, starts) / counts
+
+            aggregated[f"{column}_mean"] = mean
+            aggregated[f"{column}_min"] = numpy.minimum.reduceat(values, starts)
+            aggregated[f"{column}_max"] = numpy.maximum.reduceat(values, starts)
+            aggregated[f"{column}_m2"] = numpy.add.reduceat((values - numpy.repeat(mean, counts)) ** 2, starts)
+
+        return aggregated
+
+    def merge(self, aggregated, resolution):
+        """
+        Merge aggregated rows per coarser time bucket (parallel variance algorithm)
+
+        # Arguments
+
+        - aggregated (numpy.ndarray): aggregated rows, with increasing times
+        - resolution (float): bucket duration (ms)
+
+        # Returns
+
+        - numpy.ndarray: one row per non-empty bucket
+        """
+
+        n = aggregated.shape[0]
+
+        if n == 0:
+            return aggregated
+
+        buckets = numpy.floor(aggregated["time"] / resolution)
+        starts = numpy.flatnonzero(numpy.concatenate(([True], buckets[1:] != buckets[:-1])))
+        sizes = numpy.diff(numpy.append(starts, n))
+
+        counts = aggregated["count"]
+
+        merged = numpy.zeros(starts.shape[0], dtype=self.dtype)
+        merged["time"] = buckets[starts] * resolution
+        merged["count"] = numpy.add.reduceat(counts, starts)
+
+        for column in self.columns:
+            means = aggregated[f"{column}_mean"]
+            mean = numpy.add.reduceat(counts * means, starts) / merged["count"]
+
+            merged[f"{column}_mean"] = mean
+            merged[f"{column}_min"] = numpy.minimum.reduceat(aggregated[f"{column}_min"], starts)
+            merged[f"{column}_max"] = numpy.maximum.reduceat(aggregated[f"{column}_max"], starts)
+            merged[f"{column}_m2"] = numpy.add.reduceat(aggregated[f"{column}_m2"] + counts * (means - numpy.repeat(mean, sizes)) ** 2, starts)
+
+        return merged
+
+    def combine(self, aggregated):
+        """
+        Combine aggregated rows into one (parallel variance algorithm)
+
+        # Arguments
+
+        - aggregated (numpy.ndarray): aggregated rows
+
+        # Returns
+
+        - numpy.ndarray of shape (1,): combined row, with the time of the first row
+        """
+
+        combined = numpy.zeros(1, dtype=self.dtype)
+
+        counts = aggregated["count"]
+        count = counts.sum()
+
+        combined["count"] = count
+
+        if count == 0:
+            return combined
+
+        combined["time"] = aggregated["time"][0]
+
+        for column in self.columns:
+            means = aggregated[f"{column}_mean"]
+            mean = (counts * means).sum() / count
+
+            combined[f"{column}_mean"] = mean
+            combined[f"{column}_min"] = aggregated[f"{column}_min"].min()
+            combined[f"{column}_max"] = aggregated[f"{column}_max"].max()
+            combined[f"{column}_m2"] = aggregated[f"{column}_m2"].sum() + (counts * (means - mean) ** 2).sum()
+
+        return combined
+
+    def update(self, rows):
+        """
+        Add new samples
+
+        # Arguments
+
+        - rows (numpy.ndarray): new samples with a time column and the aggregated columns, with increasing times
+        """
+
+        if rows.shape[0] == 0:
+            return
+
+        resolution = self.resolutions[0]
+
+        # The columns are kept as separate arrays, concatenating structured arrays is much slower
+        times = rows["time"]
+        self.pending.append([times] + [rows[column] for column in self.columns])
+
+        if self.boundary is None:
+            self.boundary = (numpy.floor(times[0] / resolution) + 1) * resolution
+
+        # Nothing to aggregate while the open bucket of the finest level is not complete
+        if times[-1] < self.boundary:
+            return
+
+        pending = self.get_pending()
+
+        open_start = numpy.floor(pending["time"][-1] / resolution) * resolution
+        split = numpy.searchsorted(pending["time"], open_start, side="left")
+
+        complete = {name: values[:split] for name, values in pending.items()}
+
+        self.pending = [[values[split:] for values in pending.values()]]
+        self.boundary = open_start + resolution
+
+        aggregated = self.aggregate(complete, resolution)
+
+        for level, resolution in enumerate(self.resolutions):
+            if aggregated.shape[0] == 0:
+                break
+
+            if level > 0:
+                aggregated = self.merge(aggregated, resolution)
+
+            current = self.current[level]
+            completed = aggregated[:-1]
+
+            if current is not None:
+                if current["time"][0] == aggregated["time"][0]:
+                    aggregated[:1] = self.combine(numpy.concatenate((current, aggregated[:1])))
+                else:
+                    completed = numpy.concatenate((current, completed))
+
+            self.levels[level].extend(completed)
+            self.current[level] = aggregated[-1:]
+
+            # The next level only receives the completed buckets
+            aggregated = completed
+
+    def get_pending(self):
+        """
+        Get the pending samples
+
+        # Returns
+
+        - dict: time and aggregated columns arrays
+        """
+
+        return {name: numpy.concatenate([block[i] for block in self.pending]) for i, name in enumerate(["time"] + self.columns)}
+
+    def get_level(self, resolution):
+        if resolution not in self.resolutions:
+            raise ValueError(f"No rollup at resolution {resolution}, available resolutions : {self.resolutions}")
+
+        return self.resolutions.index(resolution)
+
+    def get_rows(self, level):
+        """
+        Get the buckets of a level, including the open buckets
+
+        # Arguments
+
+        - level (int): level index
+
+        # Returns
+
+        - numpy.ndarray: aggregated rows (with the sum of the squared differences to the mean in the m2 columns)
+        """
+
+        resolution = self.resolutions[level]
+
+        # The open buckets of this level and of the finer levels, and the pending samples
+        tail = [self.current[finer] for finer in range(level, -1, -1) if self.current[finer] is not None]
+
+        if self.pending:
+            tail.append(self.aggregate(self.get_pending(), self.resolutions[0]))
+
+        tail = self.merge(numpy.concatenate(tail), resolution) if tail else numpy.zeros(0, dtype=self.dtype)
+
+        return numpy.concatenate((self.levels[level].view(), tail))
+
+    def get_values(self, resolution, start_time=None, end_time=None):
+        """
+        Get the buckets of a resolution in a time range
+
+        # Arguments
+
+        - resolution (float): bucket duration (ms), one of the resolutions of the rollups
+        - start_time (float or None): first bucket start (included), None from the oldest bucket
+        - end_time (float or None): last bucket start (excluded), None up to the newest bucket
+
+        # Returns
+
+        - numpy.ndarray: time, count and the mean, min, max and std (unbiased, NaN for a single sample) of each column per bucket
+        """
+
+        rows = self.get_rows(self.get_level(resolution))
+
+        first = 0 if start_time is None else numpy.searchsorted(rows["time"], start_time, side="left")
+        last = rows.shape[0] if end_time is None else numpy.searchsorted(rows["time"], end_time, side="left")
+
+        return self.finalize(rows[first:last])
+
+    def finalize(self, rows):
+        dtype = numpy.dtype([("time", numpy.float64), ("count", numpy.float64)] + [(f"{column}_{statistic}", numpy.float64) for column in self.columns for statistic in ["mean", "min", "max", "std"]])
+
+        values = numpy.zeros(rows.shape[0], dtype=dtype)
+        values["time"] = rows["time"]
+        values["count"] = rows["count"]
+
+        for column in self.columns:
+            for statistic in ["mean", "min", "max"]:
+                values[f"{column}_{statistic}"] = rows[f"{column}_{statistic}"]
+
+            std = numpy.full(rows.shape[0], numpy.nan)
+            numpy.sqrt(rows[f"{column}_m2"] / (rows["count"] - 1), out=std, where=rows["count"] > 1)
+
+            values[f"{column}_std"] = std
+
+        return values
+
+    def collect(self, level, start_time, end_time):
+        """
+        Get the buckets covering a time range, using the coarsest buckets inside the range and finer ones at its edges
+
+        The edges of the range are bucket-granular: when the finer levels already dropped the samples of an edge,
+        the coarse buckets overlapping the edge are used whole.
+
+        # Returns
+
+        - list of numpy.ndarray: aggregated rows
+        """
+
+        rows = self.get_rows(level)
+        resolution = self.resolutions[level]
+
+        if level == 0:
+            first = numpy.searchsorted(rows["time"], start_time, side="left")
+            last = numpy.searchsorted(rows["time"], end_time, side="left")
+
+            return [rows[first:last]]
+
+        first = numpy.searchsorted(rows["time"], start_time, side="left")
+        last = numpy.searchsorted(rows["time"], end_time - resolution, side="right")
+
+        def collect_edge(start, end):
+            if self.dropped_until[level - 1] <= start:
+                return self.collect(level - 1, start, end)
+
+            # The finer level no longer holds the start of the edge
+            overlapping = numpy.searchsorted(rows["time"], start - resolution, side="right"), numpy.searchsorted(rows["time"], end, side="left")
+
+            return [rows[overlapping[0]:overlapping[1]]]
+
+        if first >= last:
+            return collect_edge(start_time, end_time)
+
+        inside = rows[first:last]
+
+        return collect_edge(start_time, inside["time"][0]) + [inside] + collect_edge(inside["time"][-1] + resolution, end_time)
+
+    def get_statistics(self, column, start_time=None, end_time=None):
+        """
+        Get the statistics of a column over a time range from the rollups (at the finest resolution available), the cost
+        depends on the number of buckets covering the range and not on the number of samples
+
+        The edges of the range are rounded to the finest buckets still holding them (see `collect`).
+
+        # Arguments
+
+        - column (str): aggregated column
+        - start_time (float or None): start of the range (included, rounded to a bucket start), None from the oldest bucket
+        - end_time (float or None): end of the range (excluded, rounded to a bucket start), None up to the newest sample
+
+        # Returns
+
+        - dict: count, mean, std (unbiased), min and max
+        """
+
+        if column not in self.columns:
+            raise ValueError(f"No rollup of {column}, available columns : {self.columns}")
+
+        start_time = -numpy.inf if start_time is None else start_time
+        end_time = numpy.inf if end_time is None else end_time
+
+        combined = self.finalize(self.combine(numpy.concatenate(self.collect(len(self.resolutions) - 1, start_time, end_time))))[0]
+
+        return {
+            "count": int(combined["count"]),
+            "mean": float(combined[f"{column}_mean"]) if combined["count"] > 0 else numpy.nan,
+            "std": float(combined[f"{column}_std"]),
+            "min": float(combined[f"{column}_min"]) if combined["count"] > 0 else numpy.nan,
+            "max": float(combined[f"{column}_max"]) if combined["count"] > 0 else numpy.nan,
+        }
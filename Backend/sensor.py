@@ -1,15 +1,16 @@
+import os
 import numpy
 import logging
-import pandas
-from scipy.interpolate import interp1d
-from scipy.fft import fft, ifft
-from sklearn.preprocessing import StandardScaler
-from sklearn.linear_model import LinearRegression
-
-from scipy.signal import butter, sosfiltfilt
 
 import configuration
 
+from filtering import StreamingFilterClass, refine, get_sos
+
+from buffer import RingBufferClass
+from archive import ArchiveClass
+from downsampling import get_minmax_indexes, get_lttb_indexes
+from rollup import RollupClass
+
 class MinimumMaximumScaler:
     def __init__(self, minimum, maximum):
         self.minimum = minimum
@@ -65,15 +66,15 @@ def get_shift(signal1, timestamps1, signal2, timestamps2):
     common_time = numpy.linspace(max(timestamps1[0], timestamps2[0]), min(timestamps1[-1], timestamps2[-1]), num=1000)
 
     # Interpolate the signals on the common time grid
-    interp_signal1 = interp1d(timestamps1, signal1, kind='linear', fill_value="extrapolate")(common_time)
-    interp_signal2 = interp1d(timestamps2, signal2, kind='linear', fill_value="extrapolate")(common_time)
+    interp_signal1 = numpy.interp(common_time, timestamps1, signal1)
+    interp_signal2 = numpy.interp(common_time, timestamps2, signal2)
 
     # Compute the Fourier Transform of both signals
-    fft_signal1 = fft(interp_signal1)
-    fft_signal2 = fft(interp_signal2)
+    fft_signal1 = numpy.fft.fft(interp_signal1)
+    fft_signal2 = numpy.fft.fft(interp_signal2)
 
     # Compute the cross-correlation in the frequency domain
-    cross_correlation = ifft(fft_signal1 * numpy.conj(fft_signal2))
+    cross_correlation = numpy.fft.ifft(fft_signal1 * numpy.conj(fft_signal2))
 
     # Find the index of the maximum correlation
     maximum_correlation_index = numpy.argmax(numpy.abs(cross_correlation))
@@ -90,38 +91,317 @@ def get_shift(signal1, timestamps1, signal2, timestamps2):
 
     return -relative_shift_time 
 
+def get_interpolated_peaks(correlations):
+    """
+    Find the peak of each correlation with a sub-sample accuracy (parabolic interpolation around the maximum)
+
+    # Parameters:
+    - correlations (numpy array of shape (m, n)): The correlations, one per row.
+
+    # Returns:
+    - numpy array of shape (m,): The fractional index of the peak of each correlation.
+    """
+
+    n = correlations.shape[1]
+    rows = numpy.arange(correlations.shape[0])
+
+    peaks = numpy.argmax(correlations, axis=1)
+
+    # The correlations are circular, so the neighbours of the first and last samples wrap around
+    previous_values = correlations[rows, (peaks - 1) % n]
+    peak_values = correlations[rows, peaks]
+    next_values = correlations[rows, (peaks + 1) % n]
+
+    curvature = previous_values - 2 * peak_values + next_values
+
+    offsets = numpy.zeros(correlations.shape[0])
+    numpy.divide(0.5 * (previous_values - next_values), curvature, out=offsets, where=curvature < 0)
+
+    return peaks + numpy.clip(offsets, -0.5, 0.5)
+
+def get_common_grid(data, start, end, tolerance=1e-6):
+    """
+    Get the overlap of signals sampled on one fixed-rate grid (see `resampling.ResamplerClass`)
+
+    # Parameters:
+    - data (dict of dict of numpy arrays): The signals ("value") and timestamps ("time") for each sensor.
+    - start (float): The start of the overlap.
+    - end (float): The end of the overlap.
+    - tolerance (float): The relative tolerance on the time steps.
+
+    # Returns:
+    - (float, list of slice) or None: The time step and the overlap of each signal, None if the signals are not
+      sampled on one uniform grid (or if the overlap has less than 2 samples).
+    """
+
+    step = None
+    slices = []
+
+    for signal in data.values():
+        timestamps = signal["time"]
+
+        if timestamps.shape[0] < 2:
+            return None
+
+        if step is None:
+            step = (timestamps[-1] - timestamps[0]) / (timestamps.shape[0] - 1)
+
+        if step <= 0 or numpy.abs(numpy.diff(timestamps) - step).max() > tolerance * step:
+            return None
+
+        first = (start - timestamps[0]) / step
+
+        if abs(first - round(first)) > tolerance:
+            return None
+
+        first = round(first)
+        slices.append(slice(first, first + int(round((end - start) / step)) + 1))
+
+    if slices[0].stop - slices[0].start < 2:
+        return None
+
+    return step, slices
+
+def get_shift_matrix(data, num=1000):
+    """
+    Calculate the relative shifts between all the pairs of signals at once.
+
+    All the signals are resampled once on a common time grid (their overlap, or directly their samples if they are
+    already on one fixed-rate grid), transformed with a single stacked real FFT, and the cross-correlations of all the pairs are computed in one vectorized pass.
+    The signals are centered and zero-padded so that the correlations are linear (no wrap-around).
+
+    # Parameters:
+    - data (dict of dict of numpy arrays): The signals ("value") and timestamps ("time") for each sensor.
+    - num (int): The number of points of the common time grid (if the signals must be resampled).
+
+    # Returns:
+    - (list, numpy array of shape (n, n)): The signal names and the shifts matrix, where the element (i, j)
+      is the shift of the signal j relative to the signal i (as `get_shift(signal_i, ..., signal_j, ...)`).
+    """
+
+    names = list(data)
+
+    start = max(signal["time"][0] for signal in data.values())
+    end = min(signal["time"][-1] for signal in data.values())
+
+    if end <= start:
+        raise ValueError(f"The signals do not overlap in time ({start} >= {end})")
+
+    grid = get_common_grid(data, start, end)
+
+    if grid is not None and grid[1][0].stop - grid[1][0].start <= num:
+        # The signals are already on one fixed-rate grid (with at most `num` points), their overlap is used without interpolation
+        time_step, slices = grid
+
+        signals = numpy.array([signal["value"][window] for signal, window in zip(data.values(), slices)], dtype=float)
+        num = signals.shape[1]
+    else:
+        # Resample all the signals on the common time grid
+        common_time = numpy.linspace(start, end, num=num)
+        time_step = common_time[1] - common_time[0]
+
+        signals = numpy.array([numpy.interp(common_time, signal["time"], signal["value"]) for signal in data.values()])
+
+    signals -= signals.mean(axis=1, keepdims=True)
+
+    # One stacked FFT, zero-padded to get linear correlations
+    spectrums = numpy.fft.rfft(signals, n=2 * num, axis=1)
+
+    # Cross-correlations of the upper triangle pairs (the matrix is antisymmetric)
+    first, second = numpy.triu_indices(len(names), k=1)
+    correlations = numpy.fft.irfft(spectrums[first] * numpy.conj(spectrums[second]), n=2 * num, axis=1)
+
+    peaks = get_interpolated_peaks(correlations)
+
+    # Convert the peaks to signed lags on the common time grid
+    lags = numpy.where(peaks < num, peaks, peaks - 2 * num)
+
+    shifts = numpy.zeros((len(names), len(names)))
+    shifts[first, second] = -lags * time_step
+    shifts[second, first] = lags * time_step
+
+    return names, shifts
+
+def get_consistent_shifts(shifts):
+    """
+    Get the shifts of each signal relative to the first one that best fit all the pairwise shifts (least squares)
+
+    # Parameters:
+    - shifts (numpy array of shape (n, n)): The antisymmetric shifts matrix (see `get_shift_matrix`).
+
+    # Returns:
+    - numpy array of shape (n,): The shifts relative to the first signal.
+    """
+
+    # For a complete set of pairs, the least squares solution of t_j - t_i = shifts[i, j] is the mean of the columns
+    arrival_times = shifts.mean(axis=0)
+
+    return arrival_times - arrival_times[0]
+
 def get_shifts(data):
     """
     Calculate the relative shifts between the first signal and all other signals using their timestamps.
 
+    The shifts are estimated from all the pairs of signals (see `get_shift_matrix`), the redundant pairs
+    reducing the error of each shift.
+
     # Parameters:
-    - data (dict of dataframes of shape (n, 2)): The signals and timestamps for each sensor.
+    - data (dict of dict of numpy arrays): The signals ("value") and timestamps ("time") for each sensor.
     
     # Returns:
     - dict : The relative shifts between the first signal and all other signals.
     """
 
-    reference_signal = next(iter(data))
-    reference_value = data[reference_signal]["value"].values
-    reference_time = data[reference_signal]["time"].values
+    if len(data) < 2:
+        return {name: 0 for name in data}
+
+    names, shifts = get_shift_matrix(data)
+
+    return dict(zip(names, get_consistent_shifts(shifts)))
+
+
+class SlidingShiftClass:
+    def __init__(self, window_size=10, hop_size=1, time_step=None):
+        """
+        Incremental sliding shift between two signals.
+
+        Both signals are resampled once on a common uniform time grid, only the grid points after the
+        previous update are interpolated, and the windows that became complete are cross-correlated
+        together with one stacked FFT, so each sample is processed once instead of once per window.
+
+        # Parameters:
+        - window_size (int): The size of the window to slide over the signals, in grid samples.
+        - hop_size (int): The number of grid samples between two consecutive windows.
+        - time_step (float or None): The step of the common time grid, None for the median sampling period of the first signal.
+
+        # Returns:
+        - SlidingShiftClass: The sliding shift.
+        """
+
+        if window_size < 2 or hop_size < 1:
+            raise ValueError(f"Invalid window size {window_size} or hop size {hop_size}")
+
+        self.window_size = window_size
+        self.hop_size = hop_size
+        self.time_step = time_step
+
+        self.origin = None
+
+        # Resampled signals from the grid index `offset` (the older samples are not needed anymore)
+        self.offset = 0
+        self.signal1 = numpy.zeros(0)
+        self.signal2 = numpy.zeros(0)
+
+        # Grid index of the next window start
+        self.next_start = 0
+
+        self.shifts = numpy.zeros(0)
+        self.shifts_timestamps = numpy.zeros(0)
+
+    def update(self, signal1, timestamps1, signal2, timestamps2):
+        """
+        Update the sliding shift with the current signals (usually the previous signals and the new samples).
+
+        # Parameters:
+        - signal1 (numpy array): The first signal.
+        - timestamps1 (numpy array): The timestamps for the first signal.
+        - signal2 (numpy array): The second signal.
+        - timestamps2 (numpy array): The timestamps for the second signal.
+
+        # Returns:
+        - (numpy array, numpy array): The shift of the second signal relative to the first one for each window
+          position, and the timestamp of the start of each window.
+        """
+
+        if len(signal1) < 2 or len(signal2) < 2:
+            return (self.shifts, self.shifts_timestamps)
+
+        if self.origin is None:
+            self.origin = max(timestamps1[0], timestamps2[0])
+
+            if self.time_step is None:
+                self.time_step = numpy.median(numpy.diff(timestamps1))
+
+        # Extend the common grid up to the end of the overlap
+        end = min(timestamps1[-1], timestamps2[-1])
+
+        count = self.offset + self.signal1.shape[0]
+        new_count = int(numpy.floor((end - self.origin) / self.time_step)) + 1
+
+        if new_count > count:
+            new_time = self.origin + self.time_step * numpy.arange(count, new_count)
+
+            self.signal1 = numpy.concatenate((self.signal1, interpolate_tail(new_time, timestamps1, signal1)))
+            self.signal2 = numpy.concatenate((self.signal2, interpolate_tail(new_time, timestamps2, signal2)))
+
+        # Correlate the complete windows
+        starts = numpy.arange(self.next_start, new_count - self.window_size + 1, self.hop_size)
+
+        if starts.shape[0] > 0:
+            shifts = get_windows_shifts(self.signal1, self.signal2, starts - self.offset, self.window_size) * self.time_step
+
+            self.shifts = numpy.concatenate((self.shifts, shifts))
+            self.shifts_timestamps = numpy.concatenate((self.shifts_timestamps, self.origin + self.time_step * starts))
+
+            self.next_start = starts[-1] + self.hop_size
+
+            # Forget the resampled samples before the next window
+            dropped = min(self.next_start, new_count) - self.offset
+            self.signal1 = self.signal1[dropped:]
+            self.signal2 = self.signal2[dropped:]
+            self.offset += dropped
+
+        return (self.shifts, self.shifts_timestamps)
+
+def interpolate_tail(time, timestamps, signal):
+    """
+    Linearly interpolate a signal at increasing times located at the end of the signal, without scanning the whole signal.
+
+    # Parameters:
+    - time (numpy array): The increasing times to interpolate at.
+    - timestamps (numpy array): The timestamps of the signal.
+    - signal (numpy array): The signal.
+
+    # Returns:
+    - numpy array: The interpolated values.
+    """
+
+    start = max(0, numpy.searchsorted(timestamps, time[0]) - 1)
+
+    return numpy.interp(time, timestamps[start:], signal[start:])
+
+def get_windows_shifts(signal1, signal2, starts, window_size):
+    """
+    Calculate the shift between the windows of two uniformly sampled signals with one stacked FFT.
+
+    # Parameters:
+    - signal1 (numpy array): The first signal.
+    - signal2 (numpy array): The second signal.
+    - starts (numpy array): The indexes of the windows starts.
+    - window_size (int): The size of the windows.
+
+    # Returns:
+    - numpy array: The shift of each window of the second signal relative to the first one, in samples.
+    """
 
+    indexes = starts[:, numpy.newaxis] + numpy.arange(window_size)
 
-    shifts = {}
-    shifts[reference_signal] = 0
+    windows1 = signal1[indexes]
+    windows2 = signal2[indexes]
 
-    for name, signal in data.items():
-        if name == reference_signal:
-            continue
+    windows1 = windows1 - windows1.mean(axis=1, keepdims=True)
+    windows2 = windows2 - windows2.mean(axis=1, keepdims=True)
 
-        current_value = signal["value"].values
-        current_time = signal["time"].values
+    # Zero-padded to get linear correlations
+    correlations = numpy.fft.irfft(numpy.fft.rfft(windows1, n=2 * window_size, axis=1) * numpy.conj(numpy.fft.rfft(windows2, n=2 * window_size, axis=1)), n=2 * window_size, axis=1)
 
-        shifts[name] = get_shift(reference_value, reference_time, current_value, current_time)
+    peaks = get_interpolated_peaks(correlations)
 
-    return shifts
+    lags = numpy.where(peaks < window_size, peaks, peaks - 2 * window_size)
 
+    return -lags
 
-def get_sliding_shift(signal1, timestamps1, signal2, timestamps2, window_size=10):
+def get_sliding_shift(signal1, timestamps1, signal2, timestamps2, window_size=10, hop_size=1):
     """
     Calculate the sliding shift between two signals using a specified window size.
 
@@ -130,31 +410,17 @@ def get_sliding_shift(signal1, timestamps1, signal2, timestamps2, window_size=10
     timestamps1 (numpy array): The timestamps for the first signal.
     signal2 (numpy array): The second signal.
     timestamps2 (numpy array): The timestamps for the second signal.
-    window_size (int): The size of the window to slide over the signals.
+    window_size (int): The size of the window to slide over the signals (in samples of the first signal).
+    hop_size (int): The number of samples between two consecutive windows.
 
     Returns:
-    list: A list of calculated shifts for each window position.
+    (numpy array, numpy array): The calculated shifts for each window position and the timestamps of the windows starts.
     """
 
     if len(signal1) < window_size or len(signal2) < window_size:
         raise ValueError("The signals must be at least as long as the window size.")
 
-    num_windows = len(signal1) - window_size + 1
-
-    shifts = numpy.zeros(num_windows)
-    shifts_timestamps = numpy.zeros(num_windows)
-
-    for i in range(num_windows):
-        window_signal1 = signal1[i:i + window_size]
-        window_timestamps1 = timestamps1[i:i + window_size]
-        window_signal2 = signal2[i:i + window_size]
-        window_timestamps2 = timestamps2[i:i + window_size]
-
-        shifts[i] = get_shift(window_signal1, window_timestamps1, window_signal2, window_timestamps2)
-
-        shifts_timestamps[i] = window_timestamps1[0]
-        
-    return (shifts, shifts_timestamps)
+    return SlidingShiftClass(window_size, hop_size).update(signal1, timestamps1, signal2, timestamps2)
 
 class VoltageDividerClass:
     def __init__(self, R_2, V_in):
@@ -177,13 +443,21 @@ class VoltageDividerClass:
         Get the resistance of the first resistor in the voltage divider circuit (R_1 between V_in and V_out).
 
         # Parameters:
-        - V_out (float): The output voltage of the voltage divider circuit.
+        - V_out (float or numpy.ndarray): The output voltage of the voltage divider circuit.
     
         # Returns:
-        - float: The resistance of the second resistor.
+        - float or numpy.ndarray: The resistance of the second resistor, NaN where V_out is out of the ]0, V_in[ range.
         """
 
-        return self.R_2 * (self.V_in - V_out) / V_out
+        V_out = numpy.asarray(V_out, dtype=float)
+
+        # Masked instead of dividing by zero or returning a negative resistance
+        valid = (V_out > 0) & (V_out < self.V_in)
+
+        R_1 = numpy.full(V_out.shape, numpy.nan)
+        numpy.divide(self.R_2 * (self.V_in - V_out), V_out, out=R_1, where=valid)
+
+        return R_1[()]
 
 class CalibrationCurveClass:
     def __init__(self, R_0, a, b):
@@ -213,23 +487,43 @@ class CalibrationCurveClass:
 
         # Returns:
 
-        - float: The concentration of the gas.
+        - float or numpy.ndarray: The concentration of the gas, NaN where the resistance is not positive.
         """
 
-        ratio = numpy.log10(resistance / self.R_0)  # log(R / R_0)
+        resistance = numpy.asarray(resistance, dtype=float)
+
+        ratio = numpy.full(resistance.shape, numpy.nan)
+        numpy.log10(resistance / self.R_0, out=ratio, where=resistance > 0)  # log(R / R_0)
+
         division = (ratio - self.b) / self.a # (log(R / R_0) - b) / a
-        return numpy.power(10, division) # 10^((log(R / R_0) - b) / a)
+
+        with numpy.errstate(over="ignore"):
+            return numpy.power(10, division)[()] # 10^((log(R / R_0) - b) / a)
 
       
+# Columns of the samples stored by the gas sensors
+SAMPLE_DTYPE = numpy.dtype([
+    ("time", numpy.float64),
+    ("raw_value", numpy.float64),
+    ("raw_value_filtered", numpy.float64),
+    ("raw_value_filtered_gradient", numpy.float64),
+    ("resistance", numpy.float64),
+    ("concentration", numpy.float64),
+    ("concentration_filtered", numpy.float64),
+    ("concentration_filtered_gradient", numpy.float64)])
+
 class GazSensorClass:
-    def __init__(self, configuration, maximum_values=10000):
+    def __init__(self, configuration, maximum_values=10000, filtering_mode="streaming", refinement_window=None, archive=None):
         """
         Create a new gas sensor
 
         # Arguments
 
         - configuration (dict): sensor configuration
-        - maximum_values (int): maximum number of values
+        - maximum_values (int): maximum number of values kept in memory (the oldest values are dropped)
+        - filtering_mode (str): "streaming" for the causal O(1) filter, "full" to re-filter the whole history at each sample
+        - refinement_window (int or None): size of the trailing window re-filtered with a zero-phase filter in streaming mode, None to disable
+        - archive (str or None): directory of the archive receiving the values dropped from memory, None to drop them
 
         # Returns
         - GazSensorClass: new gas sensor
@@ -239,59 +533,114 @@ class GazSensorClass:
         self.voltage_divider = VoltageDividerClass(configuration["R_2"], configuration["V_in"])
         self.calibration_curve = CalibrationCurveClass(configuration["R_0"], configuration["a"], configuration["b"])
 
-        self.data = pandas.DataFrame(numpy.zeros((maximum_values, 8)), 
-            columns=["time",
-            "raw_value",
-            "raw_value_filtered",
-            "raw_value_filtered_gradient",
-            "resistance",
-            "concentration",
-            "concentration_filtered",
-            "concentration_filtered_gradient"])
+        self.archive = ArchiveClass(archive, SAMPLE_DTYPE) if archive is not None else None
+
+        self.data = RingBufferClass(SAMPLE_DTYPE, maximum_values, self.archive.append if self.archive is not None else None)
+
+        # Rollups of the columns which are not modified after the append (the filtered columns are refined)
+        self.rollup = RollupClass(["raw_value", "resistance", "concentration"])
 
         self.butterworth = None
+        self.butterworth_frequency = None   # Sample frequency of the filter design (Hz)
         self.filtering_chunk_size = 64
+        self.redesign_tolerance = 0.1       # Relative drift of the sample frequency triggering a new design
+
+        if filtering_mode not in ("streaming", "full"):
+            raise ValueError(f"Unknown filtering mode: {filtering_mode}")
+
+        if refinement_window is not None and refinement_window < 2 * self.filtering_chunk_size:
+            raise ValueError(f"Refinement window must be at least {2 * self.filtering_chunk_size} samples")
+
+        self.filtering_mode = filtering_mode
+        self.refinement_window = refinement_window
+
+        self.raw_value_filter = None
+        self.concentration_filter = None
 
         self.index = 0
 
         self.excitement_index = None
         self.excitement_threshold = 1e-5
 
+        self.latest_time = None  # Timestamp of the newest sample
+
+        self.rejected = 0   # Number of samples dropped because they could not be converted
+
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """
+        Add a listener notified after each block of appended samples
+
+        # Arguments
+
+        - listener (function): called with the gas sensor, from the thread updating the sensor
+        """
+
+        self.listeners.append(listener)
+
     def update(self, value : float, timestamp : float):
-        i = self.index
+        self.update_many([value], [timestamp])
 
-        if i >= self.data.shape[0]:
-            raise ValueError("Too many values for sensor")
+    def update_many(self, values, timestamps):
+        """
+        Append a block of samples and filter them, the samples which can not be converted to a concentration
+        (missing value, value out of the voltage divider range) are dropped and counted in `rejected`
+
+        # Arguments
+
+        - values (numpy.ndarray of shape (n,)): raw values (V)
+        - timestamps (numpy.ndarray of shape (n,)): timestamps of the values (ms), increasing
+        """
+
+        values = numpy.asarray(values, dtype=float)
+        timestamps = numpy.asarray(timestamps, dtype=float)
 
         # Get the resistance of the sensor
-        resistance = self.voltage_divider.get_R1(value)
+        resistance = self.voltage_divider.get_R1(values)
 
         # Get the concentration of the gas
-        concentration = self.calibration_curve.get_concentration(resistance)           
+        concentration = self.calibration_curve.get_concentration(resistance)
 
-        previous_index = i - 1
+        # Drop the samples which can not be converted (missing value, out of the divider range, ...)
+        valid = numpy.isfinite(concentration) & numpy.isfinite(timestamps)
 
-        time_difference = (timestamp - self.data.iloc[previous_index]["time"]) / 1000
-    
-        if i > 0:
+        if not valid.all():
+            self.rejected += int((~valid).sum())
 
-            if time_difference < 0:
-                raise ValueError(f"Timestamps must be increasing : {timestamp} <= {self.data.iloc[previous_index]['time']} for index {i}")
+            values = values[valid]
+            timestamps = timestamps[valid]
+            resistance = resistance[valid]
+            concentration = concentration[valid]
 
+        n = values.shape[0]
 
-            # Calculate the gradients
-            concentration_gradient = (concentration - self.data.iloc[previous_index]["concentration"]) / time_difference
-        
+        if n == 0:
+            return
+
+        if len(self.data) > 0:
+            previous_time = self.data.view()["time"][-1]
+        elif self.archive is not None and len(self.archive) > 0:
+            previous_time = self.archive.get_rows(len(self.archive) - 1, len(self.archive))["time"][0]
         else:
-            raw_value_gradient = 0
-            resistance_gradient = 0
-            concentration_gradient = 0
+            previous_time = timestamps[0]
+
+        if numpy.any(numpy.diff(timestamps, prepend=previous_time) < 0):
+            raise ValueError(f"Timestamps must be increasing : {timestamps} after {previous_time} for index {self.index}")
 
         # Update the data
-        self.data.iloc[i] = [timestamp, value, 0, 0, resistance, concentration, 0, 0]
+        rows = numpy.zeros(n, dtype=SAMPLE_DTYPE)
+        rows["time"] = timestamps
+        rows["raw_value"] = values
+        rows["resistance"] = resistance
+        rows["concentration"] = concentration
+
+        self.data.extend(rows)
+        self.rollup.update(rows)
 
         # Increment the index
-        self.index += 1
+        previous_index = self.index
+        self.index += n
 
         i = self.index
 
@@ -299,69 +648,349 @@ class GazSensorClass:
         if i >= self.filtering_chunk_size:
 
             if self.butterworth is None:
-                sample_frequency = self.get_sample_frequency()
-                self.butterworth = butter(4, Wn=0.1, fs=sample_frequency, output="sos", btype="lowpass")
-            
-            previous_chunk_index = i - self.filtering_chunk_size
+                self.butterworth_frequency = self.get_sample_frequency()
+                self.butterworth = get_sos(4, 0.1, self.butterworth_frequency)
 
-            self.data["raw_value_filtered"].values[:i] = sosfiltfilt(self.butterworth, self.data["raw_value"].values[:i])
+                if self.filtering_mode == "streaming":
+                    self.raw_value_filter = StreamingFilterClass(self.butterworth)
+                    self.concentration_filter = StreamingFilterClass(self.butterworth)
 
-            self.data["raw_value_filtered_gradient"].values[:i] = numpy.abs(numpy.gradient(self.data["raw_value_filtered"].values[:i], self.data["time"].values[:i]))
+                    # Catch up with the samples acquired before the filter design
+                    self.filter_streaming(len(self.data))
+                    
+            elif self.filtering_mode == "streaming":
+                self.filter_streaming(min(n, len(self.data)))
 
-            self.data["concentration_filtered"].values[:i] = sosfiltfilt(self.butterworth, self.data["concentration"].values[:i])
+            if self.filtering_mode == "full":
+                self.filter_full()
 
-            self.data["concentration_filtered_gradient"].values[:i] = numpy.abs(numpy.gradient(self.data["concentration_filtered"].values[:i], self.data["time"].values[:i]))
+            # Find the excitement index among the new samples acquired after the first chunk
+            if self.excitement_index is None:
+                checked = min(n, i - self.filtering_chunk_size + 1, len(self.data))
 
-            # Find the excitement index
-            if self.data["raw_value_filtered_gradient"].values[i - 1] > self.excitement_threshold:
-                if self.excitement_index is None:
+                excited = numpy.flatnonzero(self.data.view()["raw_value_filtered_gradient"][-checked:] > self.excitement_threshold)
+
+                if excited.shape[0] > 0:
                     sample_frequency = self.get_sample_frequency()
 
-                    print(f"i = {i}, sample_frequency = {sample_frequency}")
+                    excitement_sample = i - checked + excited[0] + 1
+
+                    logging.debug(f"Excitement at sample {excitement_sample}, sample frequency {sample_frequency} Hz")
+
+                    self.excitement_index = excitement_sample - int(2 / (1/sample_frequency)) # 2 seconds before the excitement
+
+            if i // self.filtering_chunk_size > previous_index // self.filtering_chunk_size:
+                # Re-design the filter when the sample rate drifted (once per chunk)
+                self.check_sample_frequency()
+
+                # Refine the trailing window with a zero-phase filter (once per chunk to bound the cost)
+                if self.filtering_mode == "streaming" and self.refinement_window is not None:
+                    self.refine()
+
+        self.latest_time = timestamps[-1]
+
+        for listener in self.listeners:
+            listener(self)
+
+    def check_sample_frequency(self):
+        """
+        Re-design the filter if the sample frequency of the newest chunk drifted from the one of the design
+        """
+
+        sample_frequency = self.get_sample_frequency(self.filtering_chunk_size)
+
+        if abs(sample_frequency - self.butterworth_frequency) <= self.redesign_tolerance * self.butterworth_frequency:
+            return
+
+        logging.info(f"Sample frequency drifted from {self.butterworth_frequency:.3g} Hz to {sample_frequency:.3g} Hz, re-designing the filter")
+
+        self.butterworth_frequency = sample_frequency
+        self.butterworth = get_sos(4, 0.1, sample_frequency)
+
+        if self.filtering_mode == "streaming":
+            self.raw_value_filter.set_sos(self.butterworth)
+            self.concentration_filter.set_sos(self.butterworth)
+
+    def filter_streaming(self, n):
+        """
+        Filter the n newest samples with the causal streaming filters
+
+        # Arguments
+
+        - n (int): number of samples to filter
+        """
+
+        data = self.data.view()[-n:]
 
-                    self.excitement_index = i - int(2 / (1/sample_frequency)) # 2 seconds before the excitement
+        filtered, gradient = self.raw_value_filter.update(data["raw_value"], data["time"])
+        data["raw_value_filtered"] = filtered
+        data["raw_value_filtered_gradient"] = gradient
+
+        filtered, gradient = self.concentration_filter.update(data["concentration"], data["time"])
+        data["concentration_filtered"] = filtered
+        data["concentration_filtered_gradient"] = gradient
+
+    def filter_full(self):
+        """
+        Filter the whole history with a zero-phase filter (cost grows with the history length)
+        """
+
+        data = self.data.view()
+
+        data["raw_value_filtered"], data["raw_value_filtered_gradient"] = refine(self.butterworth, data["raw_value"], data["time"])
+
+        data["concentration_filtered"], data["concentration_filtered_gradient"] = refine(self.butterworth, data["concentration"], data["time"])
+
+    def refine(self):
+        """
+        Re-filter the trailing window with a zero-phase filter, only the newest half of the window is written
+        back since the oldest half suffers from the window edge transient
+        """
+
+        data = self.data.view()[-self.refinement_window:]
+        written = max(0, data.shape[0] - self.refinement_window // 2)
+
+        filtered, gradient = refine(self.butterworth, data["raw_value"], data["time"])
+        data["raw_value_filtered"][written:] = filtered[written:]
+        data["raw_value_filtered_gradient"][written:] = gradient[written:]
+
+        filtered, gradient = refine(self.butterworth, data["concentration"], data["time"])
+        data["concentration_filtered"][written:] = filtered[written:]
+        data["concentration_filtered_gradient"][written:] = gradient[written:]
             
     def get_current_index(self):
         return self.index
 
-    def get_sample_frequency(self):
-        i = self.index
+    def get_latest_time(self):
+        """
+        Get the timestamp of the newest sample
 
-        if i == 0:
-            raise ValueError("No values for sensor")
+        # Returns
+
+        - float or None: timestamp, None if the sensor has no values
+        """
+
+        return self.latest_time
+
+    def get_rejected(self):
+        return self.rejected
+
+    def get_first_index(self, timestamp):
+        """
+        Get the index of the first value acquired at or after a timestamp (binary search on the time column)
 
-        return 1 / (numpy.diff(self.data.iloc[:i]["time"]).mean() / 1000)
+        # Arguments
+
+        - timestamp (float): timestamp
+
+        # Returns
+
+        - int: index in the values returned by `get_all_values`
+        """
+
+        return int(numpy.searchsorted(self.data.view()["time"], timestamp, side="left"))
+
+    def get_sample_frequency(self, window=None):
+        """
+        Get the mean sample frequency of the values kept in memory (O(1), the mean of the time differences is the
+        span divided by their number)
+
+        # Arguments
+
+        - window (int or None): number of newest values to consider, None for all the values in memory
+
+        # Returns
+
+        - float: sample frequency (Hz)
+        """
+
+        times = self.data.view()["time"]
+
+        if window is not None:
+            times = times[-window:]
+
+        if times.shape[0] < 2:
+            raise ValueError("Not enough values for sensor")
+
+        return 1 / ((times[-1] - times[0]) / (times.shape[0] - 1) / 1000)
 
     def get_latest_values(self):
-        i = self.index
+        data = self.data.view()
         
-        if i == 0:
+        if data.shape[0] == 0:
             raise ValueError("No values for sensor")
         
-        return self.data.iloc[i - 1]
+        return data[-1]
 
     def get_excitement_index(self):
-        return self.excitement_index
+        """
+        Get the excitement index
 
-    def get_all_values(self):
-        i = self.index
+        # Returns
+
+        - int or None: index of the excitement in the values returned by `get_all_values`, None if the sensor is not excited
+        """
+
+        if self.excitement_index is None:
+            return None
+
+        return max(0, self.excitement_index - self.data.get_dropped())
+
+    def get_all_values(self, start=None, end=None):
+        """
+        Get all the values kept in memory, or the values of a time range including the archived ones
+
+        # Arguments
+
+        - start (float or None): first timestamp (included), None from the beginning
+        - end (float or None): last timestamp (excluded), None up to the newest value
+
+        # Returns
+
+        - numpy.ndarray of dtype SAMPLE_DTYPE: zero-copy view on the values kept in memory (valid until the next update)
+          if no range is given, else a copy of the values of the range
+        """
+
+        data = self.data.view()
+
+        if start is None and end is None:
+            return data
+
+        first = 0 if start is None else numpy.searchsorted(data["time"], start, side="left")
+        last = data.shape[0] if end is None else numpy.searchsorted(data["time"], end, side="left")
+
+        values = data[first:last]
+
+        # The archive only holds the values older than the ones in memory
+        if self.archive is not None and first == 0 and len(self.archive) > 0:
+            values = numpy.concatenate((self.archive.get_values(start, end), values))
+        else:
+            values = values.copy()
+
+        return values
+
+    def get_values(self, start_time=None, end_time=None, columns=None, max_points=None, downsampling="lttb"):
+        """
+        Get the values of a time range, optionally downsampled
+
+        # Arguments
+
+        - start_time (float or None): first timestamp (included), None from the oldest value
+        - end_time (float or None): last timestamp (excluded), None up to the newest value
+        - columns (list or None): columns of the values (the time is always included), None for all
+        - max_points (int or None): maximum number of returned values, None for all the values of the range
+        - downsampling (str): "lttb" (Largest-Triangle-Three-Buckets) or "minmax" (minimum and maximum of each bucket),
+          computed on the first column other than the time
+
+        # Returns
+
+        - numpy.ndarray: values of the range, a zero-copy view when they are in memory and not downsampled
+        """
+
+        if downsampling not in ("lttb", "minmax"):
+            raise ValueError(f"Unknown downsampling: {downsampling}")
+
+        data = self.data.view()
+
+        # The values older than the memory are read from the archive
+        if self.archive is not None and len(self.archive) > 0 and (data.shape[0] == 0 or start_time is None or start_time < data["time"][0]):
+            data = self.get_all_values(start_time, end_time)
+        else:
+            first = 0 if start_time is None else numpy.searchsorted(data["time"], start_time, side="left")
+            last = data.shape[0] if end_time is None else numpy.searchsorted(data["time"], end_time, side="left")
+
+            data = data[first:last]
+
+        if columns is not None:
+            data = data[["time"] + [column for column in columns if column != "time"]]
+
+        if max_points is not None and data.shape[0] > max_points:
+            names = [name for name in data.dtype.names if name != "time"]
+            y = data[names[0]] if names else data["time"]
+
+            if downsampling == "lttb":
+                indexes = get_lttb_indexes(data["time"], y, max_points)
+            else:
+                indexes = get_minmax_indexes(y, max_points // 2)
+
+            data = data[indexes]
+
+        return data
+
+    def get_rollup(self, resolution, start_time=None, end_time=None):
+        """
+        Get the rollups of a resolution (see `RollupClass.get_values`)
+
+        # Arguments
+
+        - resolution (float): bucket duration (ms), 1000, 10000, 60000 or 600000
+        - start_time (float or None): first bucket start (included)
+        - end_time (float or None): last bucket start (excluded)
 
-        return self.data.iloc[:i]
+        # Returns
+
+        - numpy.ndarray: time, count and mean, min, max and std of raw_value, resistance and concentration per bucket
+        """
+
+        return self.rollup.get_values(resolution, start_time, end_time)
+
+    def get_statistics(self, column, start_time=None, end_time=None):
+        """
+        Get the statistics of a column since the first value (or over a time range) from the rollups
+
+        # Arguments
+
+        - column (str): "raw_value", "resistance" or "concentration"
+        - start_time (float or None): start of the range (included), the edges of the range are bucket-granular (see `RollupClass.collect`)
+        - end_time (float or None): end of the range (excluded)
+
+        # Returns
+
+        - dict: count, mean, std, min and max
+        """
+
+        return self.rollup.get_statistics(column, start_time, end_time)
+
+    def close(self):
+        """
+        Spill the values kept in memory to the archive and close it
+        """
+
+        if self.archive is None:
+            return
+
+        self.archive.append(self.data.view())
+        self.archive.close()
+
+        self.archive = None
+
+    def get_dataframe(self):
+        """
+        Get a copy of all the values kept in memory as a DataFrame
+
+        # Returns
+
+        - pandas.DataFrame: values
+        """
+
+        import pandas
+
+        return pandas.DataFrame(self.data.view())
 
     def get_gradient(self):
-        i = self.index
+        data = self.data.view()
 
-        if i == 0:
+        if data.shape[0] == 0:
             raise ValueError("No values for sensor")
 
-        data = self.data.iloc[:i].copy()
-
         concentration_gradient = numpy.gradient(data["concentration"], data["time"])
 
         resistance_gradient = numpy.gradient(data["resistance"], data["time"])
 
         raw_value_gradient = numpy.gradient(data["raw_value"], data["time"])
 
+        import pandas
+
         return pandas.DataFrame({
             "time": data["time"],
             "raw_value": raw_value_gradient,
@@ -378,23 +1007,26 @@ class GazSensorClass:
         - float: response time (average time difference between values)
         """
 
-        i = self.index
+        data = self.data.view()
 
-        if i == 0:
+        if data.shape[0] == 0:
             raise ValueError("No values for sensor")
 
-        data = self.data.iloc[:i].copy()
-
         time_differences = numpy.diff(data["time"])
 
         return numpy.mean(time_differences)
 
 class SensorClass:
     
-    def __init__(self, configuration):
+    def __init__(self, configuration, archive=None):
         """
         Create a new sensor
 
+        # Arguments
+
+        - configuration (SensorConfigurationClass): sensor configuration
+        - archive (str or None): directory of the archives of the gas sensors (one sub-directory per gas sensor type), None to disable
+
         # Returns
         - SensorClass: new sensor    
         """
@@ -404,14 +1036,51 @@ class SensorClass:
         self.sensors = {}
 
         for name, sensor_configuration in self.configuration.sensors.items():
-            self.sensors[name] = GazSensorClass(sensor_configuration, self.configuration.maximum_values)
+            gaz_sensor_archive = os.path.join(archive, name) if archive is not None else None
+
+            self.sensors[name] = GazSensorClass(sensor_configuration, self.configuration.maximum_values, self.configuration.filtering_mode, self.configuration.refinement_window, gaz_sensor_archive)
+
+    def close(self):
+        for sensor in self.sensors.values():
+            sensor.close()
           
     def update(self, gaz_sensors_type, value, timestamp):
         if gaz_sensors_type not in self.sensors:
             raise ValueError(f"Sensor does not have {gaz_sensors_type}")
 
         self.sensors[gaz_sensors_type].update(value, timestamp)
+
+    def update_many(self, gaz_sensors_type, values, timestamps):
+        """
+        Append a block of samples to a gas sensor
+
+        # Arguments
+
+        - gaz_sensors_type (str): gaz sensor type
+        - values (numpy.ndarray of shape (n,)): raw values
+        - timestamps (numpy.ndarray of shape (n,)): timestamps of the values, increasing
+        """
+
+        if gaz_sensors_type not in self.sensors:
+            raise ValueError(f"Sensor does not have {gaz_sensors_type}")
+
+        self.sensors[gaz_sensors_type].update_many(values, timestamps)
               
+    def add_listener(self, gaz_sensors_type, listener):
+        """
+        Add a listener notified after each block of samples appended to a gas sensor
+
+        # Arguments
+
+        - gaz_sensors_type (str): gaz sensor type
+        - listener (function): called with the gas sensor (see `GazSensorClass.add_listener`)
+        """
+
+        if gaz_sensors_type not in self.sensors:
+            raise ValueError(f"Sensor does not have {gaz_sensors_type}")
+
+        self.sensors[gaz_sensors_type].add_listener(listener)
+
     def get_position(self):
         return self.configuration.x, self.configuration.y
 
@@ -430,7 +1099,7 @@ class SensorClass:
 
         # Returns
 
-        - pandas.Series or dict: values
+        - numpy.void: values
         """
 
         if gaz_sensors_type not in self.sensors:
@@ -438,28 +1107,64 @@ class SensorClass:
 
         return self.sensors[gaz_sensors_type].get_latest_values()
 
-    def get_all_values(self, gaz_sensors_type=None):
+    def get_all_values(self, gaz_sensors_type=None, start=None, end=None):
         """
         Get all values for a sensor
 
         # Arguments
 
         - gaz_sensors_type (str): gaz sensor type, None for all
-        - scale (bool): scale values
+        - start (float or None): first timestamp (included), see `GazSensorClass.get_all_values`
+        - end (float or None): last timestamp (excluded)
 
         # Returns
 
-        - pandas.DataFrame or dict: values
+        - numpy.ndarray of dtype SAMPLE_DTYPE or dict: values
         """
 
         if gaz_sensors_type is None:
-            return {gaz_sensors_type: sensor.get_all_values() for gaz_sensors_type, sensor in self.sensors.items()}
+            return {gaz_sensors_type: sensor.get_all_values(start, end) for gaz_sensors_type, sensor in self.sensors.items()}
 
         if gaz_sensors_type not in self.sensors:
             raise ValueError(f"Sensor does not have {gaz_sensors_type}")
 
-        return self.sensors[gaz_sensors_type].get_all_values()
+        return self.sensors[gaz_sensors_type].get_all_values(start, end)
     
+    def get_values(self, gaz_sensors_type, start_time=None, end_time=None, columns=None, max_points=None, downsampling="lttb"):
+        """
+        Get the values of a time range for a gas sensor, optionally downsampled (see `GazSensorClass.get_values`)
+
+        # Arguments
+
+        - gaz_sensors_type (str): gaz sensor type
+        - start_time (float or None): first timestamp (included)
+        - end_time (float or None): last timestamp (excluded)
+        - columns (list or None): columns of the values (the time is always included)
+        - max_points (int or None): maximum number of returned values
+        - downsampling (str): "lttb" or "minmax"
+
+        # Returns
+
+        - numpy.ndarray: values
+        """
+
+        if gaz_sensors_type not in self.sensors:
+            raise ValueError(f"Sensor does not have {gaz_sensors_type}")
+
+        return self.sensors[gaz_sensors_type].get_values(start_time, end_time, columns, max_points, downsampling)
+
+    def get_rollup(self, gaz_sensors_type, resolution, start_time=None, end_time=None):
+        if gaz_sensors_type not in self.sensors:
+            raise ValueError(f"Sensor does not have {gaz_sensors_type}")
+
+        return self.sensors[gaz_sensors_type].get_rollup(resolution, start_time, end_time)
+
+    def get_statistics(self, gaz_sensors_type, column, start_time=None, end_time=None):
+        if gaz_sensors_type not in self.sensors:
+            raise ValueError(f"Sensor does not have {gaz_sensors_type}")
+
+        return self.sensors[gaz_sensors_type].get_statistics(column, start_time, end_time)
+
     def get_current_index(self, gaz_sensors_type):
         if gaz_sensors_type not in self.sensors:
             raise ValueError(f"Sensor does not have {gaz_sensors_type}")
@@ -472,6 +1177,18 @@ class SensorClass:
 
         return self.sensors[gaz_sensors_type].get_excitement_index()
 
+    def get_latest_time(self, gaz_sensors_type):
+        if gaz_sensors_type not in self.sensors:
+            raise ValueError(f"Sensor does not have {gaz_sensors_type}")
+
+        return self.sensors[gaz_sensors_type].get_latest_time()
+
+    def get_first_index(self, gaz_sensors_type, timestamp):
+        if gaz_sensors_type not in self.sensors:
+            raise ValueError(f"Sensor does not have {gaz_sensors_type}")
+
+        return self.sensors[gaz_sensors_type].get_first_index(timestamp)
+
     def get_gradient(self, gaz_sensors_type):
         if gaz_sensors_type not in self.sensors:
             raise ValueError(f"Sensor does not have {gaz_sensors_type}")
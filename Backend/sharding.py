@@ -0,0 +1,463 @@
+# - Libraries
+
+# - - Files
+import os
+# - - Processes
+import multiprocessing
+from multiprocessing import shared_memory
+# - - Threading
+import threading
+# - - Mathematical
+import numpy
+# - - Logging
+import logging
+import traceback
+
+from buffer import RingBufferClass
+
+import metrics
+
+from sensor import SensorClass, GazSensorClass, SAMPLE_DTYPE
+
+# Scalar state of a gas sensor published by its worker, stored before the values in the shared memory block
+STATE_DTYPE = numpy.dtype([
+    ("start", numpy.int64),
+    ("end", numpy.int64),
+    ("total", numpy.int64),
+    ("index", numpy.int64),
+    ("excited", numpy.int64),
+    ("excitement_index", numpy.int64),
+    ("rejected", numpy.int64),
+    ("latest_time", numpy.float64)])
+
+STATE_SIZE = 64 # Bytes reserved for the state, so that the values are aligned
+
+def get_memory_size(capacity):
+    return STATE_SIZE + 2 * capacity * SAMPLE_DTYPE.itemsize
+
+class SharedRingBufferClass(RingBufferClass):
+    def __init__(self, dtype, capacity, buffer, evict=None):
+        """
+        Ring buffer (see `RingBufferClass`) stored in a shared memory block, with its positions, so that the
+        process writing the rows and the processes reading them see the same buffer without any copy
+
+        # Arguments
+
+        - dtype (numpy.dtype): structured dtype of a row
+        - capacity (int): maximum number of retained rows
+        - buffer (memoryview): shared memory of at least `get_memory_size(capacity)` bytes, zeroed for a new buffer
+        - evict (function or None): called with the rows about to be dropped
+
+        # Returns
+
+        - SharedRingBufferClass: ring buffer on the shared memory
+        """
+
+        if capacity < 1:
+            raise ValueError(f"Capacity must be positive, got {capacity}")
+
+        self.capacity = capacity
+
+        self.state = numpy.ndarray((), dtype=STATE_DTYPE, buffer=buffer)
+        self.data = numpy.ndarray(2 * capacity, dtype=dtype, buffer=buffer, offset=STATE_SIZE)
+
+        self.evict = evict
+
+    @property
+    def start(self):
+        return int(self.state["start"])
+
+    @start.setter
+    def start(self, value):
+        self.state["start"] = value
+
+    @property
+    def end(self):
+        return int(self.state["end"])
+
+    @end.setter
+    def end(self, value):
+        self.state["end"] = value
+
+    @property
+    def total(self):
+        return int(self.state["total"])
+
+    @total.setter
+    def total(self, value):
+        self.state["total"] = value
+
+def publish(gaz_sensor):
+    """
+    Publish the scalar state of a gas sensor of a worker to its shared memory block
+
+    # Arguments
+
+    - gaz_sensor (GazSensorClass): gas sensor with a `SharedRingBufferClass`
+    """
+
+    state = gaz_sensor.data.state
+
+    state["index"] = gaz_sensor.index
+    state["excited"] = gaz_sensor.excitement_index is not None
+    state["excitement_index"] = gaz_sensor.excitement_index if gaz_sensor.excitement_index is not None else 0
+    state["rejected"] = gaz_sensor.rejected
+    state["latest_time"] = gaz_sensor.latest_time if gaz_sensor.latest_time is not None else numpy.nan
+
+def run_shard(connection, sensors_configuration, memories, archive):
+    """
+    Worker process owning a shard of the sensors: it updates them with the batches received from the main process
+    and answers the queries which can not be served from the shared memory
+
+    # Arguments
+
+    - connection (multiprocessing.connection.Connection): connection with the main process
+    - sensors_configuration (dict): configuration of the sensors of the shard by identifier
+    - memories (dict): name of the shared memory block by (sensor identifier, gaz sensor type)
+    - archive (str or None): directory of the sensors archives
+    """
+
+    sensors = {}
+    blocks = []
+
+    for sensor_identifier, sensor_configuration in sensors_configuration.items():
+        sensor = SensorClass(sensor_configuration, os.path.join(archive, sensor_identifier) if archive is not None else None)
+
+        # The values are written directly to the shared memory, the archive still receives the evicted ones
+        for name, gaz_sensor in sensor.sensors.items():
+            block = shared_memory.SharedMemory(memories[(sensor_identifier, name)])
+            blocks.append(block)
+
+            gaz_sensor.data = SharedRingBufferClass(SAMPLE_DTYPE, gaz_sensor.data.capacity, block.buf, gaz_sensor.data.evict)
+
+        sensors[sensor_identifier] = sensor
+
+    while True:
+        request = connection.recv()
+
+        if request[0] == "update":
+            updated = []
+            errors = []
+
+            for (sensor_identifier, name), (values, timestamps) in request[1].items():
+                gaz_sensor = sensors[sensor_identifier].sensors[name]
+
+                try:
+                    gaz_sensor.update_many(values, timestamps)
+                except Exception as e:
+                    errors.append(f"An error occured while updating the sensor {sensor_identifier} : {e}")
+                    traceback.print_exc()
+
+                publish(gaz_sensor)
+                updated.append((sensor_identifier, name))
+
+            connection.send(("ok", (updated, errors)))
+        elif request[0] == "call":
+            _, (sensor_identifier, name), method, arguments = request
+
+            try:
+                connection.send(("ok", getattr(sensors[sensor_identifier].sensors[name], method)(*arguments)))
+            except Exception as e:
+                connection.send(("error", f"{type(e).__name__}: {e}"))
+        elif request[0] == "stop":
+            for sensor in sensors.values():
+                sensor.close()
+
+            connection.send(("ok", None))
+            break
+
+    connection.close()
+
+class SharedGazSensorClass(GazSensorClass):
+    def __init__(self, shards, key, capacity, buffer, archive):
+        """
+        Gas sensor of the main process reading the values of a gas sensor updated by a worker (see `ShardsClass`)
+
+        The values kept in memory and the scalar state are read from the shared memory without copy, the archived
+        values and the rollups are requested to the worker.
+
+        # Arguments
+
+        - shards (ShardsClass): shards updating the gas sensor
+        - key (tuple): (sensor identifier, gaz sensor type)
+        - capacity (int): maximum number of values kept in memory
+        - buffer (memoryview): shared memory block of the gas sensor
+        - archive (bool): whether the worker archives the values dropped from memory
+
+        # Returns
+
+        - SharedGazSensorClass: the gas sensor
+        """
+
+        self.shards = shards
+        self.key = key
+
+        self.data = SharedRingBufferClass(SAMPLE_DTYPE, capacity, buffer)
+        self.state = self.data.state
+        self.state["latest_time"] = numpy.nan   # No values yet
+
+        # The archive is only written and read by the worker
+        self.archive = None
+        self.archived = archive
+
+        self.listeners = []
+
+    def update_many(self, values, timestamps):
+        raise ValueError(f"Sensor {self.key[0]} {self.key[1]} is updated by its worker, use `ShardsClass.update_many`")
+
+    def get_current_index(self):
+        return int(self.state["index"])
+
+    def get_latest_time(self):
+        latest_time = float(self.state["latest_time"])
+
+        return None if numpy.isnan(latest_time) else latest_time
+
+    def get_rejected(self):
+        return int(self.state["rejected"])
+
+    def get_excitement_index(self):
+        if not self.state["excited"]:
+            return None
+
+        return max(0, int(self.state["excitement_index"]) - self.data.get_dropped())
+
+    def is_archived(self, start_time):
+        """
+        Check if values older than the memory may be requested
+
+        # Arguments
+
+        - start_time (float or None): first timestamp of the range, None from the beginning
+
+        # Returns
+
+        - bool: True if the worker archive must be read
+        """
+
+        if not self.archived:
+            return False
+
+        data = self.data.view()
+
+        return data.shape[0] == 0 or start_time is None or start_time < data["time"][0]
+
+    def get_all_values(self, start=None, end=None):
+        if (start is not None or end is not None) and self.is_archived(start):
+            return self.shards.call(self.key, "get_all_values", start, end)
+
+        return super().get_all_values(start, end)
+
+    def get_values(self, start_time=None, end_time=None, columns=None, max_points=None, downsampling="lttb"):
+        if self.is_archived(start_time):
+            return self.shards.call(self.key, "get_values", start_time, end_time, columns, max_points, downsampling)
+
+        return super().get_values(start_time, end_time, columns, max_points, downsampling)
+
+    def get_rollup(self, resolution, start_time=None, end_time=None):
+        return self.shards.call(self.key, "get_rollup", resolution, start_time, end_time)
+
+    def get_statistics(self, column, start_time=None, end_time=None):
+        return self.shards.call(self.key, "get_statistics", column, start_time, end_time)
+
+    def close(self):
+        # The worker spills the values to the archive when the shards stop
+        pass
+
+class SharedSensorClass(SensorClass):
+    def __init__(self, configuration, sensors):
+        """
+        Sensor of the main process whose gas sensors are updated by a worker
+
+        # Arguments
+
+        - configuration (SensorConfigurationClass): sensor configuration
+        - sensors (dict): SharedGazSensorClass by gaz sensor type
+
+        # Returns
+
+        - SharedSensorClass: the sensor
+        """
+
+        self.configuration = configuration
+        self.sensors = sensors
+
+class ShardsClass:
+    def __init__(self, sensors_configuration, workers=None, archive=None):
+        """
+        Shard the sensors across worker processes, so that the filtering of many sensor boards uses several cores
+
+        Each worker owns the sensor boards of its shard and writes their values to shared memory blocks created by
+        the main process. `update_many` sends each shard its part of a batch and waits for all the workers, which
+        update their sensors in parallel, then the listeners of the updated gas sensors are notified in the main
+        process. The main process reads the values without copy through `sensors`, so, as with `SensorClass`,
+        a view on the values is valid until the next update.
+
+        # Arguments
+
+        - sensors_configuration (dict): sensors configuration by identifier
+        - workers (int or None): number of worker processes, None for one per core (at most one per sensor board)
+        - archive (str or None): directory of the sensors archives (one sub-directory per sensor), written by the workers
+
+        # Returns
+
+        - ShardsClass: the shards, with the workers started
+        """
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if workers < 1:
+            raise ValueError(f"Number of workers must be positive, got {workers}")
+
+        identifiers = sorted(sensors_configuration.keys())
+        workers = max(1, min(workers, len(identifiers)))
+
+        # Sensor boards are assigned to the shards in turn
+        self.shard = {sensor_identifier: i % workers for i, sensor_identifier in enumerate(identifiers)}
+
+        self.memories = {}
+        self.sensors = {}
+
+        for sensor_identifier in identifiers:
+            sensor_configuration = sensors_configuration[sensor_identifier]
+
+            gaz_sensors = {}
+
+            for name in sensor_configuration.sensors.keys():
+                memory = shared_memory.SharedMemory(create=True, size=get_memory_size(sensor_configuration.maximum_values))
+                self.memories[(sensor_identifier, name)] = memory
+
+                gaz_sensors[name] = SharedGazSensorClass(self, (sensor_identifier, name), sensor_configuration.maximum_values, memory.buf, archive is not None)
+
+            self.sensors[sensor_identifier] = SharedSensorClass(sensor_configuration, gaz_sensors)
+
+        self.connections = []
+        self.locks = []     # A request and its answer must not be interleaved with another one
+        self.processes = []
+
+        for i in range(workers):
+            shard = [sensor_identifier for sensor_identifier in identifiers if self.shard[sensor_identifier] == i]
+
+            connection, worker_connection = multiprocessing.Pipe()
+
+            process = multiprocessing.Process(target=run_shard, name=f"Shard {i}", daemon=True, args=(
+                worker_connection,
+                {sensor_identifier: sensors_configuration[sensor_identifier] for sensor_identifier in shard},
+                {key: memory.name for key, memory in self.memories.items() if key[0] in shard},
+                archive))
+            process.start()
+
+            worker_connection.close()
+
+            self.connections.append(connection)
+            self.locks.append(threading.Lock())
+            self.processes.append(process)
+
+        self.update_latency = metrics.REGISTRY.histogram("gaz_stage_latency_seconds", "Latency of the processing stages", stage="shard_update")
+        self.call_latency = metrics.REGISTRY.histogram("gaz_stage_latency_seconds", "Latency of the processing stages", stage="shard_call")
+
+        logging.info(f"{len(identifiers)} sensors sharded across {workers} workers")
+
+    def receive(self, shard):
+        status, result = self.connections[shard].recv()
+
+        if status == "error":
+            raise ValueError(f"Shard {shard} : {result}")
+
+        return result
+
+    def update_many(self, samples):
+        """
+        Update the sensors with a batch of samples, the shards are updated in parallel
+
+        # Arguments
+
+        - samples (dict): (values, timestamps) arrays per (sensor identifier, gaz sensor type), timestamps relative to the first timestamp
+        """
+
+        batches = {}
+
+        for (sensor_identifier, name), values in samples.items():
+            if sensor_identifier not in self.shard:
+                logging.warning(f"Sensor {sensor_identifier} not in `sensors` dictionary.")
+                continue
+
+            batches.setdefault(self.shard[sensor_identifier], {})[(sensor_identifier, name)] = values
+
+        shards = sorted(batches.keys())
+
+        for shard in shards:
+            self.locks[shard].acquire()
+
+        try:
+            with self.update_latency.time():
+                for shard in shards:
+                    self.connections[shard].send(("update", batches[shard]))
+
+                updated = []
+
+                for shard in shards:
+                    keys, errors = self.receive(shard)
+                    updated.extend(keys)
+
+                    for error in errors:
+                        logging.error(error)
+        finally:
+            for shard in shards:
+                self.locks[shard].release()
+
+        # The listeners run in the main process once the values are in the shared memory
+        for sensor_identifier, name in updated:
+            gaz_sensor = self.sensors[sensor_identifier].sensors[name]
+
+            for listener in gaz_sensor.listeners:
+                listener(gaz_sensor)
+
+    def call(self, key, method, *arguments):
+        """
+        Call a method of a gas sensor in its worker
+
+        # Arguments
+
+        - key (tuple): (sensor identifier, gaz sensor type)
+        - method (str): name of the `GazSensorClass` method
+        - arguments: arguments of the method
+
+        # Returns
+
+        - result of the method (copied from the worker)
+        """
+
+        shard = self.shard[key[0]]
+
+        with self.locks[shard], self.call_latency.time():
+            self.connections[shard].send(("call", key, method, arguments))
+
+            return self.receive(shard)
+
+    def stop(self):
+        """
+        Stop the workers (the values kept in memory are spilled to the archives) and free the shared memory
+        """
+
+        for shard, connection in enumerate(self.connections):
+            with self.locks[shard]:
+                try:
+                    connection.send(("stop",))
+                    self.receive(shard)
+                except (EOFError, OSError) as e:
+                    logging.error(f"Shard {shard} stopped unexpectedly : {e}")
+
+        for process in self.processes:
+            process.join()
+
+        for connection in self.connections:
+            connection.close()
+
+        self.connections = []
+        self.processes = []
+
+        # The views of the main process may still use the blocks, they are unmapped when the process exits
+        for memory in self.memories.values():
+            memory.unlink()
@@ -0,0 +1,131 @@
+import numpy
+
+def diffuse(C, D, dt, dx, dy):
+    """
+    Diffuse the gas in the area using the Fick's second law of diffusion (finite differences)
+
+    # Arguments
+
+    - C (numpy.ndarray): concentration matrix of the gas in the area, updated in place
+    - D (float): diffusion coefficient of the gas in the medium
+    - dt (float): time step of the simulation in seconds
+    - dx (float): distance between two points in the x direction in meters
+    - dy (float): distance between two points in the y direction in meters
+
+    # Returns
+
+    - numpy.ndarray: the concentration matrix (not a copy)
+    """
+
+    # Laplacian of C
+    d2C_dx2 = (numpy.roll(C, 1, axis=0) - 2 * C + numpy.roll(C, -1, axis=0)) / dx**2
+    d2C_dy2 = (numpy.roll(C, 1, axis=1) - 2 * C + numpy.roll(C, -1, axis=1)) / dy**2
+
+    # Time integration
+    C += dt * D * (d2C_dx2 + d2C_dy2)
+
+    # Boundary conditions (open area)
+    C[0, :] = 0
+    C[-1, :] = 0
+    C[:, 0] = 0
+    C[:, -1] = 0
+
+    return C
+
+def get_courant_friedrichs_lewy_coefficient(D, dt, dx, dy):
+    return ((D * dt) / (dx**2)) + ((D * dt) / (dy**2))
+
+class FickDiffusionClass:
+    def __init__(self, size=(20, 20), points=(100, 100), source_rate=10, source_position=(5, 10), dt=0.1, D=1):
+        """
+        Discrete simulation of a gas continuously released from a source and diffusing in an open area
+        (port of the simulation notebook `Simulation/Simulation.ipynb`)
+
+        # Arguments
+
+        - size (tuple): size of the area in meters (x, y)
+        - points (tuple): number of points of the grid in each dimension
+        - source_rate (float): gas released by the source per second
+        - source_position (tuple): position of the source in meters
+        - dt (float): time step of the simulation in seconds
+        - D (float): diffusion coefficient of the gas in the medium in m^2/s
+
+        # Returns
+
+        - FickDiffusionClass: the simulation
+        """
+
+        self.size = size
+        self.points = points
+
+        # Grid spacing
+        self.dx = size[0] / points[0]
+        self.dy = size[1] / points[1]
+
+        self.dt = dt
+
+        # As in the notebook, the diffusion coefficient is scaled by the time step
+        self.D = D * dt
+
+        courant_friedrichs_lewy = get_courant_friedrichs_lewy_coefficient(self.D, self.dt, self.dx, self.dy)
+
+        if courant_friedrichs_lewy > 0.5:
+            raise ValueError(f"Courant-Friedrichs-Lewy condition not met ({courant_friedrichs_lewy} > 0.5), please reduce the time step or increase the grid resolution")
+
+        self.source_rate = source_rate * dt
+        self.source_coordinates = self.get_grid_coordinates(numpy.array(source_position, dtype=float))
+
+    def get_grid_coordinates(self, real_coordinates):
+        """
+        Convert real-world coordinates to grid coordinates
+
+        # Arguments
+
+        - real_coordinates (numpy.ndarray of shape (2,) or (n, 2)): real-world coordinates in meters
+
+        # Returns
+
+        - numpy.ndarray: grid coordinates, with the same shape
+        """
+
+        coordinates = numpy.zeros_like(real_coordinates, dtype=int)
+        coordinates[..., 0] = real_coordinates[..., 0] // self.dx
+        coordinates[..., 1] = real_coordinates[..., 1] // self.dy
+
+        return coordinates
+
+    def simulate(self, final_time, sensors_coordinates, source_start=0, source_end=None):
+        """
+        Simulate the diffusion and sample the concentration at the positions of pseudo-sensors
+
+        # Arguments
+
+        - final_time (float): duration of the simulation in seconds
+        - sensors_coordinates (numpy.ndarray of shape (n, 2)): real-world coordinates of the pseudo-sensors
+        - source_start (float): time at which the source starts releasing gas
+        - source_end (float or None): time at which the source stops releasing gas, None until the end
+
+        # Returns
+
+        - (numpy.ndarray of shape (m,), numpy.ndarray of shape (n, m)): times (s) and concentrations of each pseudo-sensor
+        """
+
+        if source_end is None:
+            source_end = final_time
+
+        times = numpy.arange(0, final_time, self.dt)
+
+        grid_coordinates = self.get_grid_coordinates(numpy.asarray(sensors_coordinates, dtype=float))
+
+        C = numpy.zeros(self.points)
+        values = numpy.zeros((grid_coordinates.shape[0], times.shape[0]))
+
+        for i, t in enumerate(times):
+            if source_start <= t <= source_end:
+                C[self.source_coordinates[0], self.source_coordinates[1]] += self.source_rate * self.dt
+
+            diffuse(C, self.D, self.dt, self.dx, self.dy)
+
+            values[:, i] = C[grid_coordinates[:, 0], grid_coordinates[:, 1]]
+
+        return times, values
@@ -0,0 +1,38 @@
+import types
+
+import numpy
+
+from benchmark import get_sensors
+from calibration import CalibrationClass
+
+def test_window_history():
+    sensors = get_sensors(2, 100000)
+    generator = numpy.random.default_rng(0)
+
+    calibration = CalibrationClass(types.SimpleNamespace(enable=False, duration=60, tolerance=None))
+    calibration.attach(sensors)
+
+    timestamps = numpy.arange(20000) * 100.0
+
+    for sensor in sensors.values():
+        values = 0.3 + 0.005 * generator.standard_normal(timestamps.shape[0])
+
+        for i in range(0, timestamps.shape[0], 500):
+            sensor.update_many("MQ3", values[i:i + 500], timestamps[i:i + 500])
+
+    # The last 600 s (bucket-aligned) are read from the rollups
+    window = calibration.start_window(60, 0.01, sensors, history=600)
+
+    estimates = window.get_estimates()
+
+    assert set(estimates) == {(name, "MQ3") for name in sensors}
+
+    for (name, sensor_type), estimate in estimates.items():
+        values = sensors[name].get_all_values(sensor_type)
+        resistance = values["resistance"][values["time"] >= timestamps[-1] - 599900]
+
+        assert estimate["count"] == resistance.shape[0]
+        assert numpy.isclose(estimate["R_0"], resistance.mean())
+        assert numpy.isclose(estimate["relative_std"], resistance.std(ddof=1) / resistance.mean())
+
+    assert window.is_stable()
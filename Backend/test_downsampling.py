@@ -0,0 +1,22 @@
+import numpy
+
+from downsampling import get_minmax_indexes
+
+def test_minmax_indexes_bound():
+    generator = numpy.random.default_rng(0)
+
+    # The numbers of samples are not multiples of the numbers of buckets
+    for n, buckets in [(1999, 500), (2001, 1000), (1003, 7), (10007, 500)]:
+        y = generator.normal(size=n)
+
+        indexes = get_minmax_indexes(y, buckets)
+
+        assert len(indexes) <= 2 * buckets
+        assert numpy.all(numpy.diff(indexes) > 0)
+
+        # The peaks stay visible
+        assert y[indexes].min() == y.min()
+        assert y[indexes].max() == y.max()
+
+def test_minmax_indexes_short():
+    assert numpy.array_equal(get_minmax_indexes(numpy.zeros(10), 5), numpy.arange(10))
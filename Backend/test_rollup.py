@@ -0,0 +1,45 @@
+import numpy
+
+from rollup import RollupClass
+
+def get_rollup(count, period, capacity=3600, block=1000):
+    generator = numpy.random.default_rng(0)
+
+    rows = numpy.zeros(count, dtype=[("time", numpy.float64), ("value", numpy.float64)])
+    rows["time"] = 12345 + numpy.arange(count) * period
+    rows["value"] = generator.normal(size=count)
+
+    rollup = RollupClass(["value"], capacity=capacity)
+
+    for i in range(0, count, block):
+        rollup.update(rows[i:i + block])
+
+    return rollup, rows
+
+def test_statistics_full_range_after_eviction():
+    # The finest levels dropped the oldest samples
+    for count, period, capacity in [(200000, 100, 3600), (50000, 250, 100)]:
+        rollup, rows = get_rollup(count, period, capacity)
+
+        expected = rollup.get_statistics("value")
+        statistics = rollup.get_statistics("value", rows["time"][0] - 1, rows["time"][-1] + 1)
+
+        assert expected["count"] == count
+        assert statistics["count"] == count
+        assert numpy.isclose(statistics["mean"], rows["value"].mean())
+        assert numpy.isclose(statistics["std"], rows["value"].std(ddof=1))
+        assert statistics["min"] == rows["value"].min()
+        assert statistics["max"] == rows["value"].max()
+
+def test_statistics_range():
+    rollup, rows = get_rollup(20000, 100)
+
+    # Bucket-aligned range held by the finest level
+    start, end = 74000, 1532000
+    values = rows["value"][(rows["time"] >= start) & (rows["time"] < end)]
+
+    statistics = rollup.get_statistics("value", start, end)
+
+    assert statistics["count"] == values.shape[0]
+    assert numpy.isclose(statistics["mean"], values.mean())
+    assert numpy.isclose(statistics["std"], values.std(ddof=1))